@@ -0,0 +1,103 @@
+import hashlib
+import json
+from importlib import metadata
+from pathlib import Path
+
+import pandas as pd
+from natsort import natsorted
+
+MANIFEST_FILENAME = "manifest.json"
+HASH_CHUNK_SIZE = 2**20  # 1 MiB
+
+
+def hash_file(filepath, algorithm="sha256", chunk_size=HASH_CHUNK_SIZE):
+    """Compute the hex digest of a file's contents in chunks."""
+    digest = hashlib.new(algorithm)
+    with Path(filepath).open("rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_trajectory_input(trajectory_filepath):
+    """Compute a content hash of a CSV file of cell trajectories or a well of a trajectory store."""
+    trajectory_filepath = Path(trajectory_filepath)
+    if not trajectory_filepath.is_dir():
+        return hash_file(trajectory_filepath)
+
+    # combine the hashes of each array in the trajectory store
+    digest = hashlib.sha256()
+    for filepath in sorted(trajectory_filepath.glob("*.npy")):
+        digest.update(f"{filepath.name}:{hash_file(filepath)}".encode())
+    return digest.hexdigest()
+
+
+def get_code_version(source_filepaths, engine):
+    """Identify the version of the code used to compute motility metrics.
+
+    The version combines a hash of the given source files with the installed version of
+    `swimtracker` (if it is the engine), such that any change to the code invalidates the cache.
+    """
+    digest = hashlib.sha256()
+    for filepath in source_filepaths:
+        digest.update(Path(filepath).read_bytes())
+    if engine == "swimtracker":
+        try:
+            digest.update(metadata.version("swimtracker").encode())
+        except metadata.PackageNotFoundError:
+            pass
+    return f"{engine}-{digest.hexdigest()[:16]}"
+
+
+class MetricsCache:
+    """Cache of unfiltered per-well motility metrics with a manifest of the inputs of each well.
+
+    The manifest maps each well to a fingerprint of everything its motility metrics depend on:
+    the content hash of its cell trajectories, its experimental parameters, the acquisition
+    parameters, and the code version. Cached metrics are reused only while the fingerprint of a
+    well is unchanged.
+
+    Parameters
+    ----------
+    cache_directory : `pathlib.Path`
+        Directory of the manifest and cached metrics. Created if it does not exist.
+    """
+
+    def __init__(self, cache_directory):
+        self.directory = Path(cache_directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.manifest_filepath = self.directory / MANIFEST_FILENAME
+        if self.manifest_filepath.exists():
+            self.manifest = json.loads(self.manifest_filepath.read_text())
+        else:
+            self.manifest = {}
+
+    def metrics_filepath(self, well_name):
+        """File path to the cached metrics of a well."""
+        return self.directory / f"{well_name}.parquet"
+
+    def is_current(self, well_name, fingerprint):
+        """Whether the cached metrics of a well were computed from the same inputs."""
+        return (
+            self.manifest.get(well_name) == fingerprint
+            and self.metrics_filepath(well_name).exists()
+        )
+
+    def load(self, well_name):
+        """Load the cached metrics of a well."""
+        return pd.read_parquet(self.metrics_filepath(well_name))
+
+    def save(self, well_name, dataframe, fingerprint):
+        """Cache the metrics of a well and record its fingerprint in the manifest."""
+        dataframe.to_parquet(self.metrics_filepath(well_name), index=False)
+        self.manifest[well_name] = fingerprint
+
+    def write_manifest(self):
+        """Write the manifest to disk."""
+        self.manifest_filepath.write_text(json.dumps(self.manifest, indent=4, sort_keys=True))
+
+    def iter_metrics(self):
+        """Yield the cached metrics of every well recorded in the manifest."""
+        for well_name in natsorted(self.manifest):
+            if self.metrics_filepath(well_name).exists():
+                yield self.load(well_name)
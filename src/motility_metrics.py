@@ -0,0 +1,416 @@
+import numpy as np
+import pandas as pd
+from scipy import fft
+
+SUMMARY_STATISTICS_COLUMNS = [
+    "cell_id",
+    "total_time",
+    "total_distance",
+    "net_distance",
+    "max_sprint_length",
+    "confinement_ratio",
+    "mean_curvilinear_speed",
+    "mean_linear_speed",
+    "mean_angular_speed",
+    "num_rotations",
+    "num_direction_changes",
+    "pivot_rate",
+]
+# metrics of `swimtracker` that depend on the turning of a cell, which the vectorized metrics do
+# not reproduce exactly (see `compute_summary_statistics`)
+TURNING_COLUMNS = [
+    "max_sprint_length",
+    "mean_angular_speed",
+    "num_rotations",
+    "num_direction_changes",
+    "pivot_rate",
+]
+VECTORIZED_COLUMNS = [
+    column for column in SUMMARY_STATISTICS_COLUMNS if column not in TURNING_COLUMNS
+]
+MORPHOLOGY_COLUMNS = [
+    "area",
+    "eccentricity",
+    "major_axis_length",
+    "minor_axis_length",
+    "perimeter",
+    "solidity",
+]
+MORPHOLOGY_STATISTICS = ["mean", "median", "iqr", "variance"]
+LAG_STATISTICS_COLUMNS = [
+    "lag",
+    "lag_time",
+    "num_tracks",
+    "num_displacements",
+    "sum_squared_displacement",
+    "msd",
+    "num_velocity_pairs",
+    "sum_velocity_product",
+    "vacf",
+]
+# maximum number of (padded) positions of the trajectories transformed at once
+LAG_STATISTICS_BATCH_SIZE = 2**20
+
+
+def compute_summary_statistics(track_ids, t, x, y, framerate, pixelsize):
+    """Compute summary motility metrics for every cell trajectory in a well in a single pass.
+
+    Vectorized counterpart to `swimtracker`'s `TrajectoryCSVParser.compute_summary_statistics`
+    for the distance-, time-, and speed-based metrics, which it reproduces exactly. Rather than
+    looping over trajectories, the coordinates of all trajectories are kept in flat arrays and
+    each metric is computed from frame-to-frame differences that are masked at trajectory
+    boundaries and then reduced per trajectory (with `ufunc.reduceat`).
+
+    The turning-based metrics of `swimtracker` (`TURNING_COLUMNS`) are not computed, as they
+    cannot be reproduced exactly; they are only available from `swimtracker` itself.
+
+    Parameters
+    ----------
+    track_ids, t, x, y : (N,) array-like
+        Track ID, frame number, and x, y coordinates (in pixels) of every tracked position in the
+        well, sorted by track ID and then by frame number.
+    framerate, pixelsize : float
+        Acquisition frame rate (in frames per second) and pixel size (in microns per pixel).
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Summary motility metrics with one row per trajectory and the columns
+        `VECTORIZED_COLUMNS`. Metrics are defined as follows:
+        - total_time: duration of the trajectory (s).
+        - total_distance: curvilinear distance traversed (µm).
+        - net_distance: distance between the first and last position (µm).
+        - confinement_ratio: net distance / total distance.
+        - mean_curvilinear_speed: total distance / total time (µm/s).
+        - mean_linear_speed: net distance / total time (µm/s).
+    """
+    track_ids = np.asarray(track_ids)
+    t = np.asarray(t, dtype=float)
+    x = np.asarray(x, dtype=float) * pixelsize
+    y = np.asarray(y, dtype=float) * pixelsize
+
+    # index each position by the trajectory it belongs to
+    is_track_start = np.ones(track_ids.size, dtype=bool)
+    is_track_start[1:] = track_ids[1:] != track_ids[:-1]
+    track_starts = np.flatnonzero(is_track_start)
+    track_ends = np.append(track_starts[1:], track_ids.size) - 1
+    track_index = np.cumsum(is_track_start) - 1
+    num_tracks = track_starts.size
+
+    # duration, curvilinear distance, and net distance
+    total_time = (t[track_ends] - t[track_starts]) / framerate
+    step_lengths, step_track_index = _masked_differences(x, y, track_index, lag=1)
+    total_distance = _reduce_segments(np.add, step_lengths, step_track_index, num_tracks, 0.0)
+    net_distance = np.hypot(x[track_ends] - x[track_starts], y[track_ends] - y[track_starts])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dataframe = pd.DataFrame(
+            {
+                "cell_id": track_ids[track_starts],
+                "total_time": total_time,
+                "total_distance": total_distance,
+                "net_distance": net_distance,
+                "confinement_ratio": net_distance / total_distance,
+                "mean_curvilinear_speed": total_distance / total_time,
+                "mean_linear_speed": net_distance / total_time,
+            },
+            columns=VECTORIZED_COLUMNS,
+        )
+
+    return dataframe
+
+
+def compute_morphology_summaries(track_ids, morphology):
+    """Summarize the segmentation morphology of every cell trajectory in a well in a single pass.
+
+    Like `compute_summary_statistics`, all trajectories are reduced at once from flat arrays:
+    means and variances with `ufunc.reduceat`, and medians and interquartile ranges by sorting the
+    values within each trajectory (with a single sort over all trajectories) and interpolating
+    between the order statistics, as `np.percentile` does.
+
+    Parameters
+    ----------
+    track_ids : (N,) array-like
+        Track ID of every tracked position in the well, sorted by track ID (and then by frame).
+    morphology : dict
+        Mapping of each morphology column (e.g. those in `MORPHOLOGY_COLUMNS`) to an (N,) array of
+        its values at every tracked position.
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Morphology summaries with one row per trajectory, in the same order as the rows of
+        `compute_summary_statistics`, and the columns `<column>_<statistic>` for each statistic in
+        `MORPHOLOGY_STATISTICS`:
+        - mean: mean over the frames of the trajectory.
+        - median: median over the frames of the trajectory.
+        - iqr: interquartile range over the frames of the trajectory.
+        - variance: (sample) variance over the frames of the trajectory, i.e. how much the
+          morphology fluctuates over time; NaN for trajectories of a single frame.
+    """
+    track_ids = np.asarray(track_ids)
+    is_track_start = np.ones(track_ids.size, dtype=bool)
+    is_track_start[1:] = track_ids[1:] != track_ids[:-1]
+    track_starts = np.flatnonzero(is_track_start)
+    track_lengths = np.diff(np.append(track_starts, track_ids.size))
+    track_index = np.cumsum(is_track_start) - 1
+
+    summaries = {}
+    for column, values in morphology.items():
+        values = np.asarray(values, dtype=float)
+        means = np.add.reduceat(values, track_starts) / track_lengths
+        squared_deviations = (values - means[track_index]) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variances = np.add.reduceat(squared_deviations, track_starts) / (track_lengths - 1)
+
+        # sort values within each trajectory by sorting (trajectory, rank of value) keys, which is
+        # considerably faster than `np.lexsort`
+        order = np.argsort(values)
+        ranks = np.empty(values.size, dtype=np.int64)
+        ranks[order] = np.arange(values.size)
+        keys = np.sort(track_index * values.size + ranks)
+        sorted_values = values[order[keys % values.size]]
+        first_quartiles, medians, third_quartiles = (
+            _segment_quantile(sorted_values, track_starts, track_lengths, quantile)
+            for quantile in (0.25, 0.5, 0.75)
+        )
+
+        summaries[f"{column}_mean"] = means
+        summaries[f"{column}_median"] = medians
+        summaries[f"{column}_iqr"] = third_quartiles - first_quartiles
+        summaries[f"{column}_variance"] = variances
+
+    return pd.DataFrame(summaries)
+
+
+def compute_lag_statistics(
+    track_ids,
+    t,
+    x,
+    y,
+    framerate,
+    pixelsize,
+    max_lag=None,
+    batch_size=LAG_STATISTICS_BATCH_SIZE,
+):
+    """Compute the mean squared displacement and velocity autocorrelation of a well over lags.
+
+    For every trajectory, the sums of the squared displacements and of the products of velocities
+    over all pairs of frames `lag` frames apart are computed with FFTs in O(n log n) rather than
+    O(n^2) time [1]. Trajectories are padded into batches of similar length and transformed
+    together, such that the padded batches hold up to `batch_size` positions. The sums are then
+    pooled over the trajectories of the well into a compact table with one row per lag, from which
+    the curves of any group of wells are obtained by adding up the sums and counts (see
+    `pool_lag_statistics`).
+
+    Lags are counted in rows rather than frame numbers, i.e. the frames of each trajectory are
+    assumed to be consecutive, as for the other motility metrics.
+
+    Parameters
+    ----------
+    track_ids, t, x, y : (N,) array-like
+        Track ID, frame number, and x, y coordinates (in pixels) of every tracked position in the
+        well, sorted by track ID and then by frame number.
+    framerate, pixelsize : float
+        Acquisition frame rate (in frames per second) and pixel size (in microns per pixel).
+    max_lag : int or None
+        Maximum lag (in frames). Defaults to the length of the longest trajectory minus one.
+    batch_size : int
+        Maximum number of padded positions per batch of trajectories.
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Table with one row per lag from 0 to `max_lag` with the columns:
+        - lag: lag (frames).
+        - lag_time: lag (s).
+        - num_tracks: number of trajectories with at least one displacement at the lag.
+        - num_displacements: number of pairs of positions at the lag.
+        - sum_squared_displacement: sum of their squared displacements (µm^2).
+        - msd: mean squared displacement (µm^2).
+        - num_velocity_pairs: number of pairs of velocities at the lag.
+        - sum_velocity_product: sum of the dot products of the pairs of velocities (µm^2/s^2).
+        - vacf: velocity autocorrelation (µm^2/s^2).
+
+    References
+    ----------
+    [1] https://doi.org/10.1051/sfn/201112010
+    """
+    track_ids = np.asarray(track_ids)
+    x = np.asarray(x, dtype=float) * pixelsize
+    y = np.asarray(y, dtype=float) * pixelsize
+
+    is_track_start = np.ones(track_ids.size, dtype=bool)
+    is_track_start[1:] = track_ids[1:] != track_ids[:-1]
+    track_starts = np.flatnonzero(is_track_start)
+    track_lengths = np.diff(np.append(track_starts, track_ids.size))
+    if max_lag is None:
+        max_lag = track_lengths.max(initial=1) - 1
+    num_lags = max_lag + 1
+
+    # sums over trajectories in batches of similar length (longest first) to limit padding
+    sum_squared_displacement = np.zeros(num_lags)
+    sum_velocity_product = np.zeros(num_lags)
+    order = np.argsort(-track_lengths, kind="stable")
+    batch_start = 0
+    while batch_start < order.size:
+        batch_length = track_lengths[order[batch_start]]
+        batch_stop = batch_start + max(1, batch_size // batch_length)
+        batch = order[batch_start:batch_stop]
+        batch_start = batch_stop
+
+        squared_displacements, velocity_products = _track_lag_sums(
+            x, y, track_starts[batch], track_lengths[batch], framerate
+        )
+        num_batch_lags = min(num_lags, batch_length)
+        sum_squared_displacement[:num_batch_lags] += squared_displacements[:num_batch_lags]
+        num_batch_lags = min(num_lags, batch_length - 1)
+        sum_velocity_product[:num_batch_lags] += velocity_products[:num_batch_lags]
+
+    # number of trajectories longer than each lag and number of pairs of positions at each lag,
+    # i.e. the sum of max(n - lag, 0) over trajectories of length n
+    lags = np.arange(num_lags)
+    length_counts = np.bincount(track_lengths, minlength=num_lags + 2)
+    num_tracks_longer = np.cumsum(length_counts[::-1])[::-1][1:]
+    num_pairs = np.cumsum(num_tracks_longer[::-1])[::-1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dataframe = pd.DataFrame(
+            {
+                "lag": lags,
+                "lag_time": lags / framerate,
+                "num_tracks": num_tracks_longer[:num_lags],
+                "num_displacements": num_pairs[:num_lags],
+                "sum_squared_displacement": sum_squared_displacement,
+                "msd": sum_squared_displacement / num_pairs[:num_lags],
+                "num_velocity_pairs": num_pairs[1 : num_lags + 1],
+                "sum_velocity_product": sum_velocity_product,
+                "vacf": sum_velocity_product / num_pairs[1 : num_lags + 1],
+            },
+            columns=LAG_STATISTICS_COLUMNS,
+        )
+
+    return dataframe
+
+
+def pool_lag_statistics(dataframe, groupby_columns):
+    """Pool the lag statistics of wells (see `compute_lag_statistics`) by groups of wells.
+
+    Sums and counts are added up per group and lag before the mean squared displacement and
+    velocity autocorrelation are recomputed, such that every displacement carries equal weight.
+    """
+    sum_columns = [
+        "num_tracks",
+        "num_displacements",
+        "sum_squared_displacement",
+        "num_velocity_pairs",
+        "sum_velocity_product",
+    ]
+    pooled = dataframe.groupby([*groupby_columns, "lag", "lag_time"])[sum_columns].sum()
+    pooled = pooled.reset_index()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pooled["msd"] = pooled["sum_squared_displacement"] / pooled["num_displacements"]
+        pooled["vacf"] = pooled["sum_velocity_product"] / pooled["num_velocity_pairs"]
+    return pooled.loc[:, [*groupby_columns, *LAG_STATISTICS_COLUMNS]]
+
+
+def estimate_cell_count(t):
+    """Estimate the number of cells in a well as the mean number of tracked cells per frame."""
+    _, counts_per_frame = np.unique(t, return_counts=True)
+    return round(counts_per_frame.mean())
+
+
+def _masked_differences(x, y, track_index, lag):
+    """Distance between positions `lag` frames apart, excluding pairs that span two trajectories.
+
+    Returns the distances along with the index of the trajectory that each distance belongs to.
+    """
+    if track_index.size <= lag:
+        return np.empty(0), np.empty(0, dtype=track_index.dtype)
+
+    is_within_track = track_index[lag:] == track_index[:-lag]
+    distances = np.hypot(x[lag:] - x[:-lag], y[lag:] - y[:-lag])
+    return distances[is_within_track], track_index[lag:][is_within_track]
+
+
+def _track_lag_sums(x, y, track_starts, track_lengths, framerate):
+    """Sum the squared displacements and velocity products of a batch of trajectories per lag.
+
+    The trajectories are padded with zeros into a (num_tracks, max_length) array. The sum of the
+    squared displacements at lag m of a trajectory of length n is
+        sum_{k < n - m} |r_{k+m} - r_k|^2 = sum_{k < n - m} |r_k|^2 + sum_{k >= m} |r_k|^2
+                                            - 2 sum_{k < n - m} r_k . r_{k+m}
+    in which the first two terms are differences of cumulative sums and the last term is the
+    autocorrelation of the positions, computed with FFTs (the zero padding keeps pairs that
+    span the end of a trajectory from contributing). Velocity products are the autocorrelation of
+    the velocities.
+    """
+    max_length = track_lengths.max()
+    frames = np.arange(max_length)
+    is_valid = frames < track_lengths[:, np.newaxis]
+    positions = np.where(is_valid, track_starts[:, np.newaxis] + frames, 0)
+
+    velocity_products = np.zeros(max(max_length - 1, 0))
+    squared_norms = np.zeros(is_valid.shape)
+    autocorrelations = np.zeros(is_valid.shape)
+    for coordinates in (x, y):
+        # center each trajectory to limit the round-off error of the FFTs
+        values = np.where(is_valid, coordinates[positions], 0)
+        values -= np.where(is_valid, values.sum(axis=1, keepdims=True) / track_lengths[:, None], 0)
+        squared_norms += values**2
+        autocorrelations += _autocorrelate(values)
+
+        velocities = np.diff(values, axis=1) * framerate
+        velocities[frames[1:] >= track_lengths[:, np.newaxis]] = 0
+        velocity_products += _autocorrelate(velocities).sum(axis=0)
+
+    # sum_{k < n - m} |r_k|^2 + sum_{k >= m} |r_k|^2 from cumulative sums of squared norms
+    cumulative_norms = np.zeros((track_lengths.size, max_length + 1))
+    np.cumsum(squared_norms, axis=1, out=cumulative_norms[:, 1:])
+    num_pairs = np.maximum(track_lengths[:, np.newaxis] - frames, 0)
+    head_sums = np.take_along_axis(cumulative_norms, num_pairs, axis=1)
+    tail_sums = cumulative_norms[:, -1:] - cumulative_norms[:, :-1]
+    squared_displacements = np.where(
+        num_pairs > 0, head_sums + tail_sums - 2 * autocorrelations, 0
+    ).sum(axis=0)
+    # a position is not displaced from itself (rather than up to round-off)
+    squared_displacements[0] = 0
+    return squared_displacements, velocity_products
+
+
+def _segment_quantile(sorted_values, segment_starts, segment_lengths, quantile):
+    """Quantile of each segment of values sorted within segments, interpolated linearly."""
+    positions = quantile * (segment_lengths - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, segment_lengths - 1)
+    fractions = positions - lower
+    lower_values = sorted_values[segment_starts + lower]
+    upper_values = sorted_values[segment_starts + upper]
+    return lower_values + (upper_values - lower_values) * fractions
+
+
+def _autocorrelate(values):
+    """Sum of products of the values `lag` elements apart along the last axis, for every lag."""
+    length = values.shape[-1]
+    if length == 0:
+        return values
+    num_fft = fft.next_fast_len(2 * length, real=True)
+    spectrum = fft.rfft(values, n=num_fft, axis=-1)
+    return fft.irfft(spectrum * spectrum.conj(), n=num_fft, axis=-1)[..., :length]
+
+
+def _reduce_segments(ufunc, values, segment_index, num_segments, empty_value):
+    """Reduce `values` per segment with `ufunc.reduceat`.
+
+    `segment_index` must be sorted such that the values of each segment are contiguous. Segments
+    without any values are assigned `empty_value`.
+    """
+    result = np.full(num_segments, empty_value, dtype=float)
+    if values.size == 0:
+        return result
+
+    is_segment_start = np.ones(segment_index.size, dtype=bool)
+    is_segment_start[1:] = segment_index[1:] != segment_index[:-1]
+    segment_starts = np.flatnonzero(is_segment_start)
+    result[segment_index[segment_starts]] = ufunc.reduceat(values, segment_starts)
+    return result
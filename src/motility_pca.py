@@ -0,0 +1,238 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA, IncrementalPCA
+
+SOLVERS = ("full", "randomized", "incremental")
+# fitted attributes that fully describe a PCA (and from which incremental fitting can resume)
+PCA_STATE_ATTRIBUTES = (
+    "components_",
+    "singular_values_",
+    "explained_variance_",
+    "explained_variance_ratio_",
+    "mean_",
+    "var_",
+)
+
+
+def compute_min_max_bounds(dataframe, metrics):
+    """Compute the minimum and maximum of each motility metric.
+
+    Returns
+    -------
+    bounds : (2, M) array
+        Minimum (first row) and maximum (second row) of each of the M metrics.
+    """
+    values = dataframe.loc[:, metrics].to_numpy(dtype=float)
+    return np.stack([np.nanmin(values, axis=0), np.nanmax(values, axis=0)])
+
+
+def min_max_normalize(dataframe, metrics, bounds):
+    """Min-max normalize the motility metrics given the bounds of each metric.
+
+    Returns
+    -------
+    normalized_values : (N, M) array
+        Motility metrics scaled such that the bounds of each metric map to 0 and 1.
+    """
+    values = dataframe.loc[:, metrics].to_numpy(dtype=float)
+    _min, _max = bounds
+    return (values - _min) / (_max - _min)
+
+
+class MotilityPCA:
+    """PCA of min-max normalized motility metrics.
+
+    Bundles the min-max normalization bounds with the fitted principal components, such that new
+    data (e.g. cells on a drug or from a new plate) is projected into the PC space with a single
+    matrix product rather than a refit. With `solver="incremental"`, or after any fit, new data can
+    also be folded into the fit with `partial_fit` (see `sklearn.decomposition.IncrementalPCA`)
+    without refitting on all of the data seen before. The normalization bounds are fixed by the
+    first fit such that the PC space stays comparable across folds. As only `num_components`
+    components are kept between folds, a folded fit approximates rather than equals a refit.
+
+    Parameters
+    ----------
+    metrics : list of str
+        Columns of motility metrics on which to run the PCA.
+    num_components : int
+        Number of principal components.
+    solver : str
+        "full" for an exact PCA, "randomized" for a randomized (truncated) PCA, which is faster
+        for many cells, or "incremental" for an incremental PCA fit in batches of `batch_size`.
+    batch_size : int or None
+        Number of cells per batch of an incremental PCA. Defaults to `5 * num_metrics`.
+    random_state : int
+        Seed of the randomized PCA.
+    """
+
+    def __init__(self, metrics, num_components=2, solver="full", batch_size=None, random_state=0):
+        if solver not in SOLVERS:
+            msg = f"Unknown solver '{solver}'. Expected one of {SOLVERS}."
+            raise ValueError(msg)
+        self.metrics = list(metrics)
+        self.num_components = num_components
+        self.solver = solver
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.bounds = None
+        self.num_samples_seen = 0
+        for attribute in PCA_STATE_ATTRIBUTES:
+            setattr(self, attribute, None)
+
+    @property
+    def is_fitted(self):
+        """Whether the principal components have been fit."""
+        return self.components_ is not None
+
+    def _create_estimator(self):
+        if self.solver == "incremental":
+            return IncrementalPCA(n_components=self.num_components, batch_size=self.batch_size)
+        return PCA(
+            n_components=self.num_components,
+            svd_solver=self.solver,
+            random_state=self.random_state,
+        )
+
+    def _restore_incremental_estimator(self):
+        """Create an incremental PCA that resumes fitting from the current state."""
+        estimator = IncrementalPCA(n_components=self.num_components, batch_size=self.batch_size)
+        for attribute in PCA_STATE_ATTRIBUTES:
+            setattr(estimator, attribute, getattr(self, attribute))
+        estimator.n_samples_seen_ = self.num_samples_seen
+        estimator.n_components_ = self.num_components
+        estimator.n_features_in_ = len(self.metrics)
+        return estimator
+
+    def _update_state(self, estimator, normalized_values):
+        for attribute in PCA_STATE_ATTRIBUTES:
+            if attribute == "var_" and not hasattr(estimator, "var_"):
+                # `PCA` does not keep the variance of each metric, which incremental fits need
+                self.var_ = normalized_values.var(axis=0)
+            else:
+                setattr(self, attribute, getattr(estimator, attribute))
+        self.num_samples_seen = int(getattr(estimator, "n_samples_seen_", len(normalized_values)))
+
+    def fit(self, dataframe):
+        """Fit the normalization bounds and principal components to the motility metrics."""
+        self.bounds = compute_min_max_bounds(dataframe, self.metrics)
+        normalized_values = min_max_normalize(dataframe, self.metrics, self.bounds)
+        estimator = self._create_estimator().fit(normalized_values)
+        self._update_state(estimator, normalized_values)
+        return self
+
+    def partial_fit(self, dataframe):
+        """Fold the motility metrics of more cells into the fit without refitting on past data.
+
+        The first call fits the normalization bounds; later calls normalize with the same bounds.
+        """
+        if self.bounds is None:
+            self.bounds = compute_min_max_bounds(dataframe, self.metrics)
+        normalized_values = min_max_normalize(dataframe, self.metrics, self.bounds)
+        if self.is_fitted:
+            estimator = self._restore_incremental_estimator()
+        else:
+            estimator = IncrementalPCA(n_components=self.num_components)
+        estimator.partial_fit(normalized_values)
+        self._update_state(estimator, normalized_values)
+        return self
+
+    def transform(self, dataframe, bounds=None):
+        """Project motility metrics into the PC space.
+
+        Parameters
+        ----------
+        dataframe : `pd.DataFrame`
+            Motility metrics of the cells to project.
+        bounds : (2, M) array or None
+            Normalization bounds with which to normalize the motility metrics before projecting.
+            Defaults to the bounds of the fit. Pass `compute_min_max_bounds(dataframe, metrics)`
+            to normalize the cells by their own bounds instead.
+
+        Returns
+        -------
+        components : (N, num_components) array
+            Principal components of each cell.
+        """
+        if not self.is_fitted:
+            msg = "MotilityPCA must be fit before projecting data."
+            raise RuntimeError(msg)
+        bounds = self.bounds if bounds is None else bounds
+        normalized_values = min_max_normalize(dataframe, self.metrics, bounds)
+        return (normalized_values - self.mean_) @ self.components_.T
+
+    def fit_transform(self, dataframe):
+        """Fit to the motility metrics and project them into the PC space."""
+        return self.fit(dataframe).transform(dataframe)
+
+    def save(self, npz_filepath):
+        """Save the parameters and fitted state to a .npz file."""
+        if not self.is_fitted:
+            msg = "MotilityPCA must be fit before saving."
+            raise RuntimeError(msg)
+        parameters = {
+            "metrics": self.metrics,
+            "num_components": self.num_components,
+            "solver": self.solver,
+            "batch_size": self.batch_size,
+            "random_state": self.random_state,
+            "num_samples_seen": self.num_samples_seen,
+        }
+        np.savez(
+            npz_filepath,
+            parameters=json.dumps(parameters),
+            bounds=self.bounds,
+            **{attribute: getattr(self, attribute) for attribute in PCA_STATE_ATTRIBUTES},
+        )
+
+    @classmethod
+    def load(cls, npz_filepath):
+        """Load a fitted MotilityPCA from a .npz file."""
+        with np.load(npz_filepath) as npz_file:
+            parameters = json.loads(str(npz_file["parameters"]))
+            num_samples_seen = parameters.pop("num_samples_seen")
+            pca = cls(**parameters)
+            pca.num_samples_seen = num_samples_seen
+            pca.bounds = npz_file["bounds"]
+            for attribute in PCA_STATE_ATTRIBUTES:
+                setattr(pca, attribute, npz_file[attribute])
+        return pca
+
+
+class PCACache:
+    """Cache of fitted MotilityPCAs keyed by the data subset and parameters of each fit.
+
+    Parameters
+    ----------
+    cache_directory : `pathlib.Path`
+        Directory of the cached fits. Created if it does not exist.
+    """
+
+    def __init__(self, cache_directory):
+        self.directory = Path(cache_directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+
+    @staticmethod
+    def fingerprint(dataframe, metrics, **pca_kwargs):
+        """Hash of the motility metrics of a data subset and the parameters of a fit."""
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(dataframe.loc[:, metrics], index=False).values)
+        digest.update(json.dumps({"metrics": list(metrics), **pca_kwargs}).encode())
+        return digest.hexdigest()[:16]
+
+    def fit(self, dataframe, metrics, **pca_kwargs):
+        """Load the MotilityPCA fit to a data subset from the cache, or fit and cache it.
+
+        Keyword arguments are passed to `MotilityPCA`.
+        """
+        fingerprint = self.fingerprint(dataframe, metrics, **pca_kwargs)
+        npz_filepath = self.directory / f"pca_{fingerprint}.npz"
+        if npz_filepath.exists():
+            return MotilityPCA.load(npz_filepath)
+
+        pca = MotilityPCA(metrics, **pca_kwargs).fit(dataframe)
+        pca.save(npz_filepath)
+        return pca
@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+from trajectory_store import CHUNK_SIZE, iter_trajectory_column_chunks
+
+
+class OccupancyAccumulator:
+    """Per-frame cell counts and 2-D density of cell positions, accumulated chunk by chunk.
+
+    The number of tracked cells in each frame is accumulated with a `bincount` over the frame
+    numbers and the density of positions with a histogram over a fixed grid of square bins (in
+    microns) spanning the field of view. As both are fixed-size arrays updated one chunk of rows at
+    a time, memory usage is independent of the number and length of the cell trajectories.
+
+    Parameters
+    ----------
+    image_shape : tuple of int
+        Height and width (in pixels) of the field of view.
+    pixelsize : float
+        Pixel size (in microns per pixel).
+    bin_size : float
+        Width (in microns) of the square bins of the density map.
+    """
+
+    def __init__(self, image_shape, pixelsize, bin_size=20.0):
+        self.pixelsize = pixelsize
+        self.bin_size = bin_size
+        height, width = (np.ceil(np.array(image_shape) * pixelsize / bin_size)).astype(int)
+        self.y_edges = np.arange(height + 1) * bin_size
+        self.x_edges = np.arange(width + 1) * bin_size
+        self.frame_counts = np.zeros(0, dtype=np.int64)
+        self.density = np.zeros((height, width), dtype=np.int64)
+        self.num_outside = 0
+
+    def add(self, t, x, y):
+        """Add a chunk of positions given by their frame number and x, y coordinates (in pixels)."""
+        frame_counts = np.bincount(np.asarray(t, dtype=np.int64), minlength=self.frame_counts.size)
+        frame_counts[: self.frame_counts.size] += self.frame_counts
+        self.frame_counts = frame_counts
+
+        # bin positions in microns, ignoring any outside the field of view
+        height, width = self.density.shape
+        columns = np.floor(np.asarray(x, dtype=float) * self.pixelsize / self.bin_size)
+        rows = np.floor(np.asarray(y, dtype=float) * self.pixelsize / self.bin_size)
+        is_inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+        self.num_outside += int(np.count_nonzero(~is_inside))
+        bin_indices = rows[is_inside].astype(np.int64) * width + columns[is_inside].astype(np.int64)
+        self.density += np.bincount(bin_indices, minlength=height * width).reshape(height, width)
+
+    def save(self, npz_filepath):
+        """Save the per-frame cell counts and density map to a compressed .npz file."""
+        np.savez_compressed(
+            npz_filepath,
+            frame_counts=self.frame_counts,
+            density=self.density,
+            x_edges=self.x_edges,
+            y_edges=self.y_edges,
+            num_outside=self.num_outside,
+        )
+
+
+def compute_occupancy(
+    trajectory_filepath, image_shape, pixelsize, bin_size=20.0, chunk_size=CHUNK_SIZE
+):
+    """Compute the per-frame cell counts and density map of a well by streaming its trajectories.
+
+    Parameters
+    ----------
+    trajectory_filepath : `pathlib.Path`
+        File path to a CSV file of cell trajectories or to the store of a well as created by
+        `trajectory_store.convert_trajectory_csv`.
+    image_shape : tuple of int
+        Height and width (in pixels) of the field of view.
+    pixelsize : float
+        Pixel size (in microns per pixel).
+    bin_size : float
+        Width (in microns) of the square bins of the density map.
+    chunk_size : int
+        Number of rows read at a time.
+
+    Returns
+    -------
+    occupancy : `OccupancyAccumulator`
+        Accumulated per-frame cell counts (`frame_counts`) and density map (`density`, with rows
+        along y and columns along x, binned by `y_edges` and `x_edges`).
+    """
+    occupancy = OccupancyAccumulator(image_shape, pixelsize, bin_size=bin_size)
+    for data in iter_trajectory_column_chunks(
+        trajectory_filepath, columns=("t", "x", "y"), chunk_size=chunk_size
+    ):
+        occupancy.add(data["t"], data["x"], data["y"])
+    return occupancy
+
+
+def load_occupancy(npz_filepath):
+    """Load the per-frame cell counts and density map of a well saved by `OccupancyAccumulator`.
+
+    Returns
+    -------
+    occupancy : dict
+        Mapping of `frame_counts`, `density`, `x_edges`, `y_edges`, and `num_outside` to arrays.
+    """
+    npz_filepath = Path(npz_filepath)
+    if not npz_filepath.exists():
+        msg = f"Occupancy file not found: '{npz_filepath}'."
+        raise FileNotFoundError(msg)
+    with np.load(npz_filepath) as npz_file:
+        return {name: npz_file[name] for name in npz_file.files}
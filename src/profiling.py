@@ -0,0 +1,105 @@
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+def get_peak_rss_mb():
+    """Peak resident set size (in MiB) of the current process so far."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # `ru_maxrss` is reported in bytes on macOS and in kibibytes on Linux
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+class StageProfiler:
+    """Record the wall time and peak memory usage of the stages of a computation.
+
+    Peak resident set size is a high-water mark of the process, so the increase in peak RSS over
+    a stage is the memory it newly claimed beyond that of any earlier stage.
+
+    Parameters
+    ----------
+    **labels
+        Labels (e.g. the well ID) added to every record made by the profiler.
+
+    Examples
+    --------
+    >>> profiler = StageProfiler(well_ID="WellA01")
+    >>> with profiler.stage("parsing"):
+    ...     dataframe = pd.read_csv(csv_filepath)
+    >>> profiler.records
+    [{'well_ID': 'WellA01', 'stage': 'parsing', 'seconds': ..., ...}]
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Context manager that records the wall time and peak RSS of the enclosed code.
+
+        Yields the labels of the record, to which labels only known within the stage (e.g. the
+        number of tracks loaded) can be added.
+        """
+        peak_rss_before = get_peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            seconds = time.perf_counter() - start
+            peak_rss = get_peak_rss_mb()
+            self.records.append(
+                {
+                    **self.labels,
+                    **labels,
+                    "stage": name,
+                    "seconds": seconds,
+                    "peak_rss_mb": peak_rss,
+                    "peak_rss_increase_mb": peak_rss - peak_rss_before,
+                    "pid": os.getpid(),
+                }
+            )
+
+
+def summarize_hotspots(records, group_column="well_ID", num_groups=5):
+    """Summarize profiling records by stage and by the groups (e.g. wells) that take longest.
+
+    Parameters
+    ----------
+    records : list of dict
+        Records made by `StageProfiler`.
+    group_column : str
+        Label by which records are grouped to identify outliers.
+    num_groups : int
+        Number of slowest groups to report.
+
+    Returns
+    -------
+    stage_summary : `pandas.DataFrame`
+        Total, mean, and maximum wall time of each stage, and its fraction of the total time,
+        sorted from slowest to fastest.
+    group_summary : `pandas.DataFrame`
+        Wall time of each stage, number of tracks (if recorded), and maximum peak RSS of the
+        `num_groups` slowest groups.
+    """
+    dataframe = pd.DataFrame(records)
+
+    stage_summary = dataframe.groupby("stage")["seconds"].agg(["sum", "mean", "max", "count"])
+    stage_summary["fraction"] = stage_summary["sum"] / stage_summary["sum"].sum()
+    stage_summary = stage_summary.sort_values("sum", ascending=False)
+
+    group_summary = dataframe.pivot_table(
+        index=group_column, columns="stage", values="seconds", aggfunc="sum"
+    )
+    group_summary["total"] = group_summary.sum(axis=1)
+    grouped = dataframe.groupby(group_column)
+    if "num_tracks" in dataframe.columns:
+        group_summary["num_tracks"] = grouped["num_tracks"].max().astype("Int64")
+    group_summary["peak_rss_mb"] = grouped["peak_rss_mb"].max()
+    group_summary = group_summary.sort_values("total", ascending=False).head(num_groups)
+
+    return stage_summary, group_summary
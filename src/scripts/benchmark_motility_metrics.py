@@ -0,0 +1,333 @@
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+from itertools import product
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+from swimtracker.tracking_metrics import TrajectoryCSVParser
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+import motility_metrics
+from synthetic_trajectories import write_synthetic_dataset
+from trajectory_store import load_trajectory_columns
+
+# acquisition parameters of the single-cell motility assay
+FRAMERATE = 14.2
+PIXELSIZE = 1.3
+STAGES = [
+    "parsing",
+    "estimate_cell_count",
+    "compute_summary_statistics",
+    "accumulation",
+    "csv_export",
+]
+SCALE_COLUMNS = ["engine", "num_wells", "tracks_per_well", "frames_per_track"]
+
+
+def parse_integers(context, parameter, value):
+    """Parse a comma-separated list of positive integers."""
+    try:
+        integers = [int(integer) for integer in value.split(",")]
+    except ValueError as error:
+        msg = f"Expected a comma-separated list of integers, got '{value}'."
+        raise click.BadParameter(msg) from error
+    if min(integers) < 1:
+        msg = f"Expected positive integers, got '{value}'."
+        raise click.BadParameter(msg)
+    return integers
+
+
+output_file_option = click.option(
+    "--output-file",
+    "output_json_file",
+    type=Path,
+    default=Path("motility-metrics_benchmark.json"),
+    show_default=True,
+    help="File path for output JSON file of benchmark results.",
+)
+
+baseline_file_option = click.option(
+    "--baseline",
+    "baseline_json_file",
+    type=Path,
+    default=None,
+    help="File path to JSON file of benchmark results from a previous run to compare against.",
+)
+
+num_wells_option = click.option(
+    "--num-wells",
+    "num_wells",
+    default="4",
+    show_default=True,
+    callback=parse_integers,
+    help="Comma-separated list of numbers of wells (CSV files) per synthetic dataset.",
+)
+
+tracks_per_well_option = click.option(
+    "--tracks-per-well",
+    "tracks_per_well",
+    default="100,1000",
+    show_default=True,
+    callback=parse_integers,
+    help="Comma-separated list of numbers of cell trajectories per well.",
+)
+
+frames_per_track_option = click.option(
+    "--frames-per-track",
+    "frames_per_track",
+    default="50,200",
+    show_default=True,
+    callback=parse_integers,
+    help="Comma-separated list of numbers of frames per cell trajectory.",
+)
+
+engine_option = click.option(
+    "--engine",
+    "engines",
+    type=click.Choice(["swimtracker", "vectorized"]),
+    multiple=True,
+    default=["swimtracker", "vectorized"],
+    show_default=True,
+    help="Engine(s) for computing motility metrics to benchmark. Can be given multiple times.",
+)
+
+repeats_option = click.option(
+    "--repeats",
+    "num_repeats",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of times to repeat each benchmark. The minimum and median times are reported.",
+)
+
+tolerance_option = click.option(
+    "--tolerance",
+    "tolerance",
+    type=click.FloatRange(min=0),
+    default=0.2,
+    show_default=True,
+    help="Fractional slowdown relative to the baseline above which a stage is flagged.",
+)
+
+seed_option = click.option(
+    "--seed",
+    "seed",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Seed for generating the synthetic cell trajectories.",
+)
+
+
+def time_call(function, *args, **kwargs):
+    """Call a function and return its result along with the elapsed wall time (in seconds)."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_well(csv_filepath, engine, timings):
+    """Compute the motility metrics of one well, adding the time spent per stage to `timings`."""
+    if engine == "vectorized":
+        (track_ids, data), elapsed = time_call(load_trajectory_columns, csv_filepath)
+        timings["parsing"] += elapsed
+        cell_count, elapsed = time_call(motility_metrics.estimate_cell_count, data["t"])
+        timings["estimate_cell_count"] += elapsed
+        dataframe, elapsed = time_call(
+            motility_metrics.compute_summary_statistics,
+            track_ids,
+            data["t"],
+            data["x"],
+            data["y"],
+            FRAMERATE,
+            PIXELSIZE,
+        )
+        timings["compute_summary_statistics"] += elapsed
+    else:
+        cell_trajectories, elapsed = time_call(
+            TrajectoryCSVParser, csv_filepath, FRAMERATE, PIXELSIZE
+        )
+        timings["parsing"] += elapsed
+        cell_count, elapsed = time_call(cell_trajectories.estimate_cell_count)
+        timings["estimate_cell_count"] += elapsed
+        dataframe, elapsed = time_call(
+            lambda: pd.DataFrame(cell_trajectories.compute_summary_statistics())
+        )
+        timings["compute_summary_statistics"] += elapsed
+
+    return dataframe, cell_count
+
+
+def benchmark_dataset(csv_filepaths, engine, output_csv_file):
+    """Time each stage of computing motility metrics for a dataset of CSV files.
+
+    Mirrors `compute_motility_metrics.py`: per-well metrics are computed, annotated with the
+    cell count and well ID, accumulated into a single dataframe, and exported to CSV.
+
+    Returns
+    -------
+    timings : dict
+        Mapping of each stage to the total wall time (in seconds) spent in it across all wells.
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    well_dataframes = []
+    for csv_filepath in csv_filepaths:
+        dataframe, cell_count = benchmark_well(csv_filepath, engine, timings)
+        start = time.perf_counter()
+        dataframe["cell_count"] = cell_count
+        dataframe["well_ID"] = csv_filepath.name.split("_")[0]
+        well_dataframes.append(dataframe)
+        timings["accumulation"] += time.perf_counter() - start
+
+    summary_dataframe, elapsed = time_call(pd.concat, well_dataframes, ignore_index=True)
+    timings["accumulation"] += elapsed
+    _, timings["csv_export"] = time_call(summary_dataframe.to_csv, output_csv_file, index=False)
+    return timings
+
+
+def get_environment():
+    """Versions of the software and hardware the benchmarks were run on."""
+    environment = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+    for package in ["numpy", "pandas", "swimtracker"]:
+        try:
+            environment[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            environment[package] = None
+    return environment
+
+
+def compare_to_baseline(results_dataframe, baseline_dataframe, tolerance):
+    """Compare the minimum time of each benchmark to that of a baseline run.
+
+    Returns
+    -------
+    comparison_dataframe : `pandas.DataFrame`
+        Benchmarks common to both runs with the baseline and current minimum times, their ratio,
+        and whether the slowdown exceeds `tolerance`.
+    """
+    comparison_dataframe = baseline_dataframe[[*SCALE_COLUMNS, "stage", "seconds_min"]].merge(
+        results_dataframe[[*SCALE_COLUMNS, "stage", "seconds_min"]],
+        on=[*SCALE_COLUMNS, "stage"],
+        suffixes=("_baseline", "_current"),
+    )
+    comparison_dataframe["ratio"] = (
+        comparison_dataframe["seconds_min_current"] / comparison_dataframe["seconds_min_baseline"]
+    )
+    comparison_dataframe["regression"] = comparison_dataframe["ratio"] > 1 + tolerance
+    return comparison_dataframe
+
+
+@seed_option
+@tolerance_option
+@repeats_option
+@engine_option
+@frames_per_track_option
+@tracks_per_well_option
+@num_wells_option
+@baseline_file_option
+@output_file_option
+@click.command()
+def main(
+    output_json_file,
+    baseline_json_file,
+    num_wells,
+    tracks_per_well,
+    frames_per_track,
+    engines,
+    num_repeats,
+    tolerance,
+    seed,
+):
+    """Script for benchmarking the computation of motility metrics on synthetic cell trajectories.
+
+    For every combination of number of wells, tracks per well, and frames per track, a synthetic
+    dataset of CSV files with the same schema as the real cell trajectories is generated, and the
+    time spent parsing, estimating cell counts, computing summary statistics, accumulating, and
+    exporting to CSV is measured for each engine. Results are saved to a JSON file, which can be
+    passed to `--baseline` in a later run (e.g. after upgrading `swimtracker` or `pandas`) to
+    flag stages that have slowed down.
+    """
+    if baseline_json_file is not None and not baseline_json_file.exists():
+        msg = f"Baseline JSON file of benchmark results not found: '{baseline_json_file}'."
+        raise FileNotFoundError(msg)
+
+    results = []
+    scales = list(product(num_wells, tracks_per_well, frames_per_track))
+    for num_wells_, num_tracks, num_frames in scales:
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            csv_filepaths = write_synthetic_dataset(
+                Path(temporary_directory) / "cell_trajectories",
+                num_wells_,
+                num_tracks,
+                num_frames,
+                seed=seed,
+            )
+            output_csv_file = Path(temporary_directory) / "summary-statistics.csv"
+
+            for engine in engines:
+                print(
+                    f"Benchmarking {engine} engine: {num_wells_} wells x {num_tracks} tracks x "
+                    f"{num_frames} frames..."
+                )
+                repeat_timings = [
+                    benchmark_dataset(csv_filepaths, engine, output_csv_file)
+                    for _ in range(num_repeats)
+                ]
+                for stage in [*STAGES, "total"]:
+                    if stage == "total":
+                        seconds = [sum(timings.values()) for timings in repeat_timings]
+                    else:
+                        seconds = [timings[stage] for timings in repeat_timings]
+                    results.append(
+                        {
+                            "engine": engine,
+                            "num_wells": num_wells_,
+                            "tracks_per_well": num_tracks,
+                            "frames_per_track": num_frames,
+                            "stage": stage,
+                            "seconds_min": min(seconds),
+                            "seconds_median": float(np.median(seconds)),
+                        }
+                    )
+
+    results_dataframe = pd.DataFrame(results)
+    print(results_dataframe.to_string(index=False))
+
+    benchmark = {
+        "environment": get_environment(),
+        "num_repeats": num_repeats,
+        "seed": seed,
+        "results": results,
+    }
+    output_json_file.parent.mkdir(exist_ok=True, parents=True)
+    output_json_file.write_text(json.dumps(benchmark, indent=4))
+
+    if baseline_json_file is not None:
+        baseline = json.loads(baseline_json_file.read_text())
+        comparison_dataframe = compare_to_baseline(
+            results_dataframe, pd.DataFrame(baseline["results"]), tolerance
+        )
+        print(f"\nComparison to baseline from {baseline['environment']['timestamp']}:")
+        print(comparison_dataframe.to_string(index=False, float_format="{:.4g}".format))
+        num_regressions = comparison_dataframe["regression"].sum()
+        if num_regressions:
+            print(
+                f"{num_regressions} benchmark(s) slower than the baseline by over {tolerance:.0%}."
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
+import hashlib
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 import pandas as pd
 from natsort import natsorted
+from tqdm import tqdm
 
-ASSAY_DATA_DIRECTORY = Path(__file__).parents[2] / "data/single-cell-motility-assay/"
+REPO_ROOT_DIRECTORY = Path(__file__).parents[2]
+ASSAY_DATA_DIRECTORY = REPO_ROOT_DIRECTORY / "data/single-cell-motility-assay/"
 SAMPLE_PREP_PARAMETERS_JSON = ASSAY_DATA_DIRECTORY / "experimental_parameters.json"
+# local cache (ignored by git) rather than alongside the published data
+DEFAULT_CHECKSUM_CACHE_JSON = REPO_ROOT_DIRECTORY / "results/.checksum-cache.json"
+CHECKSUM_ALGORITHMS = ("md5", "sha256")
+CHECKSUM_CHUNK_SIZE = 2**23  # 8 MiB
 
 COLUMN_NAMES_SAMPLE_PREP_PARAMETERS = [
     "well_id",
@@ -14,7 +22,10 @@ COLUMN_NAMES_SAMPLE_PREP_PARAMETERS = [
     "drug",
     "concentration",
 ]
-COLUMN_NAMES = ["Files", "file_content"] + COLUMN_NAMES_SAMPLE_PREP_PARAMETERS
+COLUMN_NAMES_FILE_METADATA = ["file_size", *CHECKSUM_ALGORITHMS]
+COLUMN_NAMES = (
+    ["Files", "file_content"] + COLUMN_NAMES_SAMPLE_PREP_PARAMETERS + COLUMN_NAMES_FILE_METADATA
+)
 
 FILE_CONTENT_BLURBS = {
     ".nd2": "raw brightfield time-lapse microscopy data",
@@ -28,8 +39,130 @@ input_directory_argument = click.argument(
     type=Path,
 )
 
+checksum_cache_option = click.option(
+    "--checksum-cache",
+    "checksum_cache_json",
+    type=Path,
+    default=DEFAULT_CHECKSUM_CACHE_JSON,
+    show_default=True,
+    help=(
+        "File path to a JSON file of the checksums of previously hashed files, keyed by path "
+        "relative to the input directory, size, and modification time, such that unchanged files "
+        "are not hashed again."
+    ),
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of threads over which to distribute hashing the files.",
+)
+
+
+def compute_checksums(filepath, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """Compute the MD5 and SHA-256 checksums of a file in a single chunked pass over it.
 
-def generate_dataframe(study_component_directory):
+    `hashlib` releases the GIL while hashing large chunks, so files can be hashed concurrently
+    across threads.
+    """
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in CHECKSUM_ALGORITHMS}
+    with Path(filepath).open("rb") as file:
+        while chunk := file.read(chunk_size):
+            for digest in digests.values():
+                digest.update(chunk)
+    return {algorithm: digest.hexdigest() for algorithm, digest in digests.items()}
+
+
+class ChecksumCache:
+    """Cache of file checksums, reused while the size and modification time of a file match.
+
+    Files are keyed by their path relative to `root_directory`, such that a cache can be shared
+    between copies of the data at different locations.
+
+    Parameters
+    ----------
+    cache_json : `pathlib.Path`
+        File path to the JSON file of the cache. Created on `write` if it does not exist.
+    root_directory : `pathlib.Path`
+        Directory that all cached files are located within.
+    """
+
+    def __init__(self, cache_json, root_directory):
+        self.cache_json = Path(cache_json)
+        self.root_directory = Path(root_directory).resolve()
+        if self.cache_json.exists():
+            self.entries = json.loads(self.cache_json.read_text())
+        else:
+            self.entries = {}
+
+    def _key(self, filepath):
+        return Path(filepath).resolve().relative_to(self.root_directory).as_posix()
+
+    def get(self, filepath, stat):
+        """Cached checksums of a file, or None if it has not been hashed at its current state."""
+        entry = self.entries.get(self._key(filepath))
+        if entry is None or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return {algorithm: entry[algorithm] for algorithm in CHECKSUM_ALGORITHMS}
+
+    def set(self, filepath, stat, checksums):
+        """Record the checksums of a file at its current size and modification time."""
+        self.entries[self._key(filepath)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            **checksums,
+        }
+
+    def write(self):
+        """Write the cache to disk."""
+        self.cache_json.parent.mkdir(exist_ok=True, parents=True)
+        self.cache_json.write_text(json.dumps(self.entries, indent=4, sort_keys=True))
+
+
+def compute_file_metadata(filepaths, checksum_cache, num_jobs=8):
+    """Compute the size and checksums of each file, hashing only files not found in the cache.
+
+    Files are hashed concurrently across `num_jobs` threads, as reading and hashing multi-GB raw
+    data files serially is I/O- and CPU-bound one file at a time.
+
+    Returns
+    -------
+    file_metadata : dict
+        Mapping of each file path to its size (in bytes) and MD5 and SHA-256 checksums.
+    """
+    stats = {filepath: filepath.stat() for filepath in filepaths}
+    file_metadata = {}
+    uncached_filepaths = []
+    for filepath, stat in stats.items():
+        checksums = checksum_cache.get(filepath, stat)
+        if checksums is None:
+            uncached_filepaths.append(filepath)
+        else:
+            file_metadata[filepath] = {"file_size": stat.st_size, **checksums}
+
+    print(f"Hashing {len(uncached_filepaths)} of {len(filepaths)} files (others are cached).")
+    try:
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            for filepath, checksums in zip(
+                uncached_filepaths,
+                tqdm(
+                    executor.map(compute_checksums, uncached_filepaths),
+                    total=len(uncached_filepaths),
+                ),
+                strict=True,
+            ):
+                checksum_cache.set(filepath, stats[filepath], checksums)
+                file_metadata[filepath] = {"file_size": stats[filepath].st_size, **checksums}
+    finally:
+        # record progress even if the run is interrupted
+        checksum_cache.write()
+    return file_metadata
+
+
+def generate_dataframe(study_component_directory, checksum_cache, num_jobs=8):
     """Generate a DataFrame from which to create the file list."""
     sample_prep_parameters = json.loads(SAMPLE_PREP_PARAMETERS_JSON.read_text())
 
@@ -37,6 +170,7 @@ def generate_dataframe(study_component_directory):
     filepaths = natsorted(study_component_directory.glob("*.nd2")) + natsorted(
         study_component_directory.glob("processed/*")
     )
+    file_metadata = compute_file_metadata(filepaths, checksum_cache, num_jobs=num_jobs)
 
     file_list_data = []
     for path in filepaths:
@@ -50,6 +184,7 @@ def generate_dataframe(study_component_directory):
             "strain": sample_prep_parameters[well_id]["strain"],
             "drug": sample_prep_parameters[well_id]["drug"],
             "concentration": sample_prep_parameters[well_id]["concentration"],
+            **file_metadata[path],
         }
         file_list_data.append(row)
 
@@ -59,7 +194,9 @@ def generate_dataframe(study_component_directory):
 
 @click.command()
 @input_directory_argument
-def main(input_directory):
+@checksum_cache_option
+@num_jobs_option
+def main(input_directory, checksum_cache_json, num_jobs):
     """Create a file list to accompany data upload to BioImage Archive.
 
     BioImage Archive requires a File List [1] to accompany each study component [2] you upload.
@@ -75,6 +212,11 @@ def main(input_directory):
       * File path separator must be forward slash “/”.
       * Allowed characters :: a-z A-Z 0-9 !-_.*'()
 
+    Besides the sample preparation parameters, the size and MD5 and SHA-256 checksums of each
+    file are included such that the upload can be verified. Files are hashed concurrently across
+    `num_jobs` threads, and checksums are cached by path (relative to `input_directory`), size,
+    and modification time such that re-runs only hash new or modified files.
+
     References
     ----------
     [1] https://www.ebi.ac.uk/bioimage-archive/help-file-list/
@@ -85,11 +227,12 @@ def main(input_directory):
         [directory for directory in input_directory.glob("*") if directory.is_dir()]
     )
 
+    checksum_cache = ChecksumCache(checksum_cache_json, input_directory)
     for directory in study_component_directories:
         study_component_name = directory.name
 
         if "" in study_component_name:
-            dataframe = generate_dataframe(directory)
+            dataframe = generate_dataframe(directory, checksum_cache, num_jobs=num_jobs)
         else:
             msg = "Unknown study component '{study_component_name}'."
             raise ValueError(msg)
@@ -0,0 +1,203 @@
+import sys
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+from natsort import natsorted
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+import motility_metrics
+from trajectory_store import load_trajectory_columns
+
+REPO_ROOT_DIRECTORY = Path(__file__).parents[2]
+DEFAULT_INPUT_DIRECTORY = REPO_ROOT_DIRECTORY / "data/single-cell-motility-assay/cell_trajectories/"
+DEFAULT_REFERENCE_CSV_FILE = (
+    REPO_ROOT_DIRECTORY
+    / "data/single-cell-motility-assay/single-cell-motility-assay_summary-statistics.csv"
+)
+# acquisition parameters of the single-cell motility assay
+FRAMERATE = 14.2
+PIXELSIZE = 1.3
+# metrics computed by the vectorized engine (the turning-based metrics are left to `swimtracker`)
+METRIC_COLUMNS = [column for column in motility_metrics.VECTORIZED_COLUMNS if column != "cell_id"]
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory of CSV files of cell trajectories.",
+)
+
+reference_file_option = click.option(
+    "--reference",
+    "reference_csv_file",
+    type=Path,
+    default=DEFAULT_REFERENCE_CSV_FILE,
+    show_default=True,
+    help=(
+        "File path to the CSV file of summary motility statistics computed from the same cell "
+        "trajectories with `swimtracker` (e.g. the published summary statistics)."
+    ),
+)
+
+trajectory_time_threshold_option = click.option(
+    "--time-threshold",
+    "time_threshold",
+    default=10.0,
+    show_default=True,
+    help="Minimum trajectory duration (in seconds) used to create the reference.",
+)
+
+trajectory_distance_threshold_option = click.option(
+    "--distance-threshold",
+    "distance_threshold",
+    default=20.0,
+    show_default=True,
+    help="Minimum trajectory distance (in microns) used to create the reference.",
+)
+
+rtol_option = click.option(
+    "--rtol",
+    "rtol",
+    type=click.FloatRange(min=0),
+    default=1e-6,
+    show_default=True,
+    help="Relative tolerance within which a metric is considered to match the reference.",
+)
+
+
+def compute_vectorized_summary_statistics(
+    trajectory_csvs, time_threshold, distance_threshold, framerate=FRAMERATE, pixelsize=PIXELSIZE
+):
+    """Compute the filtered summary motility metrics of each well with the vectorized engine."""
+    dataframes = []
+    for trajectory_csv in trajectory_csvs:
+        track_ids, data = load_trajectory_columns(trajectory_csv, columns=("t", "x", "y"))
+        dataframe = motility_metrics.compute_summary_statistics(
+            track_ids, data["t"], data["x"], data["y"], framerate, pixelsize
+        )
+        dataframe["well_ID"] = trajectory_csv.name.split("_")[0]
+        dataframes.append(
+            dataframe.loc[
+                (dataframe["total_time"] >= time_threshold)
+                & (dataframe["total_distance"] >= distance_threshold)
+            ]
+        )
+    return pd.concat(dataframes, ignore_index=True)
+
+
+def compare_metrics(dataframe, reference_dataframe, rtol):
+    """Compare each motility metric to the reference, row by row.
+
+    Returns
+    -------
+    comparison_dataframe : `pandas.DataFrame`
+        One row per metric with the fraction of rows within `rtol` of the reference, the median
+        relative and maximum absolute differences, the correlation with the reference, and
+        whether every row matches.
+    """
+    comparisons = []
+    for column in METRIC_COLUMNS:
+        values = dataframe[column].to_numpy(dtype=float)
+        reference_values = reference_dataframe[column].to_numpy(dtype=float)
+        is_match = np.isclose(values, reference_values, rtol=rtol, atol=0, equal_nan=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative_differences = np.abs(values / reference_values - 1)
+        comparisons.append(
+            {
+                "metric": column,
+                "fraction_matching": is_match.mean(),
+                "median_relative_difference": np.nanmedian(relative_differences),
+                "max_absolute_difference": np.nanmax(np.abs(values - reference_values)),
+                "correlation": np.corrcoef(values, reference_values)[0, 1],
+                "match": is_match.all(),
+            }
+        )
+    return pd.DataFrame(comparisons)
+
+
+def check_engine_parity(
+    input_directory, reference_dataframe, time_threshold, distance_threshold, rtol
+):
+    """Compare the vectorized engine to a reference computed with `swimtracker`, metric by metric.
+
+    The motility metrics of the CSV files of cell trajectories of the wells in the reference are
+    computed with the vectorized engine and filtered with the same thresholds as the reference,
+    such that their rows line up with those of the reference (wells in natural sort order,
+    trajectories by ID within each well).
+
+    Returns
+    -------
+    comparison_dataframe : `pandas.DataFrame`
+        Agreement of each metric with the reference (see `compare_metrics`).
+    """
+    well_ids = set(reference_dataframe["well_ID"])
+    trajectory_csvs = [
+        trajectory_csv
+        for trajectory_csv in natsorted(input_directory.glob("*.csv"))
+        if trajectory_csv.name.split("_")[0] in well_ids
+    ]
+    dataframe = compute_vectorized_summary_statistics(
+        trajectory_csvs, time_threshold, distance_threshold
+    )
+
+    is_aligned = (
+        len(dataframe) == len(reference_dataframe)
+        and (dataframe["well_ID"].to_numpy() == reference_dataframe["well_ID"].to_numpy()).all()
+    )
+    if not is_aligned:
+        msg = (
+            f"The {len(dataframe)} trajectories passing the thresholds do not line up with the "
+            f"{len(reference_dataframe)} rows of the reference; check the thresholds."
+        )
+        raise ValueError(msg)
+
+    return compare_metrics(dataframe, reference_dataframe, rtol)
+
+
+@rtol_option
+@trajectory_distance_threshold_option
+@trajectory_time_threshold_option
+@reference_file_option
+@input_directory_option
+@click.command()
+def main(input_directory, reference_csv_file, time_threshold, distance_threshold, rtol):
+    """Script for checking the vectorized engine against summary motility statistics.
+
+    Computes the summary motility metrics of every CSV file of cell trajectories with the
+    vectorized engine (`motility_metrics.compute_summary_statistics`), applies the same
+    thresholds, and compares each metric it computes row by row to the reference computed with
+    `swimtracker`. Prints the agreement of each metric and exits with an error if any metric does
+    not match the reference within `rtol`. The same check is run by `tests/test_engine_parity.py`.
+    """
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+    if not reference_csv_file.exists():
+        msg = (
+            f"Reference CSV file of summary motility statistics not found: '{reference_csv_file}'."
+        )
+        raise FileNotFoundError(msg)
+
+    reference_dataframe = pd.read_csv(reference_csv_file)
+    comparison_dataframe = check_engine_parity(
+        input_directory, reference_dataframe, time_threshold, distance_threshold, rtol
+    )
+    print(
+        f"Agreement with '{reference_csv_file.name}' over {len(reference_dataframe)} trajectories:"
+    )
+    print(comparison_dataframe.to_string(index=False, float_format="{:.4g}".format))
+
+    mismatched_metrics = comparison_dataframe.loc[~comparison_dataframe["match"], "metric"]
+    if not mismatched_metrics.empty:
+        msg = f"Metrics not matching the reference: {', '.join(mismatched_metrics)}."
+        raise click.ClickException(msg)
+    print("All metrics match the reference.")
+
+
+if __name__ == "__main__":
+    main()
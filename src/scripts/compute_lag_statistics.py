@@ -0,0 +1,237 @@
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+from compute_motility_metrics import (
+    DEFAULT_INPUT_DIRECTORY,
+    DEFAULT_INPUT_JSON_FILE,
+    DEFAULT_OUTPUT_DIRECTORY,
+)
+from natsort import natsorted
+from tqdm import tqdm
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+import motility_metrics
+from trajectory_store import load_trajectory_columns
+
+GROUPBY_COLUMNS = ["strain", "drug", "concentration"]
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory of CSV files of cell trajectories.",
+)
+
+input_json_option = click.option(
+    "--json",
+    "input_json_file",
+    type=Path,
+    default=DEFAULT_INPUT_JSON_FILE,
+    show_default=True,
+    help=(
+        "File path to JSON file that maps each file in a dataset to a set of experimental "
+        "parameters."
+    ),
+)
+
+output_directory_option = click.option(
+    "--output-directory",
+    "output_directory",
+    type=Path,
+    default=DEFAULT_OUTPUT_DIRECTORY,
+    show_default=True,
+    help="File path for output CSV files of lag statistics.",
+)
+
+store_directory_option = click.option(
+    "--store-directory",
+    "store_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to a columnar trajectory store created by `convert_trajectory_csvs.py`. If "
+        "provided, cell trajectories are read from the store instead of from CSV files."
+    ),
+)
+
+trajectory_time_threshold_option = click.option(
+    "--time-threshold",
+    "time_threshold",
+    default=10.0,
+    show_default=True,
+    help="Minimum trajectory duration (in seconds) of the cells that are included.",
+)
+
+trajectory_distance_threshold_option = click.option(
+    "--distance-threshold",
+    "distance_threshold",
+    default=20.0,
+    show_default=True,
+    help="Minimum trajectory distance (in microns) of the cells that are included.",
+)
+
+max_lag_option = click.option(
+    "--max-lag",
+    "max_lag",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum lag (in frames). Defaults to the length of the longest trajectory.",
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes over which to distribute the wells.",
+)
+
+
+def compute_well_lag_statistics(
+    trajectory_filepath,
+    framerate,
+    pixelsize,
+    experimental_parameters,
+    time_threshold,
+    distance_threshold,
+    max_lag=None,
+):
+    """Compute the lag statistics of the cell trajectories in a single well.
+
+    Cell trajectories with a duration shorter than `time_threshold` or distance traversed shorter
+    than `distance_threshold` are excluded, as in `compute_motility_metrics.py`.
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Lag statistics of the well (see `motility_metrics.compute_lag_statistics`) along with the
+        strain, drug, concentration, and ID of the well.
+    """
+    well_id = trajectory_filepath.name.split("_")[0]
+    track_ids, data = load_trajectory_columns(trajectory_filepath, columns=("t", "x", "y"))
+
+    # only include trajectories that pass the thresholds
+    summary_statistics = motility_metrics.compute_summary_statistics(
+        track_ids, data["t"], data["x"], data["y"], framerate, pixelsize
+    )
+    retained_track_ids = summary_statistics.loc[
+        (summary_statistics["total_time"] >= time_threshold)
+        & (summary_statistics["total_distance"] >= distance_threshold),
+        "cell_id",
+    ]
+    is_retained = np.isin(track_ids, retained_track_ids)
+
+    dataframe = motility_metrics.compute_lag_statistics(
+        track_ids[is_retained],
+        data["t"][is_retained],
+        data["x"][is_retained],
+        data["y"][is_retained],
+        framerate,
+        pixelsize,
+        max_lag=max_lag,
+    )
+    dataframe.insert(0, "strain", experimental_parameters[well_id]["strain"])
+    dataframe.insert(1, "drug", experimental_parameters[well_id]["drug"])
+    dataframe.insert(2, "concentration", float(experimental_parameters[well_id]["concentration"]))
+    dataframe.insert(3, "well_ID", well_id)
+    return dataframe
+
+
+@num_jobs_option
+@max_lag_option
+@trajectory_distance_threshold_option
+@trajectory_time_threshold_option
+@store_directory_option
+@output_directory_option
+@input_json_option
+@input_directory_option
+@click.command()
+def main(
+    input_directory,
+    input_json_file,
+    output_directory,
+    store_directory,
+    time_threshold,
+    distance_threshold,
+    max_lag,
+    num_jobs,
+):
+    """Script for computing the mean squared displacement and velocity autocorrelation of cells.
+
+    Computes the mean squared displacement (MSD) and velocity autocorrelation (VACF) over lags of
+    the cell trajectories in each well with FFTs, which separate diffusive from ballistic
+    swimming. Outputs two CSV files with one row per lag: one of each well, and one pooled by
+    strain, drug, and concentration. Both hold the sums and counts of the squared displacements
+    and velocity products besides the MSD and VACF, such that the wells can be pooled into any
+    other grouping (see `motility_metrics.pool_lag_statistics`).
+    """
+    dataset_name = input_directory.parent.name
+
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+    if not input_json_file.exists():
+        msg = f"Input json file for experimental parameters not found: '{input_json_file}'."
+        raise FileNotFoundError(msg)
+    output_directory.mkdir(exist_ok=True, parents=False)
+
+    if store_directory is not None:
+        if not store_directory.exists():
+            msg = f"Trajectory store not found: '{store_directory}'."
+            raise FileNotFoundError(msg)
+        trajectory_filepaths = natsorted(
+            directory for directory in store_directory.glob("*") if directory.is_dir()
+        )
+    else:
+        trajectory_filepaths = natsorted(input_directory.glob("*.csv"))
+    if not trajectory_filepaths:
+        msg = f"No cell trajectories found in '{store_directory or input_directory}'."
+        raise FileNotFoundError(msg)
+
+    experimental_parameters = json.loads(input_json_file.read_text())
+    compute_lag_statistics = partial(
+        compute_well_lag_statistics,
+        framerate=experimental_parameters[dataset_name]["framerate"],
+        pixelsize=experimental_parameters[dataset_name]["pixelsize"],
+        experimental_parameters=experimental_parameters,
+        time_threshold=time_threshold,
+        distance_threshold=distance_threshold,
+        max_lag=max_lag,
+    )
+    if num_jobs > 1:
+        with ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            well_lag_statistics = list(
+                tqdm(
+                    executor.map(compute_lag_statistics, trajectory_filepaths),
+                    total=len(trajectory_filepaths),
+                )
+            )
+    else:
+        well_lag_statistics = [
+            compute_lag_statistics(trajectory_filepath)
+            for trajectory_filepath in tqdm(trajectory_filepaths)
+        ]
+
+    lag_statistics_dataframe = pd.concat(well_lag_statistics, ignore_index=True)
+    output_csv_file = output_directory / f"{dataset_name}_lag-statistics-per-well.csv"
+    lag_statistics_dataframe.to_csv(output_csv_file, index=False)
+
+    pooled_dataframe = motility_metrics.pool_lag_statistics(
+        lag_statistics_dataframe, GROUPBY_COLUMNS
+    )
+    output_csv_file = output_directory / f"{dataset_name}_lag-statistics.csv"
+    pooled_dataframe.to_csv(output_csv_file, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,42 @@
 import json
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import click
+import numpy as np
 import pandas as pd
 from natsort import natsorted
 from swimtracker.tracking_metrics import TrajectoryCSVParser
 from tqdm import tqdm
 
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+import motility_metrics
+from metrics_cache import MetricsCache, get_code_version, hash_trajectory_input
+from profiling import StageProfiler, get_peak_rss_mb, summarize_hotspots
+from trajectory_store import (
+    iter_trajectory_csv_batches,
+    iter_trajectory_csv_tracks,
+    load_trajectory_columns,
+)
+
 REPO_ROOT_DIRECTORY = Path(__file__).parents[2]
 DEFAULT_INPUT_DIRECTORY = REPO_ROOT_DIRECTORY / "data/single-cell-motility-assay/cell_trajectories/"
 DEFAULT_INPUT_JSON_FILE = (
     REPO_ROOT_DIRECTORY / "data/single-cell-motility-assay/experimental_parameters.json"
 )
 DEFAULT_OUTPUT_DIRECTORY = DEFAULT_INPUT_DIRECTORY.parent
+# source files that determine the motility metrics (for invalidating cached metrics)
+METRICS_SOURCE_FILEPATHS = [
+    Path(__file__),
+    Path(__file__).parents[1] / "motility_metrics.py",
+    Path(__file__).parents[1] / "trajectory_store.py",
+]
 
 input_directory_option = click.option(
     "--input-directory",
@@ -66,14 +90,489 @@ trajectory_distance_threshold_option = click.option(
     ),
 )
 
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help=(
+        "Number of worker processes over which to distribute the CSV files of cell trajectories. "
+        "Output is identical to running with a single process."
+    ),
+)
+
+output_format_option = click.option(
+    "--output-format",
+    "output_format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    show_default=True,
+    help=(
+        "Format of the summary motility statistics. 'csv' writes a single CSV file; 'parquet' "
+        "writes a Parquet dataset partitioned by well ID."
+    ),
+)
+
+engine_option = click.option(
+    "--engine",
+    "engine",
+    type=click.Choice(["swimtracker", "vectorized"]),
+    default="swimtracker",
+    show_default=True,
+    help=(
+        "Engine for computing motility metrics. 'swimtracker' computes metrics one trajectory at "
+        "a time with `swimtracker`; 'vectorized' computes metrics for all trajectories in a well "
+        "at once with NumPy. It only computes the distance-, time-, and speed-based metrics, which "
+        "are identical to those of `swimtracker`; the turning-based metrics are omitted."
+    ),
+)
+
+store_directory_option = click.option(
+    "--store-directory",
+    "store_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to a columnar trajectory store created by `convert_trajectory_csvs.py`. If "
+        "provided, cell trajectories are read from the store instead of from CSV files. Requires "
+        "the 'vectorized' engine, i.e. only the distance-, time-, and speed-based metrics are "
+        "computed (identical to those of `swimtracker`)."
+    ),
+)
+
+chunk_size_option = click.option(
+    "--chunk-size",
+    "chunk_size",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Stream each CSV file of cell trajectories in chunks of this many rows (split at track "
+        "boundaries), such that memory usage is bounded by the longest track rather than the size "
+        "of the file. The motility metrics are identical to those of reading each file at once "
+        "(the default) with either engine."
+    ),
+)
+
+morphology_option = click.option(
+    "--morphology",
+    "morphology",
+    is_flag=True,
+    default=False,
+    help=(
+        "Also summarize the segmentation morphology (area, eccentricity, major and minor axis "
+        "lengths, perimeter, and solidity) of each cell trajectory by its mean, median, "
+        "interquartile range, and variance over time, in additional columns of the same rows."
+    ),
+)
+
+cache_directory_option = click.option(
+    "--cache-directory",
+    "cache_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to a directory in which to cache the (unfiltered) motility metrics of each "
+        "well. On subsequent runs, only wells whose cell trajectories, experimental parameters, "
+        "or code have changed since they were cached are recomputed."
+    ),
+)
+
+profile_option = click.option(
+    "--profile",
+    "profile",
+    is_flag=True,
+    default=False,
+    help=(
+        "Record the wall time and peak memory usage of each stage for each well, write them to a "
+        "JSON report next to the summary output, and print the slowest stages and wells. With "
+        "`--jobs` > 1, stages of different wells overlap in time."
+    ),
+)
+
+
+def compute_well_motility_metrics(
+    trajectory_filepath,
+    framerate,
+    pixelsize,
+    hours_in_drug,
+    experimental_parameters,
+    engine="swimtracker",
+    chunk_size=None,
+    morphology=False,
+    profile=False,
+):
+    """Compute summary motility metrics for every cell trajectory in a single well.
+
+    Parameters
+    ----------
+    trajectory_filepath : `pathlib.Path`
+        File path to CSV file of cell trajectories from one well, or to the directory of the well
+        within a trajectory store (only supported by the 'vectorized' engine).
+    framerate, pixelsize : float
+        Acquisition frame rate (in frames per second) and pixel size (in microns per pixel).
+    hours_in_drug : float
+        Number of hours the cells were incubated in drug prior to imaging.
+    experimental_parameters : dict
+        Mapping of well ID to the strain, drug, and concentration of the well.
+    engine : str
+        Either 'swimtracker' or 'vectorized'.
+    chunk_size : int or None
+        If given, the CSV file is streamed in chunks of whole tracks of about this many rows. The
+        'vectorized' engine parses only the columns it needs from each chunk (see
+        `trajectory_store.iter_trajectory_csv_tracks`), while the 'swimtracker' engine runs
+        `swimtracker` on each chunk copied verbatim to a temporary CSV file (see
+        `trajectory_store.iter_trajectory_csv_batches`), such that its metrics are identical to
+        those of the whole file.
+    morphology : bool
+        Whether to add summaries of the segmentation morphology of each trajectory (see
+        `motility_metrics.compute_morphology_summaries`). The 'vectorized' engine reads the
+        morphology columns in the same pass as the positions; the 'swimtracker' engine parses them
+        from the same (chunk of the) CSV file that `swimtracker` computes the motility metrics of.
+    profile : bool
+        Whether to also return the wall time and peak memory usage of each stage.
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Summary motility metrics for each cell trajectory in the well.
+    profile_records : list of dict
+        Profiling records of each stage (see `profiling.StageProfiler`). Only returned if
+        `profile` is True.
+    """
+    # extract well ID from CSV filename
+    well_id = trajectory_filepath.name.split("_")[0]
+    profiler = StageProfiler(well_ID=well_id)
+
+    # estimate cell count and compute motility measurements for a batch of cell trajectories
+    if engine == "vectorized" and chunk_size is not None:
+        dataframe, cell_count = _compute_chunked_summary_statistics(
+            trajectory_filepath, framerate, pixelsize, chunk_size, morphology, profiler
+        )
+    elif engine == "vectorized":
+        columns = ["t", "x", "y"]
+        if morphology:
+            columns += motility_metrics.MORPHOLOGY_COLUMNS
+        with profiler.stage("parsing"):
+            track_ids, data = load_trajectory_columns(trajectory_filepath, columns=columns)
+        with profiler.stage("estimate_cell_count"):
+            cell_count = motility_metrics.estimate_cell_count(data["t"])
+        with profiler.stage("compute_summary_statistics"):
+            dataframe = motility_metrics.compute_summary_statistics(
+                track_ids, data["t"], data["x"], data["y"], framerate, pixelsize
+            )
+        if morphology:
+            with profiler.stage("compute_morphology_summaries"):
+                dataframe = _add_morphology_summaries(dataframe, track_ids, data)
+    elif chunk_size is not None:
+        dataframe, cell_count = _compute_chunked_swimtracker_summary_statistics(
+            trajectory_filepath, framerate, pixelsize, chunk_size, morphology, profiler
+        )
+    else:
+        with profiler.stage("parsing"):
+            cell_trajectories = TrajectoryCSVParser(trajectory_filepath, framerate, pixelsize)
+        with profiler.stage("estimate_cell_count"):
+            cell_count = cell_trajectories.estimate_cell_count()
+        with profiler.stage("compute_summary_statistics"):
+            dataframe = pd.DataFrame(cell_trajectories.compute_summary_statistics())
+        if morphology:
+            with profiler.stage("compute_morphology_summaries"):
+                track_ids, data = load_trajectory_columns(
+                    trajectory_filepath, columns=motility_metrics.MORPHOLOGY_COLUMNS
+                )
+                dataframe = _add_morphology_summaries(dataframe, track_ids, data)
+
+    # build up dataframe
+    with profiler.stage("assembly", num_tracks=len(dataframe)):
+        dataframe["cell_count"] = cell_count
+        dataframe["strain"] = experimental_parameters[well_id]["strain"]
+        dataframe["drug"] = experimental_parameters[well_id]["drug"]
+        dataframe["hours_in_drug"] = hours_in_drug
+        # cast to float for a consistent dtype across wells (concentrations are a mix of int and
+        # float)
+        dataframe["concentration"] = float(experimental_parameters[well_id]["concentration"])
+        dataframe["well_ID"] = well_id
+
+    if profile:
+        return dataframe, profiler.records
+    return dataframe
+
+
+def _add_morphology_summaries(dataframe, track_ids, data):
+    """Add the morphology summaries of each trajectory as columns to its motility metrics."""
+    morphology_summaries = motility_metrics.compute_morphology_summaries(
+        track_ids, {column: data[column] for column in motility_metrics.MORPHOLOGY_COLUMNS}
+    )
+    # match by track ID rather than by row, as `swimtracker` need not order its rows by track ID
+    morphology_summaries.index = np.unique(track_ids)
+    return dataframe.join(morphology_summaries, on="cell_id")
+
+
+def _compute_chunked_summary_statistics(
+    trajectory_filepath, framerate, pixelsize, chunk_size, morphology, profiler
+):
+    """Compute summary motility metrics of a CSV file of cell trajectories streamed in chunks.
+
+    The cell count is estimated from the number of positions per frame accumulated across chunks,
+    which is equivalent to `motility_metrics.estimate_cell_count` on the whole file.
+    """
+    dataframes = []
+    frame_counts = np.zeros(0, dtype=np.int64)
+    columns = ["t", "x", "y"]
+    if morphology:
+        columns += motility_metrics.MORPHOLOGY_COLUMNS
+    chunks = iter_trajectory_csv_tracks(trajectory_filepath, columns=columns, chunk_size=chunk_size)
+    while True:
+        with profiler.stage("parsing"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        track_ids, data = chunk
+        with profiler.stage("estimate_cell_count"):
+            frame_counts = _add_frame_counts(frame_counts, data["t"])
+        with profiler.stage("compute_summary_statistics"):
+            dataframe = motility_metrics.compute_summary_statistics(
+                track_ids, data["t"], data["x"], data["y"], framerate, pixelsize
+            )
+        if morphology:
+            with profiler.stage("compute_morphology_summaries"):
+                dataframe = _add_morphology_summaries(dataframe, track_ids, data)
+        dataframes.append(dataframe)
+
+    cell_count = round(frame_counts[frame_counts > 0].mean())
+    return pd.concat(dataframes, ignore_index=True), cell_count
+
+
+def _compute_chunked_swimtracker_summary_statistics(
+    trajectory_filepath, framerate, pixelsize, chunk_size, morphology, profiler
+):
+    """Compute summary motility metrics of a CSV file of cell trajectories with `swimtracker` in
+    chunks of whole tracks.
 
+    Each chunk is copied verbatim to a temporary CSV file from which `swimtracker` computes the
+    metrics of its tracks, which are thus identical to those computed from the whole file. The
+    cell count is estimated from the number of positions per frame accumulated across chunks, and
+    the morphology columns (if requested) are parsed from the same chunk as the frame numbers.
+    """
+    dataframes = []
+    frame_counts = np.zeros(0, dtype=np.int64)
+    columns = ["t"]
+    if morphology:
+        columns += motility_metrics.MORPHOLOGY_COLUMNS
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        batch_filepaths = iter_trajectory_csv_batches(
+            trajectory_filepath, Path(temporary_directory) / "batch.csv", chunk_size=chunk_size
+        )
+        while True:
+            with profiler.stage("parsing"):
+                batch_filepath = next(batch_filepaths, None)
+                if batch_filepath is None:
+                    break
+                cell_trajectories = TrajectoryCSVParser(batch_filepath, framerate, pixelsize)
+                track_ids, data = load_trajectory_columns(batch_filepath, columns=columns)
+            with profiler.stage("estimate_cell_count"):
+                frame_counts = _add_frame_counts(frame_counts, data["t"])
+            with profiler.stage("compute_summary_statistics"):
+                dataframe = pd.DataFrame(cell_trajectories.compute_summary_statistics())
+            if morphology:
+                with profiler.stage("compute_morphology_summaries"):
+                    dataframe = _add_morphology_summaries(dataframe, track_ids, data)
+            dataframes.append(dataframe)
+
+    cell_count = round(frame_counts[frame_counts > 0].mean())
+    return pd.concat(dataframes, ignore_index=True), cell_count
+
+
+def _add_frame_counts(frame_counts, t):
+    """Add the number of positions in each frame of a chunk to the counts of previous chunks."""
+    counts = np.bincount(t, minlength=frame_counts.size)
+    counts[: frame_counts.size] += frame_counts
+    return counts
+
+
+def iter_well_motility_metrics(trajectory_filepaths, num_jobs=1, **well_kwargs):
+    """Yield the summary motility metrics of each well in the same order as `trajectory_filepaths`.
+
+    Wells are distributed across `num_jobs` worker processes if `num_jobs > 1`. Results are
+    yielded one well at a time such that they can be consumed as they arrive.
+    """
+    compute_metrics = partial(compute_well_motility_metrics, **well_kwargs)
+    if num_jobs > 1:
+        with ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            # `Executor.map` yields results in the order of its inputs, preserving well order
+            yield from tqdm(
+                executor.map(compute_metrics, trajectory_filepaths),
+                total=len(trajectory_filepaths),
+            )
+    else:
+        yield from tqdm(map(compute_metrics, trajectory_filepaths), total=len(trajectory_filepaths))
+
+
+def fingerprint_well(trajectory_filepath, code_version, **well_kwargs):
+    """Fingerprint of everything the motility metrics of a well depend on (see `MetricsCache`).
+
+    The fingerprint combines the content hash of the cell trajectories of the well, its
+    experimental parameters, the acquisition parameters, and the code version.
+    """
+    well_id = trajectory_filepath.name.split("_")[0]
+    fingerprint = {
+        "input_hash": hash_trajectory_input(trajectory_filepath),
+        "well_parameters": well_kwargs["experimental_parameters"][well_id],
+        "framerate": well_kwargs["framerate"],
+        "pixelsize": well_kwargs["pixelsize"],
+        "hours_in_drug": well_kwargs["hours_in_drug"],
+        "code_version": code_version,
+    }
+    if well_kwargs.get("morphology", False):
+        fingerprint["morphology"] = True
+    return fingerprint
+
+
+def iter_cached_well_motility_metrics(
+    trajectory_filepaths,
+    cache_directory,
+    num_jobs=1,
+    **well_kwargs,
+):
+    """Yield the summary motility metrics of each well, recomputing only wells that have changed.
+
+    Each well is fingerprinted by the content hash of its cell trajectories, its experimental
+    parameters, the acquisition parameters, and the code version. Wells whose fingerprint matches
+    the manifest of the cache are loaded from the cache; the rest are computed (in parallel if
+    requested) and cached. Results are yielded in the same order as `trajectory_filepaths`.
+
+    If `well_kwargs` includes `profile=True`, each result is a tuple of the dataframe and its
+    profiling records (as returned by `compute_well_motility_metrics`), including the time spent
+    reading from or writing to the cache.
+    """
+    cache = MetricsCache(cache_directory)
+    profile = well_kwargs.get("profile", False)
+    code_version = get_code_version(
+        METRICS_SOURCE_FILEPATHS, well_kwargs.get("engine", "swimtracker")
+    )
+
+    # fingerprint each well to determine which are out of date
+    fingerprints = {
+        trajectory_filepath: fingerprint_well(trajectory_filepath, code_version, **well_kwargs)
+        for trajectory_filepath in trajectory_filepaths
+    }
+    is_stale = {
+        trajectory_filepath: not cache.is_current(trajectory_filepath.stem, fingerprint)
+        for trajectory_filepath, fingerprint in fingerprints.items()
+    }
+    stale_filepaths = [filepath for filepath in trajectory_filepaths if is_stale[filepath]]
+    print(
+        f"Recomputing motility metrics for {len(stale_filepaths)} of {len(trajectory_filepaths)} "
+        "wells (others are cached)."
+    )
+
+    # stale wells are computed in order, so their results line up with `trajectory_filepaths`
+    computed_motility_metrics = iter_well_motility_metrics(
+        stale_filepaths, num_jobs=num_jobs, **well_kwargs
+    )
+    try:
+        for trajectory_filepath, fingerprint in fingerprints.items():
+            well_name = trajectory_filepath.stem
+            profiler = StageProfiler(well_ID=trajectory_filepath.name.split("_")[0])
+            if is_stale[trajectory_filepath]:
+                result = next(computed_motility_metrics)
+                dataframe, profile_records = result if profile else (result, [])
+                with profiler.stage("save_cache"):
+                    cache.save(well_name, dataframe, fingerprint)
+            else:
+                profile_records = []
+                with profiler.stage("load_cache") as labels:
+                    dataframe = cache.load(well_name)
+                    labels["num_tracks"] = len(dataframe)
+            yield (dataframe, profile_records + profiler.records) if profile else dataframe
+    finally:
+        # record progress even if the run is interrupted
+        cache.write_manifest()
+
+
+def filter_motility_metrics(dataframe, time_threshold, distance_threshold):
+    """Discard trajectories with a duration or distance traversed shorter than the thresholds."""
+    dataframe = dataframe.drop("cell_id", axis=1)
+    dataframe_filtered = dataframe.loc[
+        (dataframe["total_time"] >= time_threshold)
+        & (dataframe["total_distance"] >= distance_threshold)
+    ]
+    return dataframe_filtered
+
+
+def write_parquet_partition(dataframe, dataset_directory, well_id):
+    """Write the motility metrics of a single well to a Parquet dataset partitioned by well ID.
+
+    Partitions follow the hive layout (`well_ID=<well_id>/`) such that the full dataset can be
+    read back with `pandas.read_parquet(dataset_directory)`. Writing a well a second time
+    overwrites its partition rather than appending to it, and a well without any motility metrics
+    (e.g. none of its trajectories pass the thresholds) has its partition removed, such that no
+    stale results of a previous run are left behind.
+    """
+    partition_directory = dataset_directory / f"well_ID={well_id}"
+    if dataframe.empty:
+        shutil.rmtree(partition_directory, ignore_errors=True)
+        return
+    partition_directory.mkdir(exist_ok=True, parents=True)
+    dataframe.drop("well_ID", axis=1).to_parquet(
+        partition_directory / "part-0.parquet", index=False
+    )
+
+
+def collect_profile_records(well_motility_metrics, profiler):
+    """Yield the motility metrics of each well, moving its profiling records to `profiler`."""
+    for dataframe, profile_records in well_motility_metrics:
+        profiler.records.extend(profile_records)
+        yield dataframe
+
+
+def write_profile_report(profile_records, profile_json_file, **run_info):
+    """Write profiling records to a JSON report and print the slowest stages and wells."""
+    report = {
+        **run_info,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "records": profile_records,
+    }
+    profile_json_file.write_text(json.dumps(report, indent=4))
+
+    stage_summary, well_summary = summarize_hotspots(profile_records)
+    print(f"Total wall time: {run_info['total_seconds']:.2f} s")
+    print("\nWall time (s) per stage:")
+    print(stage_summary.to_string(float_format="{:.3f}".format))
+    print("\nSlowest wells:")
+    print(well_summary.to_string(float_format="{:.3f}".format))
+    print(f"\nProfiling report written to '{profile_json_file}'.")
+
+
+@profile_option
+@cache_directory_option
+@morphology_option
+@chunk_size_option
+@store_directory_option
+@engine_option
+@output_format_option
+@num_jobs_option
 @trajectory_distance_threshold_option
 @trajectory_time_threshold_option
 @output_directory_option
 @input_json_option
 @input_directory_option
 @click.command()
-def main(input_directory, input_json_file, output_directory, time_threshold, distance_threshold):
+def main(
+    input_directory,
+    input_json_file,
+    output_directory,
+    time_threshold,
+    distance_threshold,
+    num_jobs,
+    output_format,
+    engine,
+    store_directory,
+    chunk_size,
+    morphology,
+    cache_directory,
+    profile,
+):
     """Script for computing summary motility metrics from cell trajectory data.
 
     Parses cell trajectory coordinates from CSV files and computes a variety of motility metrics
@@ -84,11 +583,37 @@ def main(input_directory, input_json_file, output_directory, time_threshold, dis
     shorter than `time_threshold` or distance traversed shorter than `distance_threshold` are
     discarded.
 
+    CSV files can be processed in parallel across `num_jobs` worker processes, in which case the
+    results are reassembled in the same (natural) sort order of the CSV files such that the output
+    is identical to that of a serial run. Motility metrics are filtered and written out one well at
+    a time such that memory usage does not grow with the number of wells.
+
+    The 'vectorized' engine computes the motility metrics of all trajectories in a well at once
+    rather than one trajectory at a time, and can read cell trajectories from a columnar trajectory
+    store (see `convert_trajectory_csvs.py`) to skip parsing the CSV files altogether. It only
+    computes the metrics it reproduces exactly (`motility_metrics.VECTORIZED_COLUMNS`, see
+    `check_engine_parity.py`); the turning-based metrics (`motility_metrics.TURNING_COLUMNS`) are
+    only computed by the 'swimtracker' engine.
+
+    With `--chunk-size`, either engine streams each CSV file in chunks of whole tracks, for CSV
+    files too large to load at once, with the same motility metrics as reading each file at once.
+    With `--morphology`, either engine also summarizes the segmentation morphology of each
+    trajectory in additional columns of the same rows, leaving the motility metrics unchanged.
+
+    If a `cache_directory` is provided, the unfiltered motility metrics of each well are cached
+    alongside a manifest of their inputs, such that a re-run only recomputes the wells whose
+    inputs have changed.
+
+    With `--profile`, the wall time and peak memory usage of each stage (parsing, cell count
+    estimation, metric computation, assembly, and export) are recorded per well to help identify
+    the wells and stages that dominate the runtime.
+
     References
     ----------
     [1] https://doi.org/10.57844/arcadia-2d61-fb05
     """
     dataset_name = input_directory.parent.name
+    start_time = time.perf_counter()
 
     # handle missing file paths
     if not input_directory.exists():
@@ -99,13 +624,26 @@ def main(input_directory, input_json_file, output_directory, time_threshold, dis
         raise FileNotFoundError(msg)
     if not output_directory.exists():
         output_directory.mkdir(exist_ok=True, parents=False)
-    else:
-        output_csv_file = output_directory / f"{dataset_name}_summary-statistics.csv"
 
-    # collect CSV files to process
-    trajectory_csvs = natsorted(input_directory.glob("*.csv"))
-    if not trajectory_csvs:
-        msg = f"No CSV files found in '{input_directory}'."
+    if store_directory is not None and engine != "vectorized":
+        msg = "Reading from a trajectory store requires `--engine vectorized`."
+        raise click.UsageError(msg)
+    if chunk_size is not None and store_directory is not None:
+        msg = "Streaming CSV files in chunks cannot be combined with a trajectory store."
+        raise click.UsageError(msg)
+
+    # collect CSV files (or their counterparts in the trajectory store) to process
+    if store_directory is not None:
+        if not store_directory.exists():
+            msg = f"Trajectory store not found: '{store_directory}'."
+            raise FileNotFoundError(msg)
+        trajectory_filepaths = natsorted(
+            directory for directory in store_directory.glob("*") if directory.is_dir()
+        )
+    else:
+        trajectory_filepaths = natsorted(input_directory.glob("*.csv"))
+    if not trajectory_filepaths:
+        msg = f"No cell trajectories found in '{store_directory or input_directory}'."
         raise FileNotFoundError(msg)
 
     # load experimental parameters
@@ -114,43 +652,66 @@ def main(input_directory, input_json_file, output_directory, time_threshold, dis
     pixelsize = experimental_parameters[dataset_name]["pixelsize"]
     hours_in_drug = experimental_parameters[dataset_name]["hours_in_drug"]
 
-    # initialize dataframe of summary motility metrics
-    motility_metrics_dataframe = pd.DataFrame()
-
-    for csv_filepath in tqdm(trajectory_csvs):
-        # extract well ID from CSV filename
-        well_id = csv_filepath.name.split("_")[0]
-
-        # parse motility data from CSV
-        cell_trajectories = TrajectoryCSVParser(csv_filepath, framerate, pixelsize)
-
-        # estimate cell count and compute motility measurements for a batch of cell trajectories
-        cell_count = cell_trajectories.estimate_cell_count()
-        motility_metrics = cell_trajectories.compute_summary_statistics()
-        dataframe = pd.DataFrame(motility_metrics)
-
-        # build up dataframe
-        dataframe["cell_count"] = cell_count
-        dataframe["strain"] = experimental_parameters[well_id]["strain"]
-        dataframe["drug"] = experimental_parameters[well_id]["drug"]
-        dataframe["hours_in_drug"] = hours_in_drug
-        dataframe["concentration"] = experimental_parameters[well_id]["concentration"]
-        dataframe["well_ID"] = well_id
-
-        # concatenate batch of motility metrics
-        motility_metrics_dataframe = pd.concat([motility_metrics_dataframe, dataframe])
+    # compute summary motility metrics for each well (in parallel if requested)
+    well_kwargs = {
+        "num_jobs": num_jobs,
+        "framerate": framerate,
+        "pixelsize": pixelsize,
+        "hours_in_drug": hours_in_drug,
+        "experimental_parameters": experimental_parameters,
+        "engine": engine,
+        "chunk_size": chunk_size,
+        "morphology": morphology,
+        "profile": profile,
+    }
+    if cache_directory is not None:
+        well_motility_metrics = iter_cached_well_motility_metrics(
+            trajectory_filepaths, cache_directory, **well_kwargs
+        )
+    else:
+        well_motility_metrics = iter_well_motility_metrics(trajectory_filepaths, **well_kwargs)
 
-    # clean up dataframe and apply thresholds
-    motility_metrics_dataframe = motility_metrics_dataframe.drop("cell_id", axis=1).reset_index(
-        drop=True
-    )
-    motility_metrics_dataframe_filtered = motility_metrics_dataframe.loc[
-        (motility_metrics_dataframe["total_time"] >= time_threshold)
-        & (motility_metrics_dataframe["total_distance"] >= distance_threshold)
+    # collect profiling records of each well as its motility metrics become available
+    profiler = StageProfiler()
+    if profile:
+        well_motility_metrics = collect_profile_records(well_motility_metrics, profiler)
+    well_ids = [
+        trajectory_filepath.name.split("_")[0] for trajectory_filepath in trajectory_filepaths
     ]
 
-    # export to CSV
-    motility_metrics_dataframe_filtered.to_csv(output_csv_file, index=False)
+    # apply thresholds and export each well as soon as its motility metrics are available
+    if output_format == "csv":
+        output_csv_file = output_directory / f"{dataset_name}_summary-statistics.csv"
+        with output_csv_file.open("w", newline="") as csv_file:
+            for i, (well_id, dataframe) in enumerate(
+                zip(well_ids, well_motility_metrics, strict=True)
+            ):
+                with profiler.stage("export", well_ID=well_id):
+                    dataframe_filtered = filter_motility_metrics(
+                        dataframe, time_threshold, distance_threshold
+                    )
+                    dataframe_filtered.to_csv(csv_file, header=(i == 0), index=False)
+    else:
+        # start from an empty dataset such that wells from a previous run are not left behind
+        output_parquet_directory = output_directory / f"{dataset_name}_summary-statistics"
+        shutil.rmtree(output_parquet_directory, ignore_errors=True)
+        output_parquet_directory.mkdir()
+        for well_id, dataframe in zip(well_ids, well_motility_metrics, strict=True):
+            with profiler.stage("export", well_ID=well_id):
+                dataframe_filtered = filter_motility_metrics(
+                    dataframe, time_threshold, distance_threshold
+                )
+                write_parquet_partition(dataframe_filtered, output_parquet_directory, well_id)
+
+    if profile:
+        write_profile_report(
+            profiler.records,
+            output_directory / f"{dataset_name}_profile.json",
+            engine=engine,
+            num_jobs=num_jobs,
+            num_wells=len(trajectory_filepaths),
+            total_seconds=time.perf_counter() - start_time,
+        )
 
 
 if __name__ == "__main__":
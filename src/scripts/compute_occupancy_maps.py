@@ -0,0 +1,196 @@
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import click
+from compute_motility_metrics import (
+    DEFAULT_INPUT_DIRECTORY,
+    DEFAULT_INPUT_JSON_FILE,
+    DEFAULT_OUTPUT_DIRECTORY,
+)
+from natsort import natsorted
+from tqdm import tqdm
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from occupancy import compute_occupancy
+from trajectory_store import CHUNK_SIZE
+
+
+def parse_image_shape(context, parameter, value):
+    """Parse an image shape given as 'height,width' (in pixels)."""
+    try:
+        height, width = (int(size) for size in value.split(","))
+    except ValueError as error:
+        msg = f"Expected two comma-separated integers 'height,width', got '{value}'."
+        raise click.BadParameter(msg) from error
+    return (height, width)
+
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory of CSV files of cell trajectories.",
+)
+
+input_json_option = click.option(
+    "--json",
+    "input_json_file",
+    type=Path,
+    default=DEFAULT_INPUT_JSON_FILE,
+    show_default=True,
+    help=(
+        "File path to JSON file that maps each file in a dataset to a set of experimental "
+        "parameters."
+    ),
+)
+
+output_directory_option = click.option(
+    "--output-directory",
+    "output_directory",
+    type=Path,
+    default=DEFAULT_OUTPUT_DIRECTORY,
+    show_default=True,
+    help="File path to the directory in which to create the directory of occupancy files.",
+)
+
+store_directory_option = click.option(
+    "--store-directory",
+    "store_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to a columnar trajectory store created by `convert_trajectory_csvs.py`. If "
+        "provided, cell trajectories are read from the store instead of from CSV files."
+    ),
+)
+
+image_shape_option = click.option(
+    "--image-shape",
+    "image_shape",
+    default="1152,1152",
+    show_default=True,
+    callback=parse_image_shape,
+    help="Shape of the field of view given as 'height,width' (in pixels).",
+)
+
+bin_size_option = click.option(
+    "--bin-size",
+    "bin_size",
+    type=click.FloatRange(min=0, min_open=True),
+    default=20.0,
+    show_default=True,
+    help="Width (in microns) of the square bins of the density maps.",
+)
+
+chunk_size_option = click.option(
+    "--chunk-size",
+    "chunk_size",
+    type=click.IntRange(min=1),
+    default=CHUNK_SIZE,
+    show_default=True,
+    help="Number of rows of cell trajectory data read at a time.",
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes over which to distribute the wells.",
+)
+
+
+def save_well_occupancy(trajectory_filepath, occupancy_directory, **occupancy_kwargs):
+    """Compute the occupancy of a well and save it to a .npz file named after its well ID."""
+    well_id = trajectory_filepath.name.split("_")[0]
+    occupancy = compute_occupancy(trajectory_filepath, **occupancy_kwargs)
+    occupancy.save(occupancy_directory / f"{well_id}.npz")
+
+
+@num_jobs_option
+@chunk_size_option
+@bin_size_option
+@image_shape_option
+@store_directory_option
+@output_directory_option
+@input_json_option
+@input_directory_option
+@click.command()
+def main(
+    input_directory,
+    input_json_file,
+    output_directory,
+    store_directory,
+    image_shape,
+    bin_size,
+    chunk_size,
+    num_jobs,
+):
+    """Script for computing the per-frame cell counts and spatial density maps of each well.
+
+    Streams the cell trajectory data of each well in chunks of `chunk_size` rows and accumulates
+    the number of tracked cells in each frame and a 2-D histogram of cell positions (in microns)
+    over a fixed grid of `bin_size` bins, which reveal crowding, cells hugging the edges, and
+    cells settling over the acquisition. Memory usage is independent of the size of the wells.
+
+    Outputs one compressed .npz file per well (named by well ID) with the arrays `frame_counts`,
+    `density`, `x_edges`, `y_edges`, and `num_outside` (number of positions outside the field of
+    view); see `occupancy.load_occupancy`.
+    """
+    dataset_name = input_directory.parent.name
+
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+    if not input_json_file.exists():
+        msg = f"Input json file for experimental parameters not found: '{input_json_file}'."
+        raise FileNotFoundError(msg)
+    occupancy_directory = output_directory / f"{dataset_name}_occupancy"
+    occupancy_directory.mkdir(exist_ok=True, parents=True)
+
+    if store_directory is not None:
+        if not store_directory.exists():
+            msg = f"Trajectory store not found: '{store_directory}'."
+            raise FileNotFoundError(msg)
+        trajectory_filepaths = natsorted(
+            directory for directory in store_directory.glob("*") if directory.is_dir()
+        )
+    else:
+        trajectory_filepaths = natsorted(input_directory.glob("*.csv"))
+    if not trajectory_filepaths:
+        msg = f"No cell trajectories found in '{store_directory or input_directory}'."
+        raise FileNotFoundError(msg)
+
+    experimental_parameters = json.loads(input_json_file.read_text())
+    save_occupancy = partial(
+        save_well_occupancy,
+        occupancy_directory=occupancy_directory,
+        image_shape=image_shape,
+        pixelsize=experimental_parameters[dataset_name]["pixelsize"],
+        bin_size=bin_size,
+        chunk_size=chunk_size,
+    )
+    if num_jobs > 1:
+        with ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            list(
+                tqdm(
+                    executor.map(save_occupancy, trajectory_filepaths),
+                    total=len(trajectory_filepaths),
+                )
+            )
+    else:
+        for trajectory_filepath in tqdm(trajectory_filepaths):
+            save_occupancy(trajectory_filepath)
+
+    print(f"Occupancy of {len(trajectory_filepaths)} wells written to: {occupancy_directory}")
+
+
+if __name__ == "__main__":
+    main()
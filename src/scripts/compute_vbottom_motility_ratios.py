@@ -0,0 +1,269 @@
+import shutil
+import sys
+import tempfile
+import zipfile
+from itertools import islice
+from pathlib import Path, PurePosixPath
+
+import click
+import cv2
+import numpy as np
+import pandas as pd
+from create_vbottom_gifs import extract_timestamp
+from tqdm import tqdm
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+import vbottom
+
+REPO_ROOT_DIRPATH = Path(__file__).parents[2]
+DEFAULT_ZIPFOLDER_FILEPATH = (
+    REPO_ROOT_DIRPATH / "data/vbottom_motility_assay/vbottom_motility_strains.zip"
+)
+DEFAULT_OUTPUT_CSV_FILEPATH = REPO_ROOT_DIRPATH / "results/vbottom_motility-ratios.csv"
+
+
+def parse_crop(context, parameter, value):
+    """Parse a crop box given as 'top,bottom,left,right' (in pixels)."""
+    if value is None:
+        return None
+    try:
+        top, bottom, left, right = (int(bound) for bound in value.split(","))
+    except ValueError as error:
+        msg = f"Expected four comma-separated integers 'top,bottom,left,right', got '{value}'."
+        raise click.BadParameter(msg) from error
+    return (slice(top, bottom), slice(left, right))
+
+
+zipfolder_filepath_option = click.option(
+    "--zipfolder",
+    "zipfolder_filepath",
+    type=Path,
+    default=DEFAULT_ZIPFOLDER_FILEPATH,
+    show_default=True,
+    help="Filepath location to zip folder of AVI files.",
+)
+
+output_csv_filepath_option = click.option(
+    "--output",
+    "output_csv_filepath",
+    type=Path,
+    default=DEFAULT_OUTPUT_CSV_FILEPATH,
+    show_default=True,
+    help="Filepath location for where to output the CSV file of motility ratios.",
+)
+
+num_rows_option = click.option(
+    "--num-rows",
+    "num_rows",
+    type=click.IntRange(min=1),
+    default=6,
+    show_default=True,
+    help="Number of rows of wells within the (cropped) frames.",
+)
+
+num_cols_option = click.option(
+    "--num-cols",
+    "num_cols",
+    type=click.IntRange(min=1),
+    default=12,
+    show_default=True,
+    help="Number of columns of wells within the (cropped) frames.",
+)
+
+scan_width_option = click.option(
+    "--scan-width",
+    "scan_width",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Width (in pixels) of the band over which the intensity profile of each well is averaged.",
+)
+
+crop_option = click.option(
+    "--crop",
+    "crop",
+    type=str,
+    default=None,
+    callback=parse_crop,
+    help=(
+        "Region of each frame spanned by the grid of wells, given as 'top,bottom,left,right' (in "
+        "pixels). Defaults to the full frame."
+    ),
+)
+
+well_grid_option = click.option(
+    "--well-grid",
+    "well_grid_filepath",
+    type=Path,
+    default=None,
+    help=(
+        "Filepath location to a JSON file of the grid of wells. If the file exists, the grid is "
+        "loaded from it; otherwise the grid is detected from the first (cropped) frame and saved "
+        "to it for reuse by later runs on the same plate setup. Defaults to wells spaced evenly "
+        "across the frame."
+    ),
+)
+
+batch_size_option = click.option(
+    "--batch-size",
+    "batch_size",
+    type=click.IntRange(min=1),
+    default=64,
+    show_default=True,
+    help="Number of frames held in memory and profiled at once.",
+)
+
+
+def is_video_member(member_name):
+    """Whether a member of a zip folder is an AVI file (excluding macOS resource forks)."""
+    member_path = PurePosixPath(member_name)
+    return (
+        member_path.suffix == ".avi"
+        and not member_path.name.startswith("._")
+        and "__MACOSX" not in member_path.parts
+    )
+
+
+def iter_zipped_video_frames(zipfolder_filepath):
+    """Yield the frames of every AVI file in a zip folder, one frame at a time.
+
+    Videos are read in chronological order of the timestamps in their file names. Rather than
+    extracting the whole zip folder, each video is copied to a temporary file one at a time (as
+    OpenCV can only decode videos from a file) and deleted once all its frames have been read, so
+    neither memory nor disk usage grows with the number of videos.
+
+    Yields
+    ------
+    video_name : str
+        Name of the AVI file within the zip folder.
+    elapsed_seconds : int
+        Time elapsed between the start of the first video and the start of this video.
+    frame_index : int
+        Index of the frame within the video.
+    frame : (H, W) uint8 array
+        Grayscale frame.
+    """
+    with zipfile.ZipFile(zipfolder_filepath, "r") as zip_ref:
+        member_names = [name for name in zip_ref.namelist() if is_video_member(name)]
+        if not member_names:
+            msg = f"No .avi files found in '{zipfolder_filepath}'."
+            raise FileNotFoundError(msg)
+        member_names.sort(key=lambda name: extract_timestamp(PurePosixPath(name)))
+        base_time = extract_timestamp(PurePosixPath(member_names[0]))
+
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            video_filepath = Path(temporary_directory) / "video.avi"
+            for member_name in tqdm(member_names):
+                elapsed_seconds = extract_timestamp(PurePosixPath(member_name)) - base_time
+                with zip_ref.open(member_name) as source, video_filepath.open("wb") as target:
+                    shutil.copyfileobj(source, target)
+
+                cap = cv2.VideoCapture(str(video_filepath))
+                frame_index = 0
+                while cap.isOpened():
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    yield PurePosixPath(member_name).name, elapsed_seconds, frame_index, frame
+                    frame_index += 1
+                cap.release()
+
+
+def iter_batches(iterable, batch_size):
+    """Yield lists of up to `batch_size` consecutive items from an iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+@batch_size_option
+@well_grid_option
+@crop_option
+@scan_width_option
+@num_cols_option
+@num_rows_option
+@output_csv_filepath_option
+@zipfolder_filepath_option
+@click.command()
+def main(
+    zipfolder_filepath,
+    output_csv_filepath,
+    num_rows,
+    num_cols,
+    scan_width,
+    crop,
+    well_grid_filepath,
+    batch_size,
+):
+    """Script for computing a time series of the motility ratio of each well of a v-bottom plate.
+
+    Streams the frames of the AVI files of a v-bottom motility assay straight from the zip folder
+    and computes the pellet-to-periphery intensity ratio ("motility ratio") of each well in each
+    frame, using the same intensity profiles as `vbottom.get_well_intensity_profiles`. Frames are
+    profiled in batches of `batch_size` and the motility ratios of each batch are appended to the
+    output CSV file straight away, such that memory usage is bounded by the batch size rather than
+    the length of the time lapse.
+
+    Outputs a tidy CSV file with one row per well and frame with the columns: video, seconds
+    (elapsed since the first video), frame, well (index in row-major order), row, column, and
+    motility_ratio.
+
+    With `--well-grid`, the positions of the wells are detected from the first frame (see
+    `vbottom.detect_well_grid`) rather than assumed to be spaced evenly across the frame, and the
+    detected grid is cached in a JSON file such that detection only runs once per plate setup.
+    """
+    if not zipfolder_filepath.exists():
+        msg = f"Zip folder of AVI files not found: '{zipfolder_filepath}'."
+        raise FileNotFoundError(msg)
+    output_csv_filepath.parent.mkdir(exist_ok=True, parents=True)
+
+    well_rows, well_cols = np.divmod(np.arange(num_rows * num_cols), num_cols)
+    frames = iter_zipped_video_frames(zipfolder_filepath)
+    well_grid = None
+    if well_grid_filepath is not None and well_grid_filepath.exists():
+        well_grid = vbottom.load_well_grid(well_grid_filepath)
+
+    with output_csv_filepath.open("w", newline="") as csv_file:
+        for i, batch in enumerate(iter_batches(frames, batch_size)):
+            video_names, elapsed_seconds, frame_indices, images = zip(*batch, strict=True)
+            if crop is not None:
+                images = [image[crop] for image in images]
+            images = np.stack(images)
+
+            if well_grid_filepath is not None and well_grid is None:
+                well_grid = vbottom.detect_well_grid(images[0], num_rows, num_cols)
+                vbottom.save_well_grid(well_grid, well_grid_filepath)
+                print(f"Grid of wells detected and written to: {well_grid_filepath}")
+
+            _, intensity_profiles = vbottom.get_batched_well_intensity_profiles(
+                images,
+                num_rows,
+                num_cols,
+                scan_width=scan_width,
+                normalize=False,
+                well_grid=well_grid,
+            )
+            motility_ratios = vbottom.compute_motility_ratios(intensity_profiles)
+
+            # tidy (long-form) table with one row per frame and well
+            num_frames, num_wells = motility_ratios.shape
+            dataframe = pd.DataFrame(
+                {
+                    "video": np.repeat(video_names, num_wells),
+                    "seconds": np.repeat(elapsed_seconds, num_wells),
+                    "frame": np.repeat(frame_indices, num_wells),
+                    "well": np.tile(np.arange(num_wells), num_frames),
+                    "row": np.tile(well_rows, num_frames),
+                    "column": np.tile(well_cols, num_frames),
+                    "motility_ratio": motility_ratios.ravel(),
+                }
+            )
+            dataframe.to_csv(csv_file, header=(i == 0), index=False)
+
+    print(f"Motility ratios written to: {output_csv_filepath}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+import click
+from natsort import natsorted
+from tqdm import tqdm
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from trajectory_store import convert_trajectory_csv
+
+REPO_ROOT_DIRECTORY = Path(__file__).parents[2]
+DEFAULT_INPUT_DIRECTORY = REPO_ROOT_DIRECTORY / "data/single-cell-motility-assay/cell_trajectories/"
+DEFAULT_STORE_DIRECTORY = DEFAULT_INPUT_DIRECTORY.parent / "trajectory_store"
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory of CSV files of cell trajectories.",
+)
+
+store_directory_option = click.option(
+    "--store-directory",
+    "store_directory",
+    type=Path,
+    default=DEFAULT_STORE_DIRECTORY,
+    show_default=True,
+    help="File path to directory in which to write the columnar trajectory store.",
+)
+
+
+@store_directory_option
+@input_directory_option
+@click.command()
+def main(input_directory, store_directory):
+    """Script for converting CSV files of cell trajectories to a columnar trajectory store.
+
+    Each CSV file is converted to a directory of memory-mappable `.npy` files, one per column,
+    with the rows sorted by track ID and an offset index marking where each track starts and ends.
+    This is a one-time conversion that removes the cost of parsing the CSV files from every
+    subsequent computation of motility metrics.
+    """
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+
+    trajectory_csvs = natsorted(input_directory.glob("*.csv"))
+    if not trajectory_csvs:
+        msg = f"No CSV files found in '{input_directory}'."
+        raise FileNotFoundError(msg)
+
+    store_directory.mkdir(exist_ok=True, parents=True)
+    for csv_filepath in tqdm(trajectory_csvs):
+        convert_trajectory_csv(csv_filepath, store_directory)
+
+
+if __name__ == "__main__":
+    main()
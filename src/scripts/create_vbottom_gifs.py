@@ -1,5 +1,10 @@
+import functools
+import queue
 import re
+import threading
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from pathlib import Path
 
@@ -7,13 +12,19 @@ import click
 import cv2
 import imageio
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont
 
 REPO_ROOT_DIRPATH = Path(__file__).parents[2]
 DEFAULT_ZIPFOLDER_FILEPATH = (
     REPO_ROOT_DIRPATH / "data/vbottom_motility_assay/vbottom_motility_strains.zip"
 )
 DEFAULT_OUTPUT_GIF_FILEPATH = REPO_ROOT_DIRPATH / "results/vbottom_strain_output_video.gif"
+# Maximum number of decoded frames buffered per video awaiting the encoder
+FRAME_BUFFER_SIZE = 16
+# Font and position of the timestamp overlaid onto each frame
+FONT_PATH = "/Library/Fonts/Arial.ttf"
+FONT_SIZE = 32
+TEXT_POSITION = (10, 10)
 
 zipfolder_filepath_option = click.option(
     "--zipfolder",
@@ -39,23 +50,77 @@ output_gif_filepath_option = click.option(
     type=Path,
     default=DEFAULT_OUTPUT_GIF_FILEPATH,
     show_default=True,
-    help="Filepath location for where to output GIF.",
+    help=(
+        "Filepath location for where to output GIF. Other file extensions (e.g. '.mp4') are "
+        "written as video with imageio's default writer for that format."
+    ),
 )
 
+frame_stride_option = click.option(
+    "--frame-stride",
+    "frame_stride",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Keep only every n-th frame (counted across all videos).",
+)
 
-def add_timestamp(img, timestamp):
-    pil_img = Image.fromarray(img)
-    draw = ImageDraw.Draw(pil_img)
-    font_path = "/Library/Fonts/Arial.ttf"
-    font_size = 32
+scale_option = click.option(
+    "--scale",
+    "scale",
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    default=1.0,
+    show_default=True,
+    help="Factor by which to downscale frames before adding timestamps and encoding.",
+)
+
+num_workers_option = click.option(
+    "--workers",
+    "num_workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of threads for decoding and annotating videos concurrently.",
+)
+
+
+@functools.cache
+def load_timestamp_font():
+    """Load the font for timestamps once, falling back to Pillow's default font."""
     try:
-        font = ImageFont.truetype(font_path, font_size)
+        return ImageFont.truetype(FONT_PATH, FONT_SIZE)
     except OSError:
-        font = ImageFont.load_default(font_size)
-    text_position = (10, 10)
-    text_color = (255, 255, 255)
-    draw.text(text_position, timestamp, font=font, fill=text_color)
-    return np.array(pil_img)
+        return ImageFont.load_default(FONT_SIZE)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_timestamp_mask(timestamp):
+    """Rasterize a timestamp into an alpha mask once, caching it for subsequent frames."""
+    font = load_timestamp_font()
+    _, _, right, bottom = font.getbbox(timestamp)
+    mask = Image.new("L", (right, bottom))
+    ImageDraw.Draw(mask).text((0, 0), timestamp, font=font, fill=255)
+    mask = np.asarray(mask, dtype=np.uint16)
+    mask.flags.writeable = False
+    return mask
+
+
+def add_timestamp(img, timestamp):
+    """Overlay a timestamp in white onto the top left corner of a frame (in place).
+
+    The timestamp is rasterized once into an alpha mask (see `get_timestamp_mask`), which is then
+    blended into the frame with NumPy, such that frames never need to be converted to PIL images.
+    """
+    mask = get_timestamp_mask(timestamp)
+    x, y = TEXT_POSITION
+    region = img[y : y + mask.shape[0], x : x + mask.shape[1]]
+    alpha = mask[: region.shape[0], : region.shape[1]]
+    if region.ndim == 3:
+        alpha = alpha[..., np.newaxis]
+
+    # Alpha blend white text: region + (255 - region) * alpha / 255, rounded to nearest
+    region[...] = region + ((255 - region) * alpha + 127) // 255
+    return img
 
 
 def extract_timestamp(filename):
@@ -66,43 +131,165 @@ def extract_timestamp(filename):
         raise ValueError(f"No numeric timestamp found in filename: {filename}")
 
 
-def process_videos(input_folder, output_gif):
-    video_files = sorted(input_folder.glob("*.avi"))
-    if not video_files:
-        print("No .avi files found in the directory.")
-        return
+class StreamingGifWriter:
+    """Writer of animated GIFs that encodes each frame to disk as soon as it is appended.
 
-    video_files.sort(key=extract_timestamp)
+    `imageio.mimsave` (like Pillow's `save_all`) holds every frame in memory until the GIF is
+    written. Instead, each frame is converted to an adaptive palette and encoded with Pillow's GIF
+    encoding helpers immediately, with its own local color table.
+    """
 
-    print(f"Processing {len(video_files)} files...")
+    def __init__(self, filepath, fps=20, loop=0):
+        self.file = Path(filepath).open("wb")
+        self.duration = 1000 / fps
+        self.loop = loop
+        self.num_frames = 0
 
-    gif_frames = []
-    base_time = extract_timestamp(video_files[0])
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append_data(self, frame):
+        image = Image.fromarray(frame).convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+        if self.num_frames == 0:
+            header, _ = GifImagePlugin.getheader(
+                image, info={"loop": self.loop, "duration": self.duration}
+            )
+            self.file.write(b"".join(header))
+        frame_data = GifImagePlugin.getdata(image, duration=self.duration, include_color_table=True)
+        self.file.write(b"".join(frame_data))
+        self.num_frames += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(b";")  # GIF trailer
+            self.file.close()
+
+
+def get_frame_writer(output_filepath, fps=20):
+    """Get a writer that encodes frames to the output file as they are appended."""
+    if output_filepath.suffix.lower() == ".gif":
+        return StreamingGifWriter(output_filepath, fps=fps)
+    return imageio.get_writer(output_filepath, fps=fps)
+
+
+def get_frame_count(filename):
+    """Get the number of frames in a video from its header."""
+    cap = cv2.VideoCapture(filename)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frame_count
+
+
+def decode_video(filename, timestamp, first_frame_index, frame_stride, scale, frames, stop):
+    """Decode, downscale, and timestamp the frames of a video, putting each onto a queue.
+
+    `first_frame_index` is the index of the first frame of the video across all videos, such that
+    the frame stride is applied consistently across videos. Blocks while the queue is full, and
+    stops early once `stop` is set. A sentinel (None) is put onto the queue when done.
+    """
 
-    for filename in video_files:
-        current_time = extract_timestamp(filename)
-        timestamp_diff = current_time - base_time
-        timestamp = str(timedelta(seconds=timestamp_diff))
+    def put(item):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    frame_index = first_frame_index
+    cap = cv2.VideoCapture(filename)
+    try:
+        while cap.isOpened() and not stop.is_set():
+            # Skip (without decoding) frames that are dropped by the frame stride
+            if frame_index % frame_stride != 0:
+                frame_index += 1
+                if not cap.grab():
+                    break
+                continue
 
-        cap = cv2.VideoCapture(filename)
-        while cap.isOpened():
             ret, frame = cap.read()
             if not ret:
                 break
-            frame_with_timestamp = add_timestamp(frame, timestamp)
-            gif_frames.append(frame_with_timestamp)
+            frame_index += 1
+            if scale != 1:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            put(add_timestamp(frame, timestamp))
+    finally:
         cap.release()
+        put(None)
+
+
+def process_videos(input_folder, output_gif, frame_stride=1, scale=1.0, num_workers=1):
+    video_files = sorted(input_folder.glob("*.avi"), key=extract_timestamp)
+    if not video_files:
+        print("No .avi files found in the directory.")
+        return
+
+    print(f"Processing {len(video_files)} files...")
+
+    base_time = extract_timestamp(video_files[0])
+    timestamps = [
+        str(timedelta(seconds=extract_timestamp(filename) - base_time)) for filename in video_files
+    ]
+
+    # Index of the first frame of each video across all videos (only needed for the frame stride)
+    first_frame_indices = [0] * len(video_files)
+    if frame_stride > 1:
+        frame_counts = [get_frame_count(filename) for filename in video_files]
+        first_frame_indices = np.cumsum([0, *frame_counts[:-1]]).tolist()
+
+    # Videos are decoded and annotated concurrently, each into its own bounded queue of frames.
+    # Queues are drained in timestamp order, and at most `2 * num_workers` videos are in flight at
+    # once, such that at most `2 * num_workers * FRAME_BUFFER_SIZE` frames are held in memory.
+    stop = threading.Event()
+    in_flight = deque()
+    video_args = iter(zip(video_files, timestamps, first_frame_indices, strict=True))
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+
+        def submit_next_video():
+            args = next(video_args, None)
+            if args is not None:
+                frames = queue.Queue(maxsize=FRAME_BUFFER_SIZE)
+                future = executor.submit(decode_video, *args, frame_stride, scale, frames, stop)
+                in_flight.append((future, frames))
+
+        try:
+            for _ in range(2 * num_workers):
+                submit_next_video()
+
+            # Encode each frame as soon as it is next in order
+            with get_frame_writer(output_gif, fps=20) as writer:
+                while in_flight:
+                    future, frames = in_flight.popleft()
+                    while (frame_with_timestamp := frames.get()) is not None:
+                        writer.append_data(frame_with_timestamp)
+                    # Re-raise any exception from decoding the video
+                    future.result()
+                    submit_next_video()
+        finally:
+            stop.set()
 
-    # Save as GIF
-    imageio.mimsave(output_gif, gif_frames, fps=20)
     print("GIF creation complete.")
 
 
+@num_workers_option
+@scale_option
+@frame_stride_option
 @output_gif_filepath_option
 @extracted_folder_filepath_option
 @zipfolder_filepath_option
 @click.command()
-def main(zipfolder_filepath, extracted_folder_filepath, output_gif_filepath):
+def main(
+    zipfolder_filepath,
+    extracted_folder_filepath,
+    output_gif_filepath,
+    frame_stride,
+    scale,
+    num_workers,
+):
     """This script processes a set of AVI video files, adds timestamps based on the file names,
     and combines them into an animated GIF for visualization.
 
@@ -111,10 +298,12 @@ def main(zipfolder_filepath, extracted_folder_filepath, output_gif_filepath):
         1. Timestamp Extraction: Extracts timestamps from video filenames using regex to calculate
         time differences between frames.
 
-        2. Video Processing: Reads each video file, applies a timestamp to each frame, and collects
-        frames for GIF creation.
+        2. Video Processing: Reads each video file, optionally drops (every `frame_stride`-th frame
+        is kept) and downscales (by `scale`) frames, and applies a timestamp to each frame. Videos
+        are processed concurrently across `num_workers` threads.
 
-        3. GIF Creation: Combines processed frames into a single animated GIF and saves the output.
+        3. GIF Creation: Encodes each processed frame into a single animated GIF as soon as it is
+        read, such that memory usage does not grow with the number of frames.
 
         4. ZIP File Handling: Extracts video files from a specified ZIP archive before processing.
 
@@ -140,7 +329,13 @@ def main(zipfolder_filepath, extracted_folder_filepath, output_gif_filepath):
 
     # Process the videos from the extracted folder
     print(f"Outputting GIF to: {output_gif_filepath}")
-    process_videos(extracted_folder_filepath, output_gif_filepath)
+    process_videos(
+        extracted_folder_filepath,
+        output_gif_filepath,
+        frame_stride=frame_stride,
+        scale=scale,
+        num_workers=num_workers,
+    )
 
 
 if __name__ == "__main__":
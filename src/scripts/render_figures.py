@@ -0,0 +1,628 @@
+import hashlib
+import json
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+from pathlib import Path
+
+import matplotlib
+
+# render headlessly, also in worker processes (which import this module); the backend must be
+# selected before `matplotlib.pyplot` is imported, including indirectly by seaborn
+matplotlib.use("Agg")
+
+import arcadia_pycolor as apc
+import click
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from tqdm import tqdm
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from motility_pca import MotilityPCA, PCACache, compute_min_max_bounds
+from stats_testing import joint_grid_with_stats, kde_plot_with_stats
+
+REPO_ROOT_DIRECTORY = Path(__file__).parents[2]
+DEFAULT_INPUT_CSV_FILE = (
+    REPO_ROOT_DIRECTORY
+    / "data/single-cell-motility-assay/single-cell-motility-assay_summary-statistics.csv"
+)
+DEFAULT_OUTPUT_DIRECTORY = REPO_ROOT_DIRECTORY / "results"
+# source files and packages that determine the figures (for invalidating cached figures)
+FIGURE_SOURCE_FILEPATHS = [
+    Path(__file__),
+    Path(__file__).parents[1] / "stats_testing.py",
+    Path(__file__).parents[1] / "motility_pca.py",
+]
+FIGURE_PACKAGES = ["matplotlib", "seaborn", "arcadia-pycolor", "scikit-learn"]
+
+# strains
+WILD_TYPE = "CC-125"
+MUTANT_STRAINS = ["CC-2670", "CC-3707"]
+
+# drugs
+CONTROLS = ["dmso", "h2o"]
+DRUGS = ["atp", "dyn", "ibu", "lin", "tak", "tor"]
+CONCENTRATION = 50  # µM
+
+# motility metrics
+METRICS = [
+    "max_sprint_length",
+    "confinement_ratio",
+    "mean_curvilinear_speed",
+    "mean_linear_speed",
+    "mean_angular_speed",
+    "pivot_rate",
+]
+NUM_COMPONENTS = 2
+
+# rename certain variables in the plots
+RENAME_FOR_PLOT = {
+    "CC-125": "wild type",
+    "CC-2670": "ida4 mutant",
+    "CC-3707": "cpc1 mutant",
+    "max_sprint_length": "Max sprint length",
+    "confinement_ratio": "Confinement ratio",
+    "mean_curvilinear_speed": "Mean curvilinear speed",
+    "mean_linear_speed": "Mean linear speed",
+    "mean_angular_speed": "Mean angular speed",
+    "pivot_rate": "Pivot rate",
+}
+
+# define color palette
+COLOR_PALETTE = {
+    "wild type": apc.chateau,
+    "ida4 mutant": apc.vital,
+    "cpc1 mutant": apc.tangerine,
+    "wild type + drug": apc.charcoal,
+    "ida4 mutant + drug": apc.lapis,
+    "cpc1 mutant + drug": apc.dragon,
+}
+
+
+input_csv_option = click.option(
+    "--input-csv",
+    "input_csv_file",
+    type=Path,
+    default=DEFAULT_INPUT_CSV_FILE,
+    show_default=True,
+    help="File path to CSV file of summary motility statistics.",
+)
+
+output_directory_option = click.option(
+    "--output-directory",
+    "output_directory",
+    type=Path,
+    default=DEFAULT_OUTPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory in which to save the figures.",
+)
+
+cache_directory_option = click.option(
+    "--cache-directory",
+    "cache_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to the directory of cached figures, named by the hash of their inputs. "
+        "Defaults to a '.figure-cache' directory within the output directory."
+    ),
+)
+
+figures_option = click.option(
+    "--figure",
+    "figure_names",
+    type=str,
+    multiple=True,
+    default=None,
+    help=(
+        "Name of a figure to render (e.g. 'figure-4B'). Can be given multiple times. Defaults to "
+        "every figure."
+    ),
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes for rendering figures.",
+)
+
+force_option = click.option(
+    "--force",
+    "force",
+    is_flag=True,
+    default=False,
+    help="Render every figure, even if a figure rendered from the same inputs is cached.",
+)
+
+
+def fit_control_pcas(motility_dataframe, pca_cache=None):
+    """Fit a PCA to the motility metrics of each strain and the wild type in controls.
+
+    Fits are loaded from `pca_cache` (a `motility_pca.PCACache`) if given and the same data
+    subset was fit before.
+
+    Returns
+    -------
+    motility_dataframes_controls : dict
+        Motility metrics and principal components of cells in controls, keyed by strain.
+    pcas_controls : dict
+        `motility_pca.MotilityPCA` fit to the motility metrics of each strain and the wild type.
+    """
+    pcas_controls = {}
+    motility_dataframes_controls = {}
+
+    for strain in [WILD_TYPE, *MUTANT_STRAINS]:
+        # filter dataframe to only include motility metrics stats in controls
+        motility_dataframe_controls = motility_dataframe.loc[
+            motility_dataframe["strain"].isin([strain, WILD_TYPE])
+            & motility_dataframe["drug"].isin(CONTROLS)
+        ].copy()
+
+        # fit PCA to the min-max normalized data
+        if pca_cache is None:
+            pca = MotilityPCA(METRICS, num_components=NUM_COMPONENTS)
+            pca.fit(motility_dataframe_controls)
+        else:
+            pca = pca_cache.fit(motility_dataframe_controls, METRICS, num_components=NUM_COMPONENTS)
+        motility_components = pca.transform(motility_dataframe_controls)
+
+        # add principal components to dataframe
+        for i in range(NUM_COMPONENTS):
+            motility_dataframe_controls[f"PC-{i + 1}"] = motility_components[:, i]
+
+        motility_dataframes_controls[strain] = motility_dataframe_controls
+        pcas_controls[strain] = pca
+
+    return motility_dataframes_controls, pcas_controls
+
+
+def project_drugged_strains(motility_dataframe, pcas_controls):
+    """Project the motility metrics of each strain on each drug into the PC space of controls.
+
+    Returns
+    -------
+    motility_dataframes_drugs : dict
+        Motility metrics and principal components of cells on a drug, keyed by (strain, drug).
+    """
+    motility_dataframes_drugs = {}
+
+    for strain in [WILD_TYPE, *MUTANT_STRAINS]:
+        for drug in DRUGS:
+            # no motility data available for wild type on ibudilast
+            if strain == WILD_TYPE and drug == "ibu":
+                continue
+
+            motility_dataframe_drugged_strain = motility_dataframe.loc[
+                (motility_dataframe["strain"] == strain)
+                & (motility_dataframe["drug"] == drug)
+                & (motility_dataframe["concentration"] == CONCENTRATION)
+            ].copy()
+
+            # project drugged motility (min-max normalized by its own bounds) into PC space of
+            # strain + wild type in controls
+            bounds = compute_min_max_bounds(motility_dataframe_drugged_strain, METRICS)
+            motility_components = pcas_controls[strain].transform(
+                motility_dataframe_drugged_strain, bounds=bounds
+            )
+            for i in range(NUM_COMPONENTS):
+                motility_dataframe_drugged_strain[f"PC-{i + 1}"] = motility_components[:, i]
+
+            motility_dataframes_drugs[(strain, drug)] = motility_dataframe_drugged_strain
+
+    return motility_dataframes_drugs
+
+
+def render_pca_joint_grid(data, explained_variance_ratio):
+    """Render a JointGrid of the first two PCs of a mutant strain and the wild type in controls."""
+    source = data["controls"].copy()
+    source["strain"] = source["strain"].map(RENAME_FOR_PLOT)
+
+    joint_grid = joint_grid_with_stats(
+        data=source,
+        x_variable="PC-1",
+        y_variable="PC-2",
+        hue_variable="strain",
+        palette=COLOR_PALETTE,
+    )
+
+    # aesthetics
+    joint_grid.ax_joint.set_xlabel(f"PC-1  ({explained_variance_ratio[0]:.1%})")
+    joint_grid.ax_joint.set_ylabel(f"PC-2  ({explained_variance_ratio[1]:.1%})")
+    sns.move_legend(joint_grid.ax_joint, "upper right", bbox_to_anchor=(1.7, 1))
+    apc.mpl.style_plot(joint_grid.ax_joint, monospaced_axes="both")
+
+
+def render_pca_loadings(data, title, vmin, vmax):
+    """Render a heatmap of the loadings of each motility metric on each PC."""
+    figsize = apc.mpl.get_figure_dimensions("float_wide")
+    fig, ax = plt.subplots(figsize=figsize, layout="constrained")
+
+    loadings = data["loadings"]
+    ax = sns.heatmap(
+        loadings.to_numpy(),
+        cmap=apc.gradients.red_blue.to_mpl_cmap(),
+        xticklabels=list(loadings.columns),
+        yticklabels=list(loadings.index),
+        annot=True,
+        fmt=".2f",
+        square=True,
+        cbar=True,
+        center=0,
+        vmin=vmin,
+        vmax=vmax,
+        ax=ax,
+    )
+
+    # figure aesthetics
+    ax.set_title(title)
+    apc.mpl.style_plot(colorbar_exists=True)
+
+
+def render_pc_drug_kdes(data, pc):
+    """Render KDE plots of a PC of each strain in controls vs. on each drug."""
+    controls, drugged = data["controls"], data["drugs"]
+    x_variable = f"PC-{pc}"
+    xlims = (-1.5, 1.5)
+
+    fig_width = apc.mpl.get_figure_dimensions("full_wide")[0]
+    fig_height = 0.6 * fig_width
+    fig, axes = plt.subplots(
+        nrows=len(DRUGS),
+        ncols=3,
+        layout="constrained",
+        sharex=True,
+        figsize=(fig_width, fig_height),
+    )
+
+    for strain_i, strain in enumerate([WILD_TYPE, *MUTANT_STRAINS]):
+        for drug_i, drug in enumerate(DRUGS):
+            ax = axes[drug_i, strain_i]
+            legend = drug_i == 0
+
+            # motility data from the PC space built on controls + projections from each drug
+            source = pd.concat(
+                [
+                    controls.loc[controls["pca_strain"] == strain],
+                    drugged.loc[(drugged["pca_strain"] == strain) & (drugged["drug"] == drug)],
+                ]
+            )
+
+            if strain == WILD_TYPE:
+                # wild type in controls vs drugged wild type
+                treatment = (
+                    source["drug"].isin(DRUGS).map({True: "wild type + drug", False: "wild type"})
+                )
+                source["treatment"] = treatment
+                groups = None
+            else:
+                # only compare wild type in controls vs mutant + drug
+                treatment = source["drug"].isin(DRUGS).map({True: " + drug", False: ""})
+                source["treatment"] = source["strain"].map(RENAME_FOR_PLOT) + treatment
+                groups = ["wild type", f"{RENAME_FOR_PLOT[strain]} + drug"]
+
+            kde_kwargs = {
+                "common_norm": False,
+                "palette": COLOR_PALETTE,
+                "fill": True,
+                "lw": 2,
+                "legend": legend,
+                "ax": ax,
+            }
+            if strain == WILD_TYPE and drug == "ibu":
+                # no motility data available for wild type on ibudilast (so no statistics)
+                sns.kdeplot(data=source, x=x_variable, hue="treatment", **kde_kwargs)
+            else:
+                kde_plot_with_stats(
+                    data=source,
+                    x_variable=x_variable,
+                    hue_variable="treatment",
+                    groups=groups,
+                    **kde_kwargs,
+                )
+
+            # aesthetics
+            num_drugged_cells = source.query("drug == @drug").shape[0]
+            ax.set_ylabel(f"{drug}\n(n={num_drugged_cells})", rotation=0)
+            ax.yaxis.set_ticks([])
+            ax.set_xlim(xlims)
+            sns.despine(ax=ax, left=True)
+            if legend:
+                sns.move_legend(ax, "upper left", bbox_to_anchor=(0, 4))
+            apc.mpl.style_plot(ax, monospaced_axes="both")
+
+
+def render_control_metric_kdes(data, metrics):
+    """Render KDE plots of motility metrics of each mutant strain vs. the wild type in controls."""
+    nrows = len(metrics)
+    ncols = len(MUTANT_STRAINS)
+    fig, axes = plt.subplots(
+        nrows=nrows,
+        ncols=ncols,
+        layout="constrained",
+        figsize=(4 * ncols, 2.5 * nrows),
+    )
+
+    controls = data["controls"]
+    for metric_i, metric in enumerate(metrics):
+        for mutant_i, mutant_strain in enumerate(MUTANT_STRAINS):
+            ax = axes[metric_i, mutant_i]
+            legend = metric_i == 0
+
+            # filter to only wild-type and mutant strain in controls
+            source = controls.loc[controls["strain"].isin([WILD_TYPE, mutant_strain])].copy()
+            source["Strain"] = source["strain"].map(RENAME_FOR_PLOT)
+
+            kde_plot_with_stats(
+                data=source,
+                x_variable=metric,
+                hue_variable="Strain",
+                common_norm=False,
+                bw_adjust=0.8,
+                clip=(0, 1e6),
+                palette=COLOR_PALETTE,
+                fill=True,
+                lw=2,
+                legend=legend,
+                ax=ax,
+            )
+
+            # aesthetics
+            ax.set_ylabel("")
+            ax.yaxis.set_ticks([])
+            sns.despine(ax=ax, left=True)
+            if legend:
+                sns.move_legend(ax, "lower left", bbox_to_anchor=(0, 2))
+            apc.mpl.style_plot(ax, monospaced_axes="both")
+
+
+def render_wild_type_drug_kdes(data, metric):
+    """Render KDE plots of a motility metric of the wild type in controls vs. on each drug."""
+    fig_width = apc.mpl.get_figure_dimensions(size="full_square")[0]
+    fig_height = 1.8 * fig_width
+    fig, axes = plt.subplots(
+        nrows=len(DRUGS),
+        layout="constrained",
+        sharex=True,
+        figsize=(fig_width, fig_height),
+    )
+
+    wild_type = data["wild_type"]
+    for drug_i, drug in enumerate(DRUGS):
+        ax = axes[drug_i]
+        legend = drug_i == 0
+
+        # wild type in controls + wild type on drug
+        source = wild_type.loc[wild_type["drug"].isin([*CONTROLS, drug])].copy()
+        treatment = source["drug"].isin(DRUGS).map({True: "wild type + drug", False: "wild type"})
+        source["treatment"] = treatment
+
+        kde_kwargs = {
+            "common_norm": False,
+            "bw_adjust": 0.8,
+            "clip": (0, 100),
+            "palette": COLOR_PALETTE,
+            "fill": True,
+            "lw": 2,
+            "legend": legend,
+            "ax": ax,
+        }
+        if drug == "ibu":
+            # no motility data available for wild type on ibudilast (so no statistics)
+            sns.kdeplot(data=source, x=metric, hue="treatment", **kde_kwargs)
+        else:
+            kde_plot_with_stats(
+                data=source, x_variable=metric, hue_variable="treatment", **kde_kwargs
+            )
+
+        # aesthetics
+        num_drugged_cells = source.query("drug == @drug").shape[0]
+        ax.set_ylabel(f"{drug}\n(n={num_drugged_cells})", rotation=0)
+        ax.yaxis.set_ticks([])
+        ax.set_xlabel(RENAME_FOR_PLOT[metric])
+        sns.despine(ax=ax, left=True)
+        if legend:
+            sns.move_legend(ax, "upper left", bbox_to_anchor=(0, 2.5))
+        apc.mpl.style_plot(ax, monospaced_axes="both")
+
+
+def get_figure_specs(motility_dataframe, pca_cache=None):
+    """Get the inputs of every figure: its render function, data, and parameters.
+
+    The data of each figure is only the slice of the summary motility statistics it plots, such
+    that a change to the data only invalidates the figures that depend on it.
+
+    Returns
+    -------
+    figure_specs : dict
+        Mapping of each figure name to a tuple of the function that renders the figure, a dict of
+        the dataframes it plots, and a dict of its (JSON-serializable) parameters.
+    """
+    motility_dataframes_controls, pcas_controls = fit_control_pcas(motility_dataframe, pca_cache)
+    motility_dataframes_drugs = project_drugged_strains(motility_dataframe, pcas_controls)
+    pc_columns = [f"PC-{i + 1}" for i in range(NUM_COMPONENTS)]
+    all_loadings = [pcas_controls[strain].components_ for strain in MUTANT_STRAINS]
+
+    figure_specs = {}
+    for mutant_strain, joint_grid_panel, loadings_panel in zip(
+        MUTANT_STRAINS, ["B", "C"], ["D", "E"], strict=True
+    ):
+        pca = pcas_controls[mutant_strain]
+        figure_specs[f"figure-4{joint_grid_panel}"] = (
+            render_pca_joint_grid,
+            {"controls": motility_dataframes_controls[mutant_strain]},
+            {"explained_variance_ratio": pca.explained_variance_ratio_.tolist()},
+        )
+        figure_specs[f"figure-4{loadings_panel}"] = (
+            render_pca_loadings,
+            {"loadings": pd.DataFrame(pca.components_.T, index=METRICS, columns=pc_columns)},
+            {
+                "title": RENAME_FOR_PLOT[mutant_strain],
+                "vmin": float(np.min(all_loadings)),
+                "vmax": float(np.max(all_loadings)),
+            },
+        )
+
+    # principal components of each strain in controls and on each drug
+    pc_data = {
+        "controls": pd.concat(
+            [
+                dataframe.assign(pca_strain=strain)
+                for strain, dataframe in motility_dataframes_controls.items()
+            ]
+        ),
+        "drugs": pd.concat(
+            [
+                dataframe.assign(pca_strain=strain)
+                for (strain, _), dataframe in motility_dataframes_drugs.items()
+            ]
+        ),
+    }
+    for pc, panels in zip(range(1, NUM_COMPONENTS + 1), ["ABC", "DEF"], strict=True):
+        figure_specs[f"figure-6{panels}"] = (render_pc_drug_kdes, pc_data, {"pc": pc})
+
+    figure_specs["figure-S1"] = (
+        render_control_metric_kdes,
+        {
+            "controls": motility_dataframe.loc[
+                motility_dataframe["strain"].isin([WILD_TYPE, *MUTANT_STRAINS])
+                & motility_dataframe["drug"].isin(CONTROLS)
+            ]
+        },
+        {"metrics": ["max_sprint_length", "mean_linear_speed"]},
+    )
+    figure_specs["figure-S2"] = (
+        render_wild_type_drug_kdes,
+        {
+            "wild_type": motility_dataframe.loc[
+                (motility_dataframe["strain"] == WILD_TYPE)
+                & (motility_dataframe["concentration"] == CONCENTRATION)
+            ]
+        },
+        {"metric": "mean_curvilinear_speed"},
+    )
+    return figure_specs
+
+
+def get_code_version():
+    """Hash of the source files and versions of the plotting packages that render the figures."""
+    digest = hashlib.sha256()
+    for filepath in FIGURE_SOURCE_FILEPATHS:
+        digest.update(Path(filepath).read_bytes())
+    for package in FIGURE_PACKAGES:
+        try:
+            digest.update(f"{package}=={metadata.version(package)}".encode())
+        except metadata.PackageNotFoundError:
+            pass
+    return digest.hexdigest()
+
+
+def hash_figure_inputs(figure_name, render_function, data, params, code_version):
+    """Compute a content hash of everything a figure depends on."""
+    digest = hashlib.sha256()
+    digest.update(f"{figure_name}:{render_function.__name__}:{code_version}".encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    for key, dataframe in sorted(data.items()):
+        digest.update(f"{key}:{list(dataframe.columns)}".encode())
+        digest.update(pd.util.hash_pandas_object(dataframe, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_figure(render_function, data, params, pdf_filepath):
+    """Render a figure with the Arcadia style and save it as a PDF file.
+
+    The figure is saved under a temporary name first such that a failed render never leaves a
+    partial file at `pdf_filepath`, which would be mistaken for a cached figure.
+    """
+    apc.mpl.setup()
+    partial_filepath = pdf_filepath.with_name(f"{pdf_filepath.stem}.partial.pdf")
+    try:
+        render_function(data, **params)
+        apc.mpl.save_figure(str(partial_filepath))
+        partial_filepath.replace(pdf_filepath)
+    finally:
+        plt.close("all")
+    return pdf_filepath
+
+
+@force_option
+@num_jobs_option
+@figures_option
+@cache_directory_option
+@output_directory_option
+@input_csv_option
+@click.command()
+def main(input_csv_file, output_directory, cache_directory, figure_names, num_jobs, force):
+    """Script for rendering the figures of the single-cell motility assay headlessly.
+
+    Renders the figures made in the notebooks `2_mutant-motility-pca.ipynb` and
+    `3_supplemental-analysis.ipynb` from the CSV file of summary motility statistics, without a
+    display, distributing independent figures across `num_jobs` worker processes.
+
+    Rendered figures are cached under the hash of their inputs: the slice of the data each figure
+    plots, its parameters, the plotting code, and the versions of the plotting packages. A figure
+    whose inputs hash to a cached figure is copied from the cache rather than re-rendered, so
+    after a fix to the data only the figures that depend on the changed rows are re-rendered.
+    The PCAs of the strains in controls are likewise cached under the hash of the data they are
+    fit to (see `motility_pca.PCACache`).
+    """
+    if not input_csv_file.exists():
+        msg = f"Input CSV file of summary motility statistics not found: '{input_csv_file}'."
+        raise FileNotFoundError(msg)
+    output_directory.mkdir(exist_ok=True, parents=True)
+    if cache_directory is None:
+        cache_directory = output_directory / ".figure-cache"
+    cache_directory.mkdir(exist_ok=True, parents=True)
+
+    motility_dataframe = pd.read_csv(input_csv_file)
+    pca_cache = None if force else PCACache(cache_directory / "pca")
+    figure_specs = get_figure_specs(motility_dataframe, pca_cache)
+    if figure_names:
+        unknown_figure_names = set(figure_names) - set(figure_specs)
+        if unknown_figure_names:
+            msg = (
+                f"Unknown figure(s) {sorted(unknown_figure_names)}. Expected any of "
+                f"{list(figure_specs)}."
+            )
+            raise click.BadParameter(msg)
+        figure_specs = {name: figure_specs[name] for name in figure_names}
+
+    # figures whose inputs have not been rendered before
+    code_version = get_code_version()
+    cached_filepaths = {}
+    stale_figures = []
+    for figure_name, (render_function, data, params) in figure_specs.items():
+        figure_hash = hash_figure_inputs(figure_name, render_function, data, params, code_version)
+        cached_filepaths[figure_name] = cache_directory / f"{figure_hash}.pdf"
+        if force or not cached_filepaths[figure_name].exists():
+            stale_figures.append(figure_name)
+    print(
+        f"Rendering {len(stale_figures)} of {len(figure_specs)} figure(s) "
+        f"({len(figure_specs) - len(stale_figures)} cached)."
+    )
+
+    render_args = [
+        (*figure_specs[figure_name], cached_filepaths[figure_name]) for figure_name in stale_figures
+    ]
+    if num_jobs > 1 and len(stale_figures) > 1:
+        with ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            futures = [executor.submit(render_figure, *args) for args in render_args]
+            for future in tqdm(futures):
+                future.result()
+    else:
+        for args in tqdm(render_args):
+            render_figure(*args)
+
+    for figure_name, cached_filepath in cached_filepaths.items():
+        shutil.copyfile(cached_filepath, output_directory / f"{figure_name}.pdf")
+    print(f"Figures written to: {output_directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import json
+import sys
+from itertools import product
+from pathlib import Path
+
+import click
+import pandas as pd
+from compute_motility_metrics import (
+    DEFAULT_INPUT_DIRECTORY,
+    DEFAULT_INPUT_JSON_FILE,
+    DEFAULT_OUTPUT_DIRECTORY,
+    iter_cached_well_motility_metrics,
+)
+from natsort import natsorted
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from motility_metrics import SUMMARY_STATISTICS_COLUMNS
+
+GROUPBY_COLUMNS = ["strain", "drug", "concentration"]
+METRIC_COLUMNS = [column for column in SUMMARY_STATISTICS_COLUMNS if column != "cell_id"]
+
+
+def parse_thresholds(context, parameter, value):
+    """Parse a comma-separated list of thresholds."""
+    try:
+        return sorted(float(threshold) for threshold in value.split(","))
+    except ValueError as error:
+        msg = f"Expected a comma-separated list of numbers, got '{value}'."
+        raise click.BadParameter(msg) from error
+
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to directory of CSV files of cell trajectories.",
+)
+
+input_json_option = click.option(
+    "--json",
+    "input_json_file",
+    type=Path,
+    default=DEFAULT_INPUT_JSON_FILE,
+    show_default=True,
+    help=(
+        "File path to JSON file that maps each file in a dataset to a set of experimental "
+        "parameters."
+    ),
+)
+
+output_directory_option = click.option(
+    "--output-directory",
+    "output_directory",
+    type=Path,
+    default=DEFAULT_OUTPUT_DIRECTORY,
+    show_default=True,
+    help="File path for output CSV file of the threshold sweep.",
+)
+
+cache_directory_option = click.option(
+    "--cache-directory",
+    "cache_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to the directory of cached per-well motility metrics (see the option of the "
+        "same name in `compute_motility_metrics.py`). Defaults to a '<dataset>_metrics-cache' "
+        "directory within the output directory, which is ignored by git."
+    ),
+)
+
+time_thresholds_option = click.option(
+    "--time-thresholds",
+    "time_thresholds",
+    default="0,5,10,15,20",
+    show_default=True,
+    callback=parse_thresholds,
+    help="Comma-separated list of minimum trajectory durations (in seconds) to evaluate.",
+)
+
+distance_thresholds_option = click.option(
+    "--distance-thresholds",
+    "distance_thresholds",
+    default="0,10,20,40,80",
+    show_default=True,
+    callback=parse_thresholds,
+    help="Comma-separated list of minimum trajectory distances (in microns) to evaluate.",
+)
+
+engine_option = click.option(
+    "--engine",
+    "engine",
+    type=click.Choice(["swimtracker", "vectorized"]),
+    default="swimtracker",
+    show_default=True,
+    help=(
+        "Engine for computing motility metrics of wells that are not yet cached. 'vectorized' "
+        "omits the turning-based metrics, which are then left out of the sweep."
+    ),
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes for computing motility metrics of uncached wells.",
+)
+
+
+def sweep_thresholds(motility_metrics_dataframe, time_thresholds, distance_thresholds):
+    """Summarize unfiltered motility metrics over a grid of time and distance thresholds.
+
+    Parameters
+    ----------
+    motility_metrics_dataframe : `pandas.DataFrame`
+        Unfiltered summary motility metrics of every cell trajectory.
+    time_thresholds, distance_thresholds : list of float
+        Minimum trajectory durations (in seconds) and distances (in microns) to evaluate.
+
+    Returns
+    -------
+    sweep_dataframe : `pandas.DataFrame`
+        Tidy table with one row per (threshold pair, strain, drug, concentration, metric) giving
+        the number of cells retained and the median of the metric among them. Groups without
+        any retained cells are kept with zero cells retained and NaN medians.
+    """
+    metric_columns = [
+        column for column in METRIC_COLUMNS if column in motility_metrics_dataframe.columns
+    ]
+    total_time = motility_metrics_dataframe["total_time"].to_numpy()
+    total_distance = motility_metrics_dataframe["total_distance"].to_numpy()
+    # every group is reported at every threshold pair, even once none of its cells are retained
+    group_index = motility_metrics_dataframe.groupby(GROUPBY_COLUMNS).size().index
+
+    sweep_dataframes = []
+    for time_threshold, distance_threshold in product(time_thresholds, distance_thresholds):
+        is_retained = (total_time >= time_threshold) & (total_distance >= distance_threshold)
+        grouped = motility_metrics_dataframe.loc[is_retained].groupby(GROUPBY_COLUMNS)
+
+        medians = grouped[metric_columns].median().reindex(group_index)
+        medians["cells_retained"] = grouped.size().reindex(group_index, fill_value=0)
+        sweep_dataframe = medians.reset_index().melt(
+            id_vars=[*GROUPBY_COLUMNS, "cells_retained"],
+            var_name="metric",
+            value_name="median",
+        )
+        sweep_dataframe.insert(0, "time_threshold", time_threshold)
+        sweep_dataframe.insert(1, "distance_threshold", distance_threshold)
+        sweep_dataframes.append(sweep_dataframe)
+
+    return pd.concat(sweep_dataframes, ignore_index=True)
+
+
+@num_jobs_option
+@engine_option
+@distance_thresholds_option
+@time_thresholds_option
+@cache_directory_option
+@output_directory_option
+@input_json_option
+@input_directory_option
+@click.command()
+def main(
+    input_directory,
+    input_json_file,
+    output_directory,
+    cache_directory,
+    time_thresholds,
+    distance_thresholds,
+    engine,
+    num_jobs,
+):
+    """Script for evaluating the sensitivity of summary motility metrics to trajectory thresholds.
+
+    Computes the unfiltered motility metrics of every cell trajectory once (or loads them from the
+    cache of a previous run of this script or `compute_motility_metrics.py`), then evaluates every
+    pair of time and distance thresholds in the grid. Outputs a single tidy CSV file of the number
+    of cells retained and the median of each motility metric per strain, drug, and concentration
+    for each threshold pair.
+    """
+    dataset_name = input_directory.parent.name
+
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+    if not input_json_file.exists():
+        msg = f"Input json file for experimental parameters not found: '{input_json_file}'."
+        raise FileNotFoundError(msg)
+    output_directory.mkdir(exist_ok=True, parents=False)
+    if cache_directory is None:
+        cache_directory = output_directory / f"{dataset_name}_metrics-cache"
+
+    trajectory_csvs = natsorted(input_directory.glob("*.csv"))
+    if not trajectory_csvs:
+        msg = f"No CSV files found in '{input_directory}'."
+        raise FileNotFoundError(msg)
+
+    experimental_parameters = json.loads(input_json_file.read_text())
+
+    # unfiltered motility metrics of every cell trajectory (cached after the first run)
+    motility_metrics_dataframe = pd.concat(
+        iter_cached_well_motility_metrics(
+            trajectory_csvs,
+            cache_directory,
+            num_jobs=num_jobs,
+            framerate=experimental_parameters[dataset_name]["framerate"],
+            pixelsize=experimental_parameters[dataset_name]["pixelsize"],
+            hours_in_drug=experimental_parameters[dataset_name]["hours_in_drug"],
+            experimental_parameters=experimental_parameters,
+            engine=engine,
+        ),
+        ignore_index=True,
+    )
+
+    sweep_dataframe = sweep_thresholds(
+        motility_metrics_dataframe, time_thresholds, distance_thresholds
+    )
+    output_csv_file = output_directory / f"{dataset_name}_threshold-sweep.csv"
+    sweep_dataframe.to_csv(output_csv_file, index=False)
+
+
+if __name__ == "__main__":
+    main()
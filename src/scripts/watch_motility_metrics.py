@@ -0,0 +1,436 @@
+import json
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import click
+import pandas as pd
+from compute_motility_metrics import (
+    DEFAULT_INPUT_DIRECTORY,
+    DEFAULT_INPUT_JSON_FILE,
+    DEFAULT_OUTPUT_DIRECTORY,
+    METRICS_SOURCE_FILEPATHS,
+    compute_well_motility_metrics,
+    filter_motility_metrics,
+    fingerprint_well,
+    write_parquet_partition,
+)
+from natsort import natsorted
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1]))
+from metrics_cache import MetricsCache, get_code_version
+
+input_directory_option = click.option(
+    "--input-directory",
+    "input_directory",
+    type=Path,
+    default=DEFAULT_INPUT_DIRECTORY,
+    show_default=True,
+    help="File path to the directory to watch for CSV files of cell trajectories.",
+)
+
+input_json_option = click.option(
+    "--json",
+    "input_json_file",
+    type=Path,
+    default=DEFAULT_INPUT_JSON_FILE,
+    show_default=True,
+    help=(
+        "File path to JSON file that maps each file in a dataset to a set of experimental "
+        "parameters. Re-read on every poll such that wells can be added during the run."
+    ),
+)
+
+output_directory_option = click.option(
+    "--output-directory",
+    "output_directory",
+    type=Path,
+    default=DEFAULT_OUTPUT_DIRECTORY,
+    show_default=True,
+    help="File path for output CSV file of summary motility statistics.",
+)
+
+cache_directory_option = click.option(
+    "--cache-directory",
+    "cache_directory",
+    type=Path,
+    default=None,
+    help=(
+        "File path to the directory of cached per-well motility metrics (see the option of the "
+        "same name in `compute_motility_metrics.py`), such that a restarted watch does not "
+        "recompute finished wells. Defaults to a '<dataset>_metrics-cache' directory within the "
+        "output directory, which is ignored by git."
+    ),
+)
+
+trajectory_time_threshold_option = click.option(
+    "--time-threshold",
+    "time_threshold",
+    default=10.0,
+    show_default=True,
+    help="Minimum trajectory duration (in seconds) of the cells that are included.",
+)
+
+trajectory_distance_threshold_option = click.option(
+    "--distance-threshold",
+    "distance_threshold",
+    default=20.0,
+    show_default=True,
+    help="Minimum trajectory distance (in microns) of the cells that are included.",
+)
+
+output_format_option = click.option(
+    "--output-format",
+    "output_format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    show_default=True,
+    help=(
+        "Format of the summary motility statistics. 'csv' rewrites a single CSV file whenever a "
+        "well finishes; 'parquet' writes the partition of each well to a Parquet dataset."
+    ),
+)
+
+engine_option = click.option(
+    "--engine",
+    "engine",
+    type=click.Choice(["swimtracker", "vectorized"]),
+    default="swimtracker",
+    show_default=True,
+    help=(
+        "Engine for computing motility metrics (see `compute_motility_metrics.py`). 'vectorized' "
+        "omits the turning-based metrics."
+    ),
+)
+
+chunk_size_option = click.option(
+    "--chunk-size",
+    "chunk_size",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Stream each CSV file of cell trajectories in chunks of this many rows (see "
+        "`compute_motility_metrics.py`)."
+    ),
+)
+
+morphology_option = click.option(
+    "--morphology",
+    "morphology",
+    is_flag=True,
+    default=False,
+    help=(
+        "Also summarize the segmentation morphology of each cell trajectory (see "
+        "`compute_motility_metrics.py`)."
+    ),
+)
+
+num_jobs_option = click.option(
+    "--jobs",
+    "num_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes over which to distribute the wells that are ready.",
+)
+
+pattern_option = click.option(
+    "--pattern",
+    "pattern",
+    default="*_tracks.csv",
+    show_default=True,
+    help="Glob pattern of the CSV files of cell trajectories within the input directory.",
+)
+
+poll_interval_option = click.option(
+    "--poll-interval",
+    "poll_interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=5.0,
+    show_default=True,
+    help="Time (in seconds) between scans of the input directory.",
+)
+
+settle_time_option = click.option(
+    "--settle-time",
+    "settle_time",
+    type=click.FloatRange(min=0),
+    default=30.0,
+    show_default=True,
+    help=(
+        "Time (in seconds) for which the size and modification time of a CSV file must be "
+        "unchanged before it is considered finished and processed."
+    ),
+)
+
+idle_timeout_option = click.option(
+    "--idle-timeout",
+    "idle_timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help=(
+        "Stop watching once no CSV file has been created or modified and no well has been "
+        "processed for this long (in seconds). Defaults to watching until interrupted."
+    ),
+)
+
+
+def scan_stable_filepaths(input_directory, pattern, observations, settle_time):
+    """Scan the input directory for CSV files that have stopped changing.
+
+    A file is considered stable once its size and modification time have been unchanged for at
+    least `settle_time` seconds of observation, i.e. once the tracker has finished writing it.
+
+    Parameters
+    ----------
+    input_directory : `pathlib.Path`
+        Directory of CSV files of cell trajectories.
+    pattern : str
+        Glob pattern of the CSV files of cell trajectories.
+    observations : dict
+        Mapping of each file path to its `(size, mtime)` and the time at which it was first
+        observed. Updated in place.
+    settle_time : float
+        Time (in seconds) for which a file must be unchanged to be considered stable.
+
+    Returns
+    -------
+    stable_filepaths : list of `pathlib.Path`
+        Stable, non-empty CSV files in natural sort order.
+    num_changed : int
+        Number of files that were created or modified since the previous scan.
+    """
+    now = time.monotonic()
+    stable_filepaths = []
+    num_changed = 0
+    for filepath in natsorted(input_directory.glob(pattern)):
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            # removed (e.g. renamed by the tracker) between globbing and stat
+            continue
+        file_state = (stat.st_size, stat.st_mtime_ns)
+        if filepath not in observations or observations[filepath][0] != file_state:
+            observations[filepath] = (file_state, now)
+            num_changed += 1
+        if stat.st_size > 0 and now - observations[filepath][1] >= settle_time:
+            stable_filepaths.append(filepath)
+    return stable_filepaths, num_changed
+
+
+def write_summary_csv(well_summaries, output_csv_file):
+    """Rewrite the summary CSV file with the motility metrics of every well processed so far.
+
+    Wells are written in the natural sort order of their CSV files, as in
+    `compute_motility_metrics.py`, and the file is replaced atomically such that readers never
+    see a partially written file.
+    """
+    dataframes = [well_summaries[filepath] for filepath in natsorted(well_summaries)]
+    temporary_csv_file = output_csv_file.with_name(f".{output_csv_file.name}.tmp")
+    pd.concat(dataframes, ignore_index=True).to_csv(temporary_csv_file, index=False)
+    temporary_csv_file.replace(output_csv_file)
+
+
+@idle_timeout_option
+@settle_time_option
+@poll_interval_option
+@pattern_option
+@num_jobs_option
+@morphology_option
+@chunk_size_option
+@engine_option
+@output_format_option
+@trajectory_distance_threshold_option
+@trajectory_time_threshold_option
+@cache_directory_option
+@output_directory_option
+@input_json_option
+@input_directory_option
+@click.command()
+def main(
+    input_directory,
+    input_json_file,
+    output_directory,
+    cache_directory,
+    time_threshold,
+    distance_threshold,
+    output_format,
+    engine,
+    chunk_size,
+    morphology,
+    num_jobs,
+    pattern,
+    poll_interval,
+    settle_time,
+    idle_timeout,
+):
+    """Script for computing summary motility metrics of each well while a plate is being tracked.
+
+    Polls the input directory every `poll_interval` seconds for CSV files of cell trajectories.
+    Once a CSV file has stopped changing for `settle_time` seconds, the motility metrics of its
+    well are computed as in `compute_motility_metrics.py` (distributed across `num_jobs` worker
+    processes as wells become ready), filtered by the same thresholds, and the summary output is
+    updated in place: the summary CSV file is rewritten with every well processed so far, or the
+    partition of the well is written to the Parquet dataset. A CSV file that changes after being
+    processed (e.g. if a well is re-tracked) is processed again.
+
+    The unfiltered motility metrics of each well are cached (see `metrics_cache.MetricsCache`), so
+    a restarted watch only recomputes wells whose inputs have changed. Once every well of the
+    plate has been processed, the summary output is identical to that of
+    `compute_motility_metrics.py` run with the same options, including `--chunk-size` and
+    `--morphology` with either engine.
+
+    Runs until interrupted, or until nothing has changed for `idle_timeout` seconds.
+    """
+    dataset_name = input_directory.parent.name
+
+    if not input_directory.exists():
+        msg = f"Input directory for CSV files of cell trajectories not found: '{input_directory}'."
+        raise FileNotFoundError(msg)
+    if not input_json_file.exists():
+        msg = f"Input json file for experimental parameters not found: '{input_json_file}'."
+        raise FileNotFoundError(msg)
+    output_directory.mkdir(exist_ok=True, parents=False)
+    if cache_directory is None:
+        cache_directory = output_directory / f"{dataset_name}_metrics-cache"
+
+    cache = MetricsCache(cache_directory)
+    code_version = get_code_version(METRICS_SOURCE_FILEPATHS, engine)
+    output_csv_file = output_directory / f"{dataset_name}_summary-statistics.csv"
+    output_parquet_directory = output_directory / f"{dataset_name}_summary-statistics"
+    if output_format == "parquet":
+        # start from an empty dataset; wells already computed are re-exported from the cache
+        shutil.rmtree(output_parquet_directory, ignore_errors=True)
+        output_parquet_directory.mkdir()
+
+    # file state of each CSV file when last observed, and when it was processed
+    observations = {}
+    processed_file_states = {}
+    # filtered motility metrics of each processed well (only needed to rewrite the CSV file)
+    well_summaries = {}
+    # futures of wells being computed, mapped to their file path and fingerprint
+    running_wells = {}
+    exported_filepaths = set()
+    unknown_well_ids = set()
+
+    def export_well(trajectory_filepath, dataframe, fingerprint):
+        """Cache the motility metrics of a well and update the summary output."""
+        cache.save(trajectory_filepath.stem, dataframe, fingerprint)
+        cache.write_manifest()
+        dataframe_filtered = filter_motility_metrics(dataframe, time_threshold, distance_threshold)
+        if output_format == "csv":
+            well_summaries[trajectory_filepath] = dataframe_filtered
+            write_summary_csv(well_summaries, output_csv_file)
+        else:
+            well_id = trajectory_filepath.name.split("_")[0]
+            write_parquet_partition(dataframe_filtered, output_parquet_directory, well_id)
+        exported_filepaths.add(trajectory_filepath)
+        print(
+            f"{trajectory_filepath.name}: {len(dataframe_filtered)} of {len(dataframe)} cell "
+            "trajectories pass the thresholds."
+        )
+
+    experimental_parameters = json.loads(input_json_file.read_text())
+    print(f"Watching '{input_directory}' for '{pattern}' files. Press Ctrl+C to stop.")
+    executor = ProcessPoolExecutor(max_workers=num_jobs) if num_jobs > 1 else None
+    last_activity_time = time.monotonic()
+    try:
+        while True:
+            stable_filepaths, num_changed = scan_stable_filepaths(
+                input_directory, pattern, observations, settle_time
+            )
+            if num_changed:
+                last_activity_time = time.monotonic()
+
+            # re-read the experimental parameters such that wells added while watching are picked
+            # up, keeping the previous parameters while the file is unreadable (e.g. mid-write)
+            try:
+                experimental_parameters = json.loads(input_json_file.read_text())
+            except (json.JSONDecodeError, OSError) as error:
+                print(
+                    f"Could not reload '{input_json_file.name}' ({error}); "
+                    "keeping the previous experimental parameters."
+                )
+            acquisition_parameters = experimental_parameters[dataset_name]
+            well_kwargs = {
+                "framerate": acquisition_parameters["framerate"],
+                "pixelsize": acquisition_parameters["pixelsize"],
+                "hours_in_drug": acquisition_parameters["hours_in_drug"],
+                "experimental_parameters": experimental_parameters,
+                "engine": engine,
+                "chunk_size": chunk_size,
+                "morphology": morphology,
+            }
+
+            running_filepaths = {filepath for filepath, _ in running_wells.values()}
+            for trajectory_filepath in stable_filepaths:
+                file_state = observations[trajectory_filepath][0]
+                if (
+                    processed_file_states.get(trajectory_filepath) == file_state
+                    or trajectory_filepath in running_filepaths
+                ):
+                    continue
+                well_id = trajectory_filepath.name.split("_")[0]
+                if well_id not in experimental_parameters:
+                    if well_id not in unknown_well_ids:
+                        print(f"{trajectory_filepath.name}: waiting for parameters of '{well_id}'.")
+                        unknown_well_ids.add(well_id)
+                    continue
+
+                # recorded before computing such that a file that changes meanwhile is redone
+                processed_file_states[trajectory_filepath] = file_state
+                last_activity_time = time.monotonic()
+                fingerprint = fingerprint_well(trajectory_filepath, code_version, **well_kwargs)
+                if cache.is_current(trajectory_filepath.stem, fingerprint):
+                    dataframe = cache.load(trajectory_filepath.stem)
+                    export_well(trajectory_filepath, dataframe, fingerprint)
+                elif executor is not None:
+                    future = executor.submit(
+                        compute_well_motility_metrics, trajectory_filepath, **well_kwargs
+                    )
+                    running_wells[future] = (trajectory_filepath, fingerprint)
+                else:
+                    try:
+                        dataframe = compute_well_motility_metrics(
+                            trajectory_filepath, **well_kwargs
+                        )
+                    except Exception as error:
+                        print(f"{trajectory_filepath.name}: failed ({error!r}).")
+                        continue
+                    export_well(trajectory_filepath, dataframe, fingerprint)
+
+            # collect the wells computed by the worker processes while waiting for the next poll
+            if running_wells:
+                done_futures, _ = wait(
+                    running_wells, timeout=poll_interval, return_when=FIRST_COMPLETED
+                )
+                for future in done_futures:
+                    trajectory_filepath, fingerprint = running_wells.pop(future)
+                    last_activity_time = time.monotonic()
+                    try:
+                        dataframe = future.result()
+                    except Exception as error:
+                        print(f"{trajectory_filepath.name}: failed ({error!r}).")
+                        continue
+                    export_well(trajectory_filepath, dataframe, fingerprint)
+            else:
+                if (
+                    idle_timeout is not None
+                    and time.monotonic() - last_activity_time >= idle_timeout
+                ):
+                    break
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"Motility metrics of {len(exported_filepaths)} wells written to '{output_directory}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import matplotlib.pyplot as plt
 import numpy as np
+import pandas as pd
 import seaborn as sns
-from scipy import stats
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+from scipy import signal, stats
+from statsmodels.stats.multitest import multipletests
+
+# number of bins of the fine grid onto which values are binned before the FFT convolution
+KDE_NUM_BINS = 2048
 
 
 def map_p_value_to_asterisks(p_value):
@@ -28,15 +40,446 @@ def ensure_two_groups(data, groupby_variable):
         raise ValueError(msg)
 
 
+def compute_mann_whitney_tests(
+    data,
+    comparisons,
+    metric_columns,
+    group_columns,
+    correction_method="fdr_bh",
+    min_sample_size=6,
+):
+    """Run two-sided Mann-Whitney U tests for many pairs of groups and metrics at once.
+
+    Rather than running `scipy.stats.mannwhitneyu` for every comparison, the values of each metric
+    are ranked once across all groups, after which the U statistic and tie correction of every
+    comparison are computed together through binary search of the ranks of each group. P-values
+    match those of `scipy.stats.mannwhitneyu` with its default arguments: the normal approximation
+    with tie and continuity correction is used, except for comparisons of small samples (eight or
+    fewer values in either group) without ties, for which the exact distribution is used. P-values
+    are then corrected for multiple testing across all comparisons and metrics [1].
+
+    Parameters
+    ----------
+    data : `pandas.DataFrame`
+        Tidy table with one row per observation (e.g. cell), such as the summary motility metrics.
+    comparisons : list of tuple
+        Pairs of groups ("a", "b") to compare. Groups are given by their value of `group_columns`,
+        or a tuple of values if there are several group columns.
+    metric_columns : list of str
+        Columns of `data` to test. Missing values are ignored.
+    group_columns : str or list of str
+        Column(s) of `data` that define the groups, e.g. ["strain", "drug"].
+    correction_method : str
+        Method for correcting for multiple testing, e.g. "fdr_bh" (Benjamini-Hochberg) or "holm",
+        as accepted by `statsmodels.stats.multitest.multipletests`.
+    min_sample_size : int
+        Minimum size of both samples below which a comparison is not tested (p-value of NaN).
+
+    Returns
+    -------
+    results_dataframe : `pandas.DataFrame`
+        One row per metric and comparison with the groups compared, their sample sizes, the U
+        statistic of group "a", the p-value, the corrected p-value, and the significance symbol of
+        the corrected p-value.
+
+    References
+    ----------
+    [1] https://www.statsmodels.org/stable/generated/statsmodels.stats.multitest.multipletests.html
+    """
+    group_codes, codes_a, codes_b, num_groups = _get_group_codes(data, group_columns, comparisons)
+    comparison_indices = np.arange(len(comparisons))
+
+    results_dataframes = []
+    for metric in metric_columns:
+        values = data[metric].to_numpy(dtype=float)
+        is_valid = ~np.isnan(values) & (group_codes >= 0)
+        codes = group_codes[is_valid]
+        # rank once: dense ranks of the values of every group together
+        _, ranks = np.unique(values[is_valid], return_inverse=True)
+        num_ranks = ranks.max() + 1 if ranks.size else 1
+
+        # sorted (group, rank) keys such that the ranks of each group are contiguous and sorted
+        sorted_keys = np.sort(codes.astype(np.int64) * num_ranks + ranks)
+        group_sizes = np.bincount(codes, minlength=num_groups + 1)
+        group_starts = np.cumsum(group_sizes) - group_sizes
+        sizes_a, sizes_b = group_sizes[codes_a], group_sizes[codes_b]
+
+        # U statistic of "a": number of values of "b" below each value of "a" (ties count half)
+        element_comparisons = np.repeat(comparison_indices, sizes_a)
+        element_keys = sorted_keys[_ragged_arange(group_starts[codes_a], sizes_a)]
+        query_keys = element_keys - (codes_a - codes_b)[element_comparisons] * num_ranks
+        num_below = np.searchsorted(sorted_keys, query_keys, side="left")
+        num_below_or_tied = np.searchsorted(sorted_keys, query_keys, side="right")
+        start_b = group_starts[codes_b][element_comparisons]
+        u_statistics = np.bincount(
+            element_comparisons,
+            weights=(num_below + num_below_or_tied - 2 * start_b) / 2,
+            minlength=len(comparisons),
+        )
+
+        # tie term: sum of t^3 - t over the sizes t of the groups of tied values in each comparison
+        pooled_comparisons = np.concatenate(
+            [element_comparisons, np.repeat(comparison_indices, sizes_b)]
+        )
+        pooled_ranks = np.concatenate(
+            [
+                element_keys % num_ranks,
+                sorted_keys[_ragged_arange(group_starts[codes_b], sizes_b)] % num_ranks,
+            ]
+        )
+        tied_keys, tie_sizes = np.unique(
+            pooled_comparisons.astype(np.int64) * num_ranks + pooled_ranks, return_counts=True
+        )
+        tie_sizes = tie_sizes.astype(float)
+        tie_terms = np.bincount(
+            tied_keys // num_ranks, weights=tie_sizes**3 - tie_sizes, minlength=len(comparisons)
+        )
+
+        p_values = _mann_whitney_p_values(u_statistics, sizes_a, sizes_b, tie_terms)
+        is_tested = (sizes_a >= min_sample_size) & (sizes_b >= min_sample_size)
+        p_values[~is_tested] = np.nan
+
+        # exact p-values for small samples without ties, as chosen by `scipy.stats.mannwhitneyu`
+        is_exact = is_tested & ((sizes_a <= 8) | (sizes_b <= 8)) & (tie_terms == 0)
+        for i in np.flatnonzero(is_exact):
+            sample_a = values[is_valid][codes == codes_a[i]]
+            sample_b = values[is_valid][codes == codes_b[i]]
+            p_values[i] = stats.mannwhitneyu(sample_a, sample_b, method="exact").pvalue
+
+        results_dataframes.append(
+            pd.DataFrame(
+                {
+                    "metric": metric,
+                    "group_a": [key_a for key_a, _ in comparisons],
+                    "group_b": [key_b for _, key_b in comparisons],
+                    "n_a": sizes_a,
+                    "n_b": sizes_b,
+                    "u_statistic": u_statistics,
+                    "p_value": p_values,
+                }
+            )
+        )
+
+    results_dataframe = pd.concat(results_dataframes, ignore_index=True)
+
+    # correct for multiple testing across every comparison and metric that was tested
+    p_values = results_dataframe["p_value"].to_numpy()
+    adjusted_p_values = np.full_like(p_values, np.nan)
+    is_tested = ~np.isnan(p_values)
+    if is_tested.any():
+        _, adjusted_p_values[is_tested], _, _ = multipletests(
+            p_values[is_tested], method=correction_method
+        )
+    results_dataframe["p_value_adjusted"] = adjusted_p_values
+    results_dataframe["significance"] = [
+        map_p_value_to_asterisks(p_value) if not np.isnan(p_value) else "n/a"
+        for p_value in adjusted_p_values
+    ]
+    return results_dataframe
+
+
+def lookup_p_value(results_dataframe, metric, group_a, group_b, p_value_column="p_value_adjusted"):
+    """Look up the p-value of a comparison in the results of `compute_mann_whitney_tests`.
+
+    The two-sided p-value does not depend on the order of the groups, so either order is found.
+    """
+    is_metric = results_dataframe["metric"] == metric
+    for key_a, key_b in [(group_a, group_b), (group_b, group_a)]:
+        is_match = (
+            is_metric
+            & (results_dataframe["group_a"] == key_a)
+            & (results_dataframe["group_b"] == key_b)
+        )
+        if is_match.any():
+            return results_dataframe.loc[is_match, p_value_column].iloc[0]
+    msg = f"No comparison of '{group_a}' and '{group_b}' for metric '{metric}' found."
+    raise KeyError(msg)
+
+
+def compute_effect_sizes(
+    data,
+    comparisons,
+    metric_columns,
+    group_columns=("strain", "drug", "concentration"),
+    effect_size="cliffs_delta",
+    method="bootstrap",
+    num_replicates=10_000,
+    confidence_level=0.95,
+    memory_budget_mb=256,
+    seed=0,
+    num_jobs=1,
+):
+    """Estimate effect sizes between pairs of groups with bootstrap or permutation replicates.
+
+    Two effect sizes are supported: the difference in medians of the two groups ("a" minus "b"),
+    and Cliff's delta [1], the probability that a value of "a" is greater than a value of "b"
+    minus the probability that it is smaller. With `method="bootstrap"`, each group is resampled
+    with replacement to give a percentile confidence interval of the effect size. With
+    `method="permutation"`, the values of both groups are pooled and randomly reassigned to give a
+    two-sided p-value of the null hypothesis of no difference between the groups.
+
+    Replicates are drawn in batches as (replicates, values) arrays of the number of times each
+    value is drawn, from which both effect sizes are computed without sorting each replicate.
+    Batches are sized such that their arrays take up no more than `memory_budget_mb`. Every
+    comparison and metric is resampled with its own random stream spawned from `seed`, so results
+    do not depend on `num_jobs`.
+
+    Parameters
+    ----------
+    data : `pandas.DataFrame`
+        Tidy table with one row per observation (e.g. cell), such as the summary motility metrics.
+    comparisons : list of tuple
+        Pairs of groups ("a", "b") to compare. Groups are given by their value of `group_columns`,
+        or a tuple of values if there are several group columns.
+    metric_columns : list of str
+        Columns of `data` to estimate effect sizes of. Missing values are ignored.
+    group_columns : str or sequence of str
+        Column(s) of `data` that define the groups.
+    effect_size : str
+        Either "median_difference" or "cliffs_delta".
+    method : str
+        Either "bootstrap" (confidence interval) or "permutation" (p-value).
+    num_replicates : int
+        Number of bootstrap or permutation replicates per comparison and metric.
+    confidence_level : float
+        Confidence level of the bootstrap confidence interval.
+    memory_budget_mb : float
+        Approximate memory (in MiB) that each batch of replicates may take up (per process).
+    seed : int or None
+        Seed for the random number generator.
+    num_jobs : int
+        Number of worker processes across which comparisons are distributed.
+
+    Returns
+    -------
+    results_dataframe : `pandas.DataFrame`
+        One row per metric and comparison with the groups compared, their sample sizes, the
+        estimated effect size, and either the bounds of its confidence interval ("ci_low" and
+        "ci_high") or its permutation p-value ("p_value"). Comparisons with an empty group are NaN.
+
+    References
+    ----------
+    [1] Cliff, N. (1993). Dominance statistics: Ordinal analyses to answer ordinal questions.
+        Psychological Bulletin, 114(3), 494-509.
+    """
+    if effect_size not in EFFECT_SIZE_FUNCTIONS:
+        msg = f"Unknown effect size '{effect_size}'. Expected one of {list(EFFECT_SIZE_FUNCTIONS)}."
+        raise ValueError(msg)
+    if method not in {"bootstrap", "permutation"}:
+        msg = f"Unknown method '{method}'. Expected 'bootstrap' or 'permutation'."
+        raise ValueError(msg)
+
+    group_columns = [group_columns] if isinstance(group_columns, str) else list(group_columns)
+    group_codes, codes_a, codes_b, _ = _get_group_codes(data, group_columns, comparisons)
+
+    # one task per metric and comparison, each with its own random stream
+    tasks = []
+    for metric in metric_columns:
+        values = data[metric].to_numpy(dtype=float)
+        for code_a, code_b in zip(codes_a, codes_b, strict=True):
+            sample_a = values[(group_codes == code_a) & ~np.isnan(values)]
+            sample_b = values[(group_codes == code_b) & ~np.isnan(values)]
+            tasks.append((sample_a, sample_b))
+    task_seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+
+    resample = partial(
+        _resample_effect_size,
+        effect_size=effect_size,
+        method=method,
+        num_replicates=num_replicates,
+        confidence_level=confidence_level,
+        memory_budget_mb=memory_budget_mb,
+    )
+    samples_a, samples_b = zip(*tasks, strict=True) if tasks else ((), ())
+    if num_jobs > 1:
+        with ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            # `Executor.map` yields results in the order of its inputs
+            chunksize = max(len(tasks) // (4 * num_jobs), 1)
+            results = list(
+                executor.map(resample, samples_a, samples_b, task_seeds, chunksize=chunksize)
+            )
+    else:
+        results = list(map(resample, samples_a, samples_b, task_seeds))
+
+    statistic_columns = ["ci_low", "ci_high"] if method == "bootstrap" else ["p_value"]
+    results_dataframe = pd.DataFrame(
+        {
+            "metric": np.repeat(metric_columns, len(comparisons)),
+            "group_a": [key_a for key_a, _ in comparisons] * len(metric_columns),
+            "group_b": [key_b for _, key_b in comparisons] * len(metric_columns),
+            "n_a": [sample_a.size for sample_a in samples_a],
+            "n_b": [sample_b.size for sample_b in samples_b],
+            "effect_size": effect_size,
+        }
+    )
+    results_dataframe[["estimate", *statistic_columns]] = np.array(results).reshape(
+        len(tasks), 1 + len(statistic_columns)
+    )
+    return results_dataframe
+
+
+def _median_difference(sorted_a, counts_a, sorted_b, counts_b):
+    """Difference in medians of replicates given as counts of each value of sorted samples."""
+    return _weighted_median(sorted_a, counts_a) - _weighted_median(sorted_b, counts_b)
+
+
+def _weighted_median(sorted_values, counts):
+    """Median of each replicate (row of `counts`) of a sample of sorted values."""
+    num_values = counts[0].sum()
+    cumulative_counts = np.cumsum(counts, axis=1)
+    # the value at (0-based) position k of each replicate is the first whose cumulative count > k
+    lower = sorted_values[(cumulative_counts <= (num_values - 1) // 2).sum(axis=1)]
+    upper = sorted_values[(cumulative_counts <= num_values // 2).sum(axis=1)]
+    return (lower + upper) / 2
+
+
+def _cliffs_delta(sorted_a, counts_a, sorted_b, counts_b):
+    """Cliff's delta of replicates given as counts of each value of sorted samples."""
+    # number of values of "b" below (or tied with) each value of "a" from cumulative counts of "b"
+    below = np.searchsorted(sorted_b, sorted_a, side="left")
+    below_or_tied = np.searchsorted(sorted_b, sorted_a, side="right")
+    cumulative_counts_b = np.zeros((counts_b.shape[0], sorted_b.size + 1))
+    np.cumsum(counts_b, axis=1, out=cumulative_counts_b[:, 1:])
+    num_b = cumulative_counts_b[:, -1:]
+    # (#(a > b) - #(a < b)) summed over the values of "a" weighted by their counts
+    dominance = np.take(cumulative_counts_b, below, axis=1)
+    dominance += np.take(cumulative_counts_b, below_or_tied, axis=1)
+    dominance -= num_b
+    counts_a = counts_a.astype(float, copy=False)
+    return np.einsum("ij,ij->i", counts_a, dominance) / (counts_a.sum(axis=1) * num_b[:, 0])
+
+
+EFFECT_SIZE_FUNCTIONS = {
+    "median_difference": _median_difference,
+    "cliffs_delta": _cliffs_delta,
+}
+
+
+def _draw_bootstrap_counts(rng, num_replicates, num_values):
+    """Number of times each value is drawn in bootstrap replicates (resampling with replacement)."""
+    draws = rng.integers(0, num_values, size=(num_replicates, num_values))
+    draws += num_values * np.arange(num_replicates)[:, np.newaxis]
+    counts = np.bincount(draws.ravel(), minlength=num_replicates * num_values)
+    return counts.reshape(num_replicates, num_values)
+
+
+def _draw_permutation_counts(rng, num_replicates, num_values, num_values_a):
+    """Whether each pooled value is assigned to group "a" in permutation replicates."""
+    # the values with the `num_values_a` smallest random keys are assigned to "a", which only
+    # takes a partition of the keys rather than a full shuffle of the values
+    keys = rng.random((num_replicates, num_values))
+    thresholds = np.partition(keys, num_values_a - 1, axis=1)[:, num_values_a - 1, np.newaxis]
+    return (keys <= thresholds).astype(np.int64)
+
+
+def _resample_effect_size(
+    sample_a,
+    sample_b,
+    seed,
+    effect_size,
+    method,
+    num_replicates,
+    confidence_level,
+    memory_budget_mb,
+):
+    """Estimate the effect size of two samples and its bootstrap interval or permutation p-value.
+
+    Returns
+    -------
+    estimate, ci_low, ci_high : float
+        Effect size and bounds of its confidence interval, if `method="bootstrap"`.
+    estimate, p_value : float
+        Effect size and its two-sided p-value, if `method="permutation"`.
+    """
+    num_statistics = 3 if method == "bootstrap" else 2
+    if sample_a.size == 0 or sample_b.size == 0:
+        return (np.nan,) * num_statistics
+
+    compute_effect_size = EFFECT_SIZE_FUNCTIONS[effect_size]
+    sorted_a, sorted_b = np.sort(sample_a), np.sort(sample_b)
+    estimate = compute_effect_size(
+        sorted_a, np.ones((1, sorted_a.size)), sorted_b, np.ones((1, sorted_b.size))
+    )[0]
+
+    # each replicate takes up a few arrays of (int64 or float64) counts of every value
+    num_values = sorted_a.size + sorted_b.size
+    batch_size = max(int(memory_budget_mb * 2**20 / (8 * 6 * num_values)), 1)
+    rng = np.random.default_rng(seed)
+    pooled = np.sort(np.concatenate([sorted_a, sorted_b]))
+
+    replicates = []
+    for start in range(0, num_replicates, batch_size):
+        num_batch_replicates = min(batch_size, num_replicates - start)
+        if method == "bootstrap":
+            counts_a = _draw_bootstrap_counts(rng, num_batch_replicates, sorted_a.size)
+            counts_b = _draw_bootstrap_counts(rng, num_batch_replicates, sorted_b.size)
+            replicates.append(compute_effect_size(sorted_a, counts_a, sorted_b, counts_b))
+        else:
+            counts_a = _draw_permutation_counts(
+                rng, num_batch_replicates, num_values, sorted_a.size
+            )
+            replicates.append(compute_effect_size(pooled, counts_a, pooled, 1 - counts_a))
+    replicates = np.concatenate(replicates)
+
+    if method == "bootstrap":
+        alpha = 1 - confidence_level
+        ci_low, ci_high = np.quantile(replicates, [alpha / 2, 1 - alpha / 2])
+        return estimate, ci_low, ci_high
+
+    p_value = (1 + np.sum(np.abs(replicates) >= np.abs(estimate) - 1e-12)) / (1 + num_replicates)
+    return estimate, p_value
+
+
+def _get_group_codes(data, group_columns, comparisons):
+    """Number the groups of a table and map the groups of each comparison to their numbers.
+
+    Groups are numbered in the order of the keys of the groupby, rows with missing keys are given
+    -1, and groups of comparisons that are absent from the table are given `num_groups`.
+    """
+    grouped = data.groupby(group_columns, sort=False)
+    key_to_code = {key: code for code, key in enumerate(grouped.size().index)}
+    num_groups = len(key_to_code)
+    group_codes = grouped.ngroup().fillna(-1).to_numpy(dtype=int)
+    codes_a = np.array([key_to_code.get(key_a, num_groups) for key_a, _ in comparisons], dtype=int)
+    codes_b = np.array([key_to_code.get(key_b, num_groups) for _, key_b in comparisons], dtype=int)
+    return group_codes, codes_a, codes_b, num_groups
+
+
+def _ragged_arange(starts, lengths):
+    """Concatenate the ranges `starts[i]` to `starts[i] + lengths[i]` without a Python loop."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets - starts, lengths)
+
+
+def _mann_whitney_p_values(u_statistics, sizes_a, sizes_b, tie_terms):
+    """Two-sided p-values of U statistics from the tie- and continuity-corrected normal approx."""
+    u_statistics = np.maximum(u_statistics, sizes_a * sizes_b - u_statistics)
+    num_values = sizes_a + sizes_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(
+            sizes_a
+            * sizes_b
+            / 12
+            * ((num_values + 1) - tie_terms / (num_values * (num_values - 1)))
+        )
+        z_scores = (u_statistics - sizes_a * sizes_b / 2 - 0.5) / sigma
+    return np.clip(2 * stats.norm.sf(z_scores), 0, 1)
+
+
 def split_violin_plot_with_stats(
     data,
     x_variable,
     y_variable,
     hue_variable,
     min_sample_size=6,
+    p_value=None,
     **split_violin_kwargs,
 ):
-    """Run statistical tests and add annotations of the results to a seaborn violin plot."""
+    """Run statistical tests and add annotations of the results to a seaborn violin plot.
+
+    A precomputed p-value (e.g. from `compute_mann_whitney_tests`) can be given to annotate the
+    plot with instead of running the test.
+    """
     data = data.reset_index(drop=True).copy()
     ensure_two_groups(data, groupby_variable=hue_variable)
 
@@ -64,6 +507,7 @@ def split_violin_plot_with_stats(
         min_sample_size,
         orientation="horizontal",
         center_annotation=True,
+        p_value=p_value,
     )
 
     # add sample size to legend
@@ -83,9 +527,17 @@ def kde_plot_with_stats(
     hue_variable,
     groups=None,
     min_sample_size=6,
+    p_value=None,
+    binned=False,
     **kde_plot_kwargs,
 ):
-    """Run statistical tests and add annotations of the results to a seaborn KDE plot."""
+    """Run statistical tests and add annotations of the results to a seaborn KDE plot.
+
+    A precomputed p-value (e.g. from `compute_mann_whitney_tests`) can be given to annotate the
+    plot with instead of running the test. For large groups (~10^5 cells or more), `binned=True`
+    draws the KDEs with `binned_kdeplot` rather than `seaborn.kdeplot`, which is much faster. The
+    statistical test and the sample sizes in the legend are always based on all of the data.
+    """
     data = data.reset_index(drop=True).copy()
 
     # ensure two groups
@@ -100,7 +552,8 @@ def kde_plot_with_stats(
             raise ValueError(msg)
 
     # render KDE plot
-    ax = sns.kdeplot(
+    kdeplot = binned_kdeplot if binned else sns.kdeplot
+    ax = kdeplot(
         data=data,
         x=x_variable,
         hue=hue_variable,
@@ -119,7 +572,7 @@ def kde_plot_with_stats(
 
     # annotate stats
     annotate_statistical_significance(
-        *group_x_values, ax, min_sample_size, orientation="horizontal"
+        *group_x_values, ax, min_sample_size, orientation="horizontal", p_value=p_value
     )
 
     # add sample size to legend
@@ -138,10 +591,28 @@ def joint_grid_with_stats(
     hue_variable,
     groups=None,
     min_sample_size=6,
+    p_values=None,
+    joint_kind="scatter",
+    binned=False,
     **joint_grid_kwargs,
 ):
-    """Run statistical tests and add annotations of the results to a seaborn JointGrid."""
+    """Run statistical tests and add annotations of the results to a seaborn JointGrid.
+
+    Precomputed p-values of the x and y variables (e.g. from `compute_mann_whitney_tests`) can
+    be given as a tuple to annotate the marginal plots with instead of running the tests.
+
+    For large groups (~10^5 cells or more), the joint plot can be drawn as a density rather than
+    a point per cell with `joint_kind`: "rasterized" draws the scatter plot as an image within
+    vector output (e.g. PDF) such that file sizes do not grow with the number of cells, while
+    "hexbin" draws the density of each group as hexagonal bins shaded in the color of the group.
+    With `binned=True`, the marginal KDEs are drawn with `binned_kdeplot`. The statistical tests
+    and the sample sizes in the legend are always based on all of the data.
+    """
+    if joint_kind not in {"scatter", "rasterized", "hexbin"}:
+        msg = f"Unknown joint kind '{joint_kind}'. Expected 'scatter', 'rasterized', or 'hexbin'."
+        raise ValueError(msg)
     data = data.reset_index(drop=True).copy()
+    p_value_x, p_value_y = (None, None) if p_values is None else p_values
 
     # ensure two groups
     if groups is None:
@@ -164,8 +635,31 @@ def joint_grid_with_stats(
     )
 
     # plot onto JointGrid
-    ax.plot_joint(sns.scatterplot, legend=True)
-    ax.plot_marginals(sns.kdeplot, lw=2, fill=True, common_norm=False)
+    if joint_kind == "hexbin":
+        hue_colors = get_hue_colors(
+            data,
+            hue_variable,
+            palette=joint_grid_kwargs.get("palette"),
+            hue_order=joint_grid_kwargs.get("hue_order"),
+        )
+        _plot_hexbin_densities(ax.ax_joint, data, x_variable, y_variable, hue_variable, hue_colors)
+    else:
+        ax.plot_joint(sns.scatterplot, legend=True, rasterized=joint_kind == "rasterized")
+    if binned:
+        marginal_kwargs = {
+            "data": data,
+            "hue": hue_variable,
+            "palette": joint_grid_kwargs.get("palette"),
+            "hue_order": joint_grid_kwargs.get("hue_order"),
+            "legend": False,
+            "lw": 2,
+            "fill": True,
+            "common_norm": False,
+        }
+        binned_kdeplot(x=x_variable, ax=ax.ax_marg_x, **marginal_kwargs)
+        binned_kdeplot(y=y_variable, ax=ax.ax_marg_y, **marginal_kwargs)
+    else:
+        ax.plot_marginals(sns.kdeplot, lw=2, fill=True, common_norm=False)
 
     # extract distributions for statistical tests
     group_keys = []
@@ -181,10 +675,10 @@ def joint_grid_with_stats(
 
     # annotate stats
     annotate_statistical_significance(
-        *group_x_values, ax.ax_marg_x, min_sample_size, orientation="horizontal"
+        *group_x_values, ax.ax_marg_x, min_sample_size, orientation="horizontal", p_value=p_value_x
     )
     annotate_statistical_significance(
-        *group_y_values, ax.ax_marg_y, min_sample_size, orientation="vertical"
+        *group_y_values, ax.ax_marg_y, min_sample_size, orientation="vertical", p_value=p_value_y
     )
 
     # add sample size to legend
@@ -198,6 +692,179 @@ def joint_grid_with_stats(
     return ax
 
 
+def compute_binned_kde(values, bw_adjust=1.0, cut=3, clip=None, num_bins=KDE_NUM_BINS):
+    """Estimate the Gaussian KDE of a sample by binning it and convolving with the kernel (FFT).
+
+    Rather than evaluating a Gaussian at every grid point for every value, which scales with the
+    number of values, the values are linearly binned onto a fine grid and the bin counts are
+    convolved with a discretized Gaussian kernel through the FFT, which scales with the number of
+    bins only. The bandwidth (Scott's rule scaled by `bw_adjust`) and extent of the grid (`cut`
+    bandwidths beyond the extreme values, limited to `clip`) follow `seaborn.kdeplot`.
+
+    Parameters
+    ----------
+    values : (N,) array-like
+        Sample from which to estimate the density. Missing values are ignored.
+    bw_adjust : float
+        Factor by which to scale the bandwidth from Scott's rule.
+    cut : float
+        Number of bandwidths by which the grid extends beyond the extreme values.
+    clip : tuple of float or None
+        Lower and upper limits of the grid.
+    num_bins : int
+        Number of bins (and grid points) of the grid.
+
+    Returns
+    -------
+    grid : (num_bins,) array or None
+        Centers of the bins. None if the density cannot be estimated (fewer than two distinct
+        values).
+    density : (num_bins,) array or None
+        Estimated probability density at each grid point.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if values.size < 2 or values.min() == values.max():
+        return None, None
+    bandwidth = bw_adjust * values.std(ddof=1) * values.size ** (-1 / 5)
+
+    # linearly bin the values onto a grid spanning `cut` bandwidths beyond the extreme values
+    grid_min = values.min() - cut * bandwidth
+    grid_max = values.max() + cut * bandwidth
+    grid, bin_width = np.linspace(grid_min, grid_max, num_bins, retstep=True)
+    positions = (values - grid_min) / bin_width
+    left_bins = np.minimum(positions.astype(int), num_bins - 2)
+    right_weights = positions - left_bins
+    bin_counts = np.bincount(left_bins, weights=1 - right_weights, minlength=num_bins)
+    bin_counts += np.bincount(left_bins + 1, weights=right_weights, minlength=num_bins)
+
+    # convolve with a Gaussian kernel truncated at 4 bandwidths
+    kernel_half_width = min(int(np.ceil(4 * bandwidth / bin_width)), num_bins - 1)
+    kernel_positions = np.arange(-kernel_half_width, kernel_half_width + 1) * bin_width
+    kernel = stats.norm.pdf(kernel_positions, scale=bandwidth)
+    density = signal.fftconvolve(bin_counts, kernel, mode="same") / values.size
+    density = np.clip(density, 0, None)
+
+    if clip is not None:
+        is_clipped = (grid >= clip[0]) & (grid <= clip[1])
+        grid, density = grid[is_clipped], density[is_clipped]
+    return grid, density
+
+
+def get_hue_colors(data, hue_variable, palette=None, hue_order=None):
+    """Map each level of a hue variable to a color as seaborn does.
+
+    Levels are ordered as given by `hue_order`, otherwise by order of appearance (or sorted, if
+    numeric), and colored by `palette`, which may be a dict of colors or the name of a palette.
+    """
+    if hue_order is None:
+        hue_values = data[hue_variable].dropna()
+        hue_order = list(pd.unique(hue_values))
+        if pd.api.types.is_numeric_dtype(hue_values):
+            hue_order = sorted(hue_order)
+    if isinstance(palette, dict):
+        return {level: palette[level] for level in hue_order}
+    return dict(zip(hue_order, sns.color_palette(palette, len(hue_order)), strict=True))
+
+
+def binned_kdeplot(
+    data,
+    x=None,
+    y=None,
+    hue=None,
+    palette=None,
+    hue_order=None,
+    common_norm=True,
+    fill=False,
+    bw_adjust=1.0,
+    cut=3,
+    clip=None,
+    legend=True,
+    ax=None,
+    lw=None,
+    alpha=0.25,
+):
+    """Plot KDEs of large samples with `compute_binned_kde` as a drop-in for `seaborn.kdeplot`.
+
+    Supports the subset of the arguments of `seaborn.kdeplot` used throughout this repo. Give the
+    variable as `x` for a horizontal or as `y` for a vertical density.
+
+    Returns
+    -------
+    ax : `matplotlib.axes.Axes`
+        Axis on which the KDEs are plotted.
+    """
+    if ax is None:
+        ax = plt.gca()
+    variable = x if y is None else y
+    if hue is None:
+        groups = {variable: data[variable]}
+        hue_colors = {variable: sns.color_palette(palette, 1)[0]}
+        legend = False
+    else:
+        hue_colors = get_hue_colors(data, hue, palette=palette, hue_order=hue_order)
+        groups = {level: data.loc[data[hue] == level, variable] for level in hue_colors}
+    num_values = sum(group.notna().sum() for group in groups.values())
+
+    handles = []
+    for level, values in groups.items():
+        color = hue_colors[level]
+        grid, density = compute_binned_kde(values, bw_adjust=bw_adjust, cut=cut, clip=clip)
+        if grid is not None:
+            if common_norm:
+                density = density * values.notna().sum() / num_values
+            if y is None:
+                if fill:
+                    ax.fill_between(grid, density, color=color, alpha=alpha, linewidth=0)
+                ax.plot(grid, density, color=color, lw=lw)
+            else:
+                if fill:
+                    ax.fill_betweenx(grid, density, color=color, alpha=alpha, linewidth=0)
+                ax.plot(density, grid, color=color, lw=lw)
+        if fill:
+            handles.append(Patch(facecolor=to_rgba(color, alpha), edgecolor=color, lw=lw))
+        else:
+            handles.append(Line2D([], [], color=color, lw=lw))
+
+    if y is None:
+        ax.set_xlabel(x)
+        ax.set_ylabel("Density")
+    else:
+        ax.set_xlabel("Density")
+        ax.set_ylabel(y)
+    if legend:
+        ax.legend(handles, [str(level) for level in groups], title=hue)
+    return ax
+
+
+def _plot_hexbin_densities(ax, data, x_variable, y_variable, hue_variable, hue_colors):
+    """Plot the density of each group of a joint plot as hexagonal bins shaded in its color."""
+    extent = (
+        data[x_variable].min(),
+        data[x_variable].max(),
+        data[y_variable].min(),
+        data[y_variable].max(),
+    )
+    handles = []
+    for level, color in hue_colors.items():
+        group = data.loc[data[hue_variable] == level]
+        ax.hexbin(
+            group[x_variable],
+            group[y_variable],
+            gridsize=50,
+            extent=extent,
+            mincnt=1,
+            bins="log",
+            cmap=sns.light_palette(color, as_cmap=True),
+            alpha=0.7,
+            linewidths=0,
+        )
+        handles.append(Patch(facecolor=color, edgecolor=color))
+    ax.set_xlabel(x_variable)
+    ax.set_ylabel(y_variable)
+    ax.legend(handles, [str(level) for level in hue_colors], title=hue_variable)
+
+
 def annotate_statistical_significance(
     sample_a_values,
     sample_b_values,
@@ -205,6 +872,7 @@ def annotate_statistical_significance(
     min_sample_size=6,
     center_annotation=False,
     orientation="horizontal",
+    p_value=None,
 ):
     """Measure statistical significance of two distributions and annotate plot accordingly.
 
@@ -224,6 +892,9 @@ def annotate_statistical_significance(
         is categorical as opposed to numerical.
     orientation : str
         Whether the matplotlib axis is oriented horizontally or vertically.
+    p_value : float or None
+        Precomputed p-value, e.g. corrected for multiple testing by `compute_mann_whitney_tests`.
+        If None, the Mann-Whitney U test is run on the two samples.
 
     References
     ----------
@@ -234,8 +905,9 @@ def annotate_statistical_significance(
         msg = "Sample size of one or both distributions less than `min_sample_size`."
         raise ValueError(msg)
 
-    # Mann-Whitney U test
-    _, p_value = stats.mannwhitneyu(sample_a_values, sample_b_values, alternative="two-sided")
+    # Mann-Whitney U test (unless precomputed)
+    if p_value is None:
+        _, p_value = stats.mannwhitneyu(sample_a_values, sample_b_values, alternative="two-sided")
     # get appropriate number of asterisks based on p-value
     significance_text = map_p_value_to_asterisks(p_value)
 
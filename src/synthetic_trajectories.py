@@ -0,0 +1,146 @@
+import string
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TRAJECTORY_CSV_COLUMNS = [
+    "ID",
+    "t",
+    "x",
+    "y",
+    "z",
+    "area",
+    "eccentricity",
+    "major_axis_length",
+    "minor_axis_length",
+    "orientation",
+    "perimeter",
+    "solidity",
+]
+
+
+def generate_trajectory_dataframe(
+    num_tracks,
+    frames_per_track,
+    image_shape=(1200, 1200),
+    mean_step_length=3.0,
+    turning_sigma=0.3,
+    seed=None,
+):
+    """Generate synthetic cell trajectories of a single well with the schema of the real data.
+
+    Each trajectory is a correlated random walk: the heading of a cell changes by a normally
+    distributed turning angle each frame while the step length is drawn from an exponential
+    distribution. Trajectories start at random frames so that the number of tracked cells varies
+    over time, and morphology columns are filled with plausible values for cells ~10 µm across.
+
+    Parameters
+    ----------
+    num_tracks : int
+        Number of cell trajectories in the well.
+    frames_per_track : int
+        Number of frames spanned by each trajectory.
+    image_shape : tuple of int
+        Height and width (in pixels) of the field of view within which cells start.
+    mean_step_length : float
+        Mean distance (in pixels) traversed by a cell per frame.
+    turning_sigma : float
+        Standard deviation (in radians) of the turning angle per frame.
+    seed : int or None
+        Seed for the random number generator.
+
+    Returns
+    -------
+    dataframe : `pandas.DataFrame`
+        Cell trajectories with one row per tracked position, grouped by trajectory and ordered by
+        frame number within each trajectory, as in the CSV files of cell trajectories.
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = num_tracks * frames_per_track
+
+    track_ids = np.repeat(np.arange(1, num_tracks + 1), frames_per_track)
+    start_frames = rng.integers(0, frames_per_track, size=num_tracks)
+    t = np.repeat(start_frames, frames_per_track) + np.tile(np.arange(frames_per_track), num_tracks)
+
+    # correlated random walk of every track at once (cumulative sums restarted per track)
+    headings = rng.uniform(-np.pi, np.pi, size=num_tracks)
+    turning_angles = rng.normal(0, turning_sigma, size=(num_tracks, frames_per_track))
+    turning_angles[:, 0] = headings
+    step_lengths = rng.exponential(mean_step_length, size=(num_tracks, frames_per_track))
+    step_lengths[:, 0] = 0
+    angles = np.cumsum(turning_angles, axis=1)
+    x0 = rng.uniform(0, image_shape[1], size=(num_tracks, 1))
+    y0 = rng.uniform(0, image_shape[0], size=(num_tracks, 1))
+    x = x0 + np.cumsum(step_lengths * np.cos(angles), axis=1)
+    y = y0 + np.cumsum(step_lengths * np.sin(angles), axis=1)
+
+    # morphology of roughly elliptical cells
+    major_axis_length = rng.normal(13, 1.5, size=num_rows).clip(min=5)
+    minor_axis_length = major_axis_length * rng.uniform(0.7, 1.0, size=num_rows)
+    area = np.pi / 4 * major_axis_length * minor_axis_length
+    eccentricity = np.sqrt(1 - (minor_axis_length / major_axis_length) ** 2)
+    perimeter = np.pi * (major_axis_length + minor_axis_length) / 2
+
+    dataframe = pd.DataFrame(
+        {
+            "ID": track_ids,
+            "t": t,
+            "x": x.ravel(),
+            "y": y.ravel(),
+            "z": 0.0,
+            "area": area.round(),
+            "eccentricity": eccentricity,
+            "major_axis_length": major_axis_length,
+            "minor_axis_length": minor_axis_length,
+            "orientation": rng.uniform(-np.pi / 2, np.pi / 2, size=num_rows),
+            "perimeter": perimeter,
+            "solidity": rng.uniform(0.9, 1.0, size=num_rows),
+        },
+        columns=TRAJECTORY_CSV_COLUMNS,
+    )
+    return dataframe.sort_values(["ID", "t"], kind="stable", ignore_index=True)
+
+
+def write_synthetic_dataset(
+    output_directory, num_wells, num_tracks, frames_per_track, seed=None, **kwargs
+):
+    """Write CSV files of synthetic cell trajectories for a number of wells.
+
+    Files are named after the wells of a 384-well plate (`WellA01`, `WellA02`, ...) following the
+    naming convention of the real data, such that the well ID can be parsed from the file name.
+
+    Parameters
+    ----------
+    output_directory : `pathlib.Path`
+        Directory in which to write the CSV files. Created if it does not exist.
+    num_wells : int
+        Number of wells (CSV files) to generate.
+    num_tracks, frames_per_track : int
+        Number of trajectories per well and number of frames per trajectory.
+    seed : int or None
+        Seed for the random number generator. Each well is generated from a different stream.
+    **kwargs
+        Additional keyword arguments passed to `generate_trajectory_dataframe`.
+
+    Returns
+    -------
+    csv_filepaths : list of `pathlib.Path`
+        File paths to the CSV files of each well.
+    """
+    output_directory = Path(output_directory)
+    output_directory.mkdir(exist_ok=True, parents=True)
+
+    well_seeds = np.random.SeedSequence(seed).spawn(num_wells)
+    csv_filepaths = []
+    for i, well_seed in enumerate(well_seeds):
+        row, column = divmod(i, 24)
+        well_id = f"Well{string.ascii_uppercase[row]}{column + 1:02d}"
+        csv_filepath = output_directory / f"{well_id}_ChannelSynthetic_Seq{i:04d}_tracks.csv"
+        dataframe = generate_trajectory_dataframe(
+            num_tracks, frames_per_track, seed=well_seed, **kwargs
+        )
+        dataframe.to_csv(csv_filepath, index=False)
+        csv_filepaths.append(csv_filepath)
+
+    return csv_filepaths
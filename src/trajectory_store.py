@@ -0,0 +1,331 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+TRACK_IDS_FILENAME = "track_ids.npy"
+OFFSETS_FILENAME = "offsets.npy"
+TRACK_ID_COLUMN = "ID"
+TIME_COLUMN = "t"
+# number of rows read at a time when streaming cell trajectory data
+CHUNK_SIZE = 2**20
+# dtypes of the columns needed for computing motility metrics when streaming CSV files. Track IDs
+# and frame numbers are downcast, while coordinates are kept at double precision as the turning-
+# based metrics (e.g. `num_direction_changes`) are sensitive to rounding of small steps.
+TRAJECTORY_DTYPES = {
+    TRACK_ID_COLUMN: np.int32,
+    TIME_COLUMN: np.int32,
+    "x": np.float64,
+    "y": np.float64,
+}
+
+
+def convert_trajectory_csv(csv_filepath, store_directory):
+    """Convert a CSV file of cell trajectories to a columnar store of memory-mappable arrays.
+
+    Each column of the CSV file (other than the track ID) is saved as a separate `.npy` file with
+    rows sorted by track ID and then by time, such that the rows of each track are contiguous.
+    The position of each track within the columns is saved as an offset index, where the rows of
+    the i-th track span `offsets[i]:offsets[i + 1]`.
+
+    Parameters
+    ----------
+    csv_filepath : `pathlib.Path`
+        File path to CSV file of cell trajectories from one well.
+    store_directory : `pathlib.Path`
+        Directory in which to create the store. The store for the well is saved to a subdirectory
+        named after the stem of the CSV file, replacing any previous store of the well.
+
+    Returns
+    -------
+    well_store_directory : `pathlib.Path`
+        Directory of the store for the well.
+    """
+    csv_filepath = Path(csv_filepath)
+    well_store_directory = Path(store_directory) / csv_filepath.stem
+    # start from an empty directory such that no columns of a previous conversion are left behind
+    shutil.rmtree(well_store_directory, ignore_errors=True)
+    well_store_directory.mkdir(parents=True)
+
+    dataframe = pd.read_csv(csv_filepath)
+
+    # sort rows such that each track is contiguous and in chronological order
+    track_ids = dataframe[TRACK_ID_COLUMN].to_numpy()
+    sort_indices = np.lexsort((dataframe[TIME_COLUMN].to_numpy(), track_ids))
+    track_ids = track_ids[sort_indices]
+
+    # offset index of each track
+    unique_track_ids, start_indices = np.unique(track_ids, return_index=True)
+    offsets = np.append(start_indices, track_ids.size).astype(np.int64)
+    np.save(well_store_directory / TRACK_IDS_FILENAME, unique_track_ids)
+    np.save(well_store_directory / OFFSETS_FILENAME, offsets)
+
+    # save each column separately
+    for column in dataframe.columns.drop(TRACK_ID_COLUMN):
+        values = dataframe[column].to_numpy()[sort_indices]
+        np.save(well_store_directory / f"{column}.npy", values)
+
+    return well_store_directory
+
+
+class TrajectoryStore:
+    """Read-only access to the cell trajectories of one well from a columnar store.
+
+    Columns are memory-mapped rather than loaded such that only the slices of the columns that are
+    accessed are read from disk.
+
+    Parameters
+    ----------
+    well_store_directory : `pathlib.Path`
+        Directory of the store for the well as created by `convert_trajectory_csv`.
+    """
+
+    def __init__(self, well_store_directory):
+        self.directory = Path(well_store_directory)
+        if not (self.directory / OFFSETS_FILENAME).exists():
+            msg = f"No trajectory store found in '{self.directory}'."
+            raise FileNotFoundError(msg)
+
+        self.name = self.directory.name
+        self.track_ids = np.load(self.directory / TRACK_IDS_FILENAME)
+        self.offsets = np.load(self.directory / OFFSETS_FILENAME)
+        self._columns = {}
+
+    def __len__(self):
+        return self.track_ids.size
+
+    @property
+    def columns(self):
+        """Names of the columns available in the store."""
+        filenames = {TRACK_IDS_FILENAME, OFFSETS_FILENAME}
+        return sorted(
+            filepath.stem
+            for filepath in self.directory.glob("*.npy")
+            if filepath.name not in filenames
+        )
+
+    def column(self, name):
+        """Return the memory-mapped array of a column across all tracks."""
+        if name not in self._columns:
+            filepath = self.directory / f"{name}.npy"
+            if not filepath.exists():
+                msg = f"Column '{name}' not found in trajectory store '{self.directory}'."
+                raise KeyError(msg)
+            self._columns[name] = np.load(filepath, mmap_mode="r")
+        return self._columns[name]
+
+    def get_track(self, track_id, columns=("t", "x", "y")):
+        """Return the slices of the requested columns belonging to a single track."""
+        (index,) = np.flatnonzero(self.track_ids == track_id)
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return {column: self.column(column)[start:stop] for column in columns}
+
+    def row_track_ids(self):
+        """Return the track ID of every row in the store."""
+        return np.repeat(self.track_ids, np.diff(self.offsets))
+
+    def iter_tracks(self, columns=("t", "x", "y")):
+        """Yield the track ID and column slices of each track in order of track ID."""
+        arrays = [self.column(column) for column in columns]
+        for track_id, start, stop in zip(
+            self.track_ids, self.offsets[:-1], self.offsets[1:], strict=True
+        ):
+            yield (
+                track_id,
+                {column: array[start:stop] for column, array in zip(columns, arrays, strict=True)},
+            )
+
+
+def load_trajectory_columns(trajectory_filepath, columns=("t", "x", "y")):
+    """Load columns of cell trajectory data from either a CSV file or a trajectory store.
+
+    Rows are sorted by track ID and then by time in either case, as is required for computing
+    motility metrics on all tracks at once.
+
+    Parameters
+    ----------
+    trajectory_filepath : `pathlib.Path`
+        File path to a CSV file of cell trajectories or to the store of a well as created by
+        `convert_trajectory_csv`.
+    columns : tuple of str
+        Names of the columns to load.
+
+    Returns
+    -------
+    track_ids : (N,) array
+        Track ID of each row.
+    data : dict
+        Mapping of each column name to an (N,) array. Arrays loaded from a trajectory store are
+        memory-mapped.
+    """
+    trajectory_filepath = Path(trajectory_filepath)
+    if trajectory_filepath.is_dir():
+        store = TrajectoryStore(trajectory_filepath)
+        return store.row_track_ids(), {column: store.column(column) for column in columns}
+
+    usecols = [TRACK_ID_COLUMN, *columns]
+    if TIME_COLUMN not in usecols:
+        usecols.append(TIME_COLUMN)
+    dataframe = pd.read_csv(trajectory_filepath, usecols=usecols)
+    dataframe = dataframe.sort_values([TRACK_ID_COLUMN, TIME_COLUMN], kind="stable")
+    return (
+        dataframe[TRACK_ID_COLUMN].to_numpy(),
+        {column: dataframe[column].to_numpy() for column in columns},
+    )
+
+
+def iter_trajectory_column_chunks(
+    trajectory_filepath, columns=("t", "x", "y"), chunk_size=CHUNK_SIZE
+):
+    """Yield columns of cell trajectory data in chunks of rows from a CSV file or trajectory store.
+
+    Unlike `load_trajectory_columns`, rows are yielded in the order in which they are stored
+    (i.e. not sorted by track ID for CSV files) and only `chunk_size` rows are held in memory at a
+    time, which suffices for statistics that do not depend on which track a row belongs to.
+
+    Yields
+    ------
+    data : dict
+        Mapping of each column name to an array of up to `chunk_size` rows.
+    """
+    trajectory_filepath = Path(trajectory_filepath)
+    if trajectory_filepath.is_dir():
+        store = TrajectoryStore(trajectory_filepath)
+        arrays = {column: store.column(column) for column in columns}
+        num_rows = store.offsets[-1]
+        for start in range(0, num_rows, chunk_size):
+            yield {
+                column: np.asarray(array[start : start + chunk_size])
+                for column, array in arrays.items()
+            }
+        return
+
+    with pd.read_csv(trajectory_filepath, usecols=list(columns), chunksize=chunk_size) as reader:
+        for dataframe in reader:
+            yield {column: dataframe[column].to_numpy() for column in columns}
+
+
+def iter_trajectory_csv_tracks(
+    csv_filepath, columns=("t", "x", "y"), chunk_size=CHUNK_SIZE, dtypes=TRAJECTORY_DTYPES
+):
+    """Yield batches of whole cell trajectories from a CSV file without loading the whole file.
+
+    Only the track ID and the requested columns are parsed (e.g. not the morphology columns),
+    with the dtypes given by `dtypes`, and the file is read `chunk_size` rows at a time.
+    Each chunk is split at the last change of track ID, and the rows of the last track are
+    carried over to the next chunk, such that every track is yielded whole. Peak memory usage is
+    thus bounded by the larger of `chunk_size` and the length of the longest track rather than by
+    the size of the file.
+
+    The rows of each track must be contiguous, with tracks in ascending order of track ID, as in
+    the CSV files written by the cell tracking. Otherwise a ValueError is raised, and the CSV file
+    should be read with `load_trajectory_columns` or converted to a trajectory store instead.
+
+    Yields
+    ------
+    track_ids : (N,) array
+        Track ID of each row in the batch, sorted by track ID and then by time.
+    data : dict
+        Mapping of each column name to an (N,) array.
+    """
+    usecols = [TRACK_ID_COLUMN, *columns]
+    if TIME_COLUMN not in usecols:
+        usecols.append(TIME_COLUMN)
+    dtype = {column: dtypes[column] for column in usecols if column in dtypes}
+
+    carry = None
+    with pd.read_csv(csv_filepath, usecols=usecols, dtype=dtype, chunksize=chunk_size) as reader:
+        for dataframe in reader:
+            track_ids = dataframe[TRACK_ID_COLUMN].to_numpy()
+            previous_track_id = track_ids[0] if carry is None else carry[TRACK_ID_COLUMN].iat[0]
+            if track_ids[0] < previous_track_id or np.any(track_ids[1:] < track_ids[:-1]):
+                msg = (
+                    f"Rows of '{csv_filepath}' are not grouped by track in ascending order of "
+                    "track ID, so it cannot be read in chunks of whole tracks."
+                )
+                raise ValueError(msg)
+            if carry is not None:
+                dataframe = pd.concat([carry, dataframe], ignore_index=True)
+                track_ids = dataframe[TRACK_ID_COLUMN].to_numpy()
+
+            # rows of the last track may continue in the next chunk
+            (track_changes,) = np.nonzero(track_ids[1:] != track_ids[:-1])
+            last_track_start = track_changes[-1] + 1 if track_changes.size else 0
+            carry = dataframe.iloc[last_track_start:]
+            if last_track_start > 0:
+                yield _sort_tracks(dataframe.iloc[:last_track_start], columns)
+
+    if carry is not None and not carry.empty:
+        yield _sort_tracks(carry, columns)
+
+
+def iter_trajectory_csv_batches(csv_filepath, batch_filepath, chunk_size=CHUNK_SIZE):
+    """Split a CSV file of cell trajectories into CSV files of whole tracks without parsing it.
+
+    Unlike `iter_trajectory_csv_tracks`, rows are copied verbatim (only the track ID of each row
+    is read), such that every batch is a CSV file that any parser (e.g. `swimtracker`'s
+    `TrajectoryCSVParser`) reads exactly as it would read the rows in the full file. Rows are
+    collected until a batch holds at least `chunk_size` rows and the next track begins, such that
+    peak memory usage is bounded by the larger of `chunk_size` and the length of the longest track.
+
+    The rows of each track must be contiguous, with tracks in ascending order of track ID, as in
+    the CSV files written by the cell tracking. Otherwise a ValueError is raised.
+
+    Parameters
+    ----------
+    csv_filepath : `pathlib.Path`
+        File path to CSV file of cell trajectories from one well.
+    batch_filepath : `pathlib.Path`
+        File path to which each batch is written, overwriting the previous batch.
+    chunk_size : int
+        Minimum number of rows per batch (other than the last).
+
+    Yields
+    ------
+    batch_filepath : `pathlib.Path`
+        File path of the CSV file holding the header and the rows of the current batch, valid
+        until the next batch is requested.
+    """
+    batch_filepath = Path(batch_filepath)
+    with Path(csv_filepath).open(newline="") as csv_file:
+        header = csv_file.readline()
+        track_id_index = header.rstrip("\r\n").split(",").index(TRACK_ID_COLUMN)
+
+        lines = []
+        previous_track_id = None
+        for line in csv_file:
+            track_id = int(line.split(",", track_id_index + 1)[track_id_index])
+            if track_id != previous_track_id:
+                if previous_track_id is not None and track_id < previous_track_id:
+                    msg = (
+                        f"Rows of '{csv_filepath}' are not grouped by track in ascending order of "
+                        "track ID, so it cannot be split into batches of whole tracks."
+                    )
+                    raise ValueError(msg)
+                if len(lines) >= chunk_size:
+                    _write_csv_lines(batch_filepath, header, lines)
+                    yield batch_filepath
+                    lines = []
+                previous_track_id = track_id
+            lines.append(line)
+
+    if lines:
+        _write_csv_lines(batch_filepath, header, lines)
+        yield batch_filepath
+
+
+def _write_csv_lines(csv_filepath, header, lines):
+    """Write a header and rows of a CSV file, keeping their line endings as they are."""
+    with csv_filepath.open("w", newline="") as csv_file:
+        csv_file.write(header)
+        csv_file.writelines(lines)
+
+
+def _sort_tracks(dataframe, columns):
+    """Sort rows by track ID and then by time, returning the track IDs and requested columns."""
+    dataframe = dataframe.sort_values([TRACK_ID_COLUMN, TIME_COLUMN], kind="stable")
+    return (
+        dataframe[TRACK_ID_COLUMN].to_numpy(),
+        {column: dataframe[column].to_numpy() for column in columns},
+    )
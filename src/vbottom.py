@@ -1,10 +1,161 @@
+import json
 from pathlib import Path
 
 import arcadia_pycolor as apc
 import matplotlib.pyplot as plt
 import numpy as np
-import skimage as ski
 from matplotlib.patches import Rectangle
+from scipy import ndimage
+
+# Tail end of the intensity profile (of length 40) where only motile cells will be
+PERIPHERY_REGION = np.arange(33, 38)
+
+
+def get_well_centers(image_shape, num_rows, num_cols, well_grid=None):
+    """Get the (y, x) center position of each well.
+
+    Wells are assumed to be spaced evenly across the image unless a grid of wells, e.g. as
+    detected by `detect_well_grid`, is given.
+    """
+    if well_grid is not None:
+        check_well_grid(well_grid, image_shape, num_rows, num_cols)
+        return [(int(round(y)), int(round(x))) for y, x in get_well_grid_centers(well_grid)]
+
+    height, width = image_shape
+    row_spacing = height // num_rows
+    col_spacing = width // num_cols
+    well_centers = [
+        (int((row + 0.5) * row_spacing), int((col + 0.5) * col_spacing))
+        for row in range(num_rows)
+        for col in range(num_cols)
+    ]
+    return well_centers
+
+
+def estimate_grid_spacing(projection, num_wells):
+    """Estimate the spacing (in pixels) between wells from the periodicity of a projection.
+
+    The spacing is the lag of the highest peak of the (unbiased) autocorrelation of the projection
+    within 25% of the spacing of wells spread evenly across it, refined to subpixel precision by
+    fitting a parabola through the peak.
+    """
+    length = projection.size
+    even_spacing = length / num_wells
+    deviations = projection - projection.mean()
+    autocorrelation = np.correlate(deviations, deviations, mode="full")[length - 1 :]
+    autocorrelation /= np.arange(length, 0, -1)
+
+    min_lag = max(int(0.75 * even_spacing), 1)
+    max_lag = min(int(np.ceil(1.25 * even_spacing)), length - 2)
+    lag = min_lag + np.argmax(autocorrelation[min_lag : max_lag + 1])
+    before, peak, after = autocorrelation[lag - 1 : lag + 2]
+    curvature = before - 2 * peak + after
+    if curvature >= 0:
+        return float(lag)
+    return lag + 0.5 * (before - after) / curvature
+
+
+def detect_well_grid(image, num_rows, num_cols):
+    """Detect the grid of wells of a v-bottom well plate from an image.
+
+    The spacing between rows (columns) of wells is estimated from the periodicity of the mean
+    intensity of the image along each row (column). The position of the grid is then found by
+    sliding a lattice with these spacings around the position of a grid centered in the image and
+    picking the offset at which the lattice points are darkest in a difference of Gaussians
+    filtered image, i.e. best coincide with the dark pellets of cells at the bottom of the wells.
+    The search is limited to an eighth of the spacing in either direction such that the lattice
+    cannot snap onto the dark rims of the wells.
+
+    Detecting the grid is considerably slower than profiling the wells, so for a time lapse the
+    grid should be detected once, saved with `save_well_grid`, and reused for every frame.
+
+    Parameters
+    ----------
+    image : (H, W) array
+        Image of a v-bottom well plate, cropped to the region spanned by the grid of wells.
+    num_rows, num_cols : int
+        Number of rows and columns of wells in the plate.
+
+    Returns
+    -------
+    well_grid : dict
+        Number of rows and columns of wells, shape of the image, (y, x) center position of the
+        first well ("origin"), and (y, x) spacing between wells.
+    """
+    image = np.asarray(image, dtype=float)
+    height, width = image.shape
+    row_spacing = estimate_grid_spacing(image.mean(axis=1), num_rows)
+    col_spacing = estimate_grid_spacing(image.mean(axis=0), num_cols)
+
+    # Difference of Gaussians to highlight pellet-sized dark blobs
+    sigma = min(row_spacing, col_spacing) / 16
+    blobs = ndimage.gaussian_filter(image, sigma) - ndimage.gaussian_filter(image, 3 * sigma)
+
+    # Mean response at the lattice points for every (y, x) offset from a centered grid
+    centered_origin_y = (height - (num_rows - 1) * row_spacing) / 2
+    centered_origin_x = (width - (num_cols - 1) * col_spacing) / 2
+    search_radius = int(min(row_spacing, col_spacing) / 8)
+    offsets = np.arange(-search_radius, search_radius + 1)
+    lattice_y = centered_origin_y + offsets[:, np.newaxis] + np.arange(num_rows) * row_spacing
+    lattice_x = centered_origin_x + offsets[:, np.newaxis] + np.arange(num_cols) * col_spacing
+    lattice_y = np.clip(np.round(lattice_y).astype(int), 0, height - 1)
+    lattice_x = np.clip(np.round(lattice_x).astype(int), 0, width - 1)
+    scores = blobs[lattice_y[:, np.newaxis, :, np.newaxis], lattice_x[np.newaxis, :, np.newaxis, :]]
+    offset_y, offset_x = np.unravel_index(np.argmin(scores.mean(axis=(2, 3))), scores.shape[:2])
+
+    well_grid = {
+        "num_rows": num_rows,
+        "num_cols": num_cols,
+        "image_shape": [height, width],
+        "origin": [
+            float(centered_origin_y + offsets[offset_y]),
+            float(centered_origin_x + offsets[offset_x]),
+        ],
+        "spacing": [float(row_spacing), float(col_spacing)],
+    }
+    return well_grid
+
+
+def check_well_grid(well_grid, image_shape, num_rows, num_cols):
+    """Check that a grid of wells was detected for images of the given shape and layout."""
+    if (well_grid["num_rows"], well_grid["num_cols"]) != (num_rows, num_cols):
+        msg = (
+            f"Grid of wells has {well_grid['num_rows']} x {well_grid['num_cols']} wells, "
+            f"expected {num_rows} x {num_cols}."
+        )
+        raise ValueError(msg)
+    if tuple(well_grid["image_shape"]) != tuple(image_shape):
+        msg = (
+            f"Grid of wells was detected on images of shape {tuple(well_grid['image_shape'])}, "
+            f"got images of shape {tuple(image_shape)}."
+        )
+        raise ValueError(msg)
+
+
+def get_well_grid_centers(well_grid):
+    """Get the subpixel (y, x) center position of each well of a grid in row-major order."""
+    rows, cols = np.divmod(
+        np.arange(well_grid["num_rows"] * well_grid["num_cols"]), well_grid["num_cols"]
+    )
+    origin = np.array(well_grid["origin"])
+    spacing = np.array(well_grid["spacing"])
+    return origin + np.column_stack([rows, cols]) * spacing
+
+
+def save_well_grid(well_grid, json_filepath):
+    """Save a grid of wells to a JSON file for reuse on later images of the same plate setup."""
+    json_filepath = Path(json_filepath)
+    json_filepath.parent.mkdir(exist_ok=True, parents=True)
+    json_filepath.write_text(json.dumps(well_grid, indent=4))
+
+
+def load_well_grid(json_filepath):
+    """Load a grid of wells saved with `save_well_grid`."""
+    json_filepath = Path(json_filepath)
+    if not json_filepath.exists():
+        msg = f"JSON file of the grid of wells not found: '{json_filepath}'."
+        raise FileNotFoundError(msg)
+    return json.loads(json_filepath.read_text())
 
 
 def get_well_intensity_profiles(
@@ -14,50 +165,122 @@ def get_well_intensity_profiles(
     scan_width=10,
     scan_length=40,
     normalize=True,
+    well_grid=None,
 ):
     """Get intensity profiles from a grid of ROIs."""
-    # Calculate center positions of each well
-    height, width = image.shape
-    row_spacing = height // num_rows
-    col_spacing = width // num_cols
-    well_centers = [
-        (int((row + 0.5) * row_spacing), int((col + 0.5) * col_spacing))
-        for row in range(num_rows)
-        for col in range(num_cols)
+    well_centers, intensity_profiles = get_batched_well_intensity_profiles(
+        image,
+        num_rows,
+        num_cols,
+        scan_width=scan_width,
+        scan_length=scan_length,
+        normalize=normalize,
+        well_grid=well_grid,
+    )
+    return well_centers, list(intensity_profiles)
+
+
+def get_batched_well_intensity_profiles(
+    images,
+    num_rows,
+    num_cols,
+    scan_width=10,
+    scan_length=40,
+    normalize=True,
+    well_grid=None,
+):
+    """Get intensity profiles from a grid of ROIs for a single image or a stack of images.
+
+    Extracts the horizontal scan band through the center of every well of every image at once
+    through fancy indexing, then averages, realigns, and (optionally) normalizes all intensity
+    profiles together. The grid of wells is assumed to be the same for every image in the stack.
+
+    Parameters
+    ----------
+    images : (H, W) or (N, H, W) array
+        Single image or stack of images of a v-bottom well plate.
+    num_rows, num_cols : int
+        Number of rows and columns of wells in the plate.
+    scan_width : int
+        Width (in pixels) of the band over which the intensity is averaged.
+    scan_length : int
+        Length (in pixels) of the intensity profile through each well.
+    normalize : bool
+        Whether to divide each intensity profile by its mean intensity.
+    well_grid : dict or None
+        Grid of wells as returned by `detect_well_grid`. Defaults to wells spaced evenly across
+        the image.
+
+    Returns
+    -------
+    well_centers : list of tuple
+        (y, x) center position of each well.
+    intensity_profiles : (wells, scan_length) or (N, wells, scan_length) array
+        Intensity profile of each well (of each image).
+    """
+    images = np.asarray(images)
+    is_single_image = images.ndim == 2
+    if is_single_image:
+        images = images[np.newaxis]
+    height, width = images.shape[1:]
+    well_centers = get_well_centers((height, width), num_rows, num_cols, well_grid=well_grid)
+    centers_y, centers_x = np.array(well_centers).T
+
+    # Rows and columns of the scan band of each well, clipped to the image boundaries
+    row_offsets = np.arange(-scan_width // 2, scan_width // 2 + 1)
+    col_offsets = np.arange(scan_length)
+    start_x = np.maximum(centers_x - scan_length // 2, 0)
+    rows = np.clip(centers_y[:, np.newaxis] + row_offsets, 0, height - 1)
+    cols = np.clip(start_x[:, np.newaxis] + col_offsets, 0, width - 1)
+
+    # Average the scan band of each well into an (N, wells, scan_length) array of profiles
+    scan_bands = images[:, rows[:, :, np.newaxis], cols[:, np.newaxis, :]]
+    intensity_profiles = scan_bands.mean(axis=2)
+
+    # Realign the line scans by aligning the minimum point within a broader search region (the
+    # middle half of the profile)
+    broader_search_indices = np.arange(scan_length // 4, scan_length - scan_length // 4)
+    min_indices = broader_search_indices[
+        np.argmin(intensity_profiles[..., broader_search_indices], axis=-1)
     ]
+    shifts = (scan_length // 2) - min_indices
+    roll_indices = (col_offsets - shifts[..., np.newaxis]) % scan_length
+    intensity_profiles = np.take_along_axis(intensity_profiles, roll_indices, axis=-1)
 
-    # Store the line scan results
-    intensity_profiles = []
-    # Perform line scans, realign, and (optionally) normalize data
-    for center_y, center_x in well_centers:
-        start_x = max(center_x - scan_length // 2, 0)
-        end_x = min(center_x + scan_length // 2, width - 1)
-
-        # Perform a horizontal line scan across the center with a width of scan_width
-        line_intensities = []
-        for offset in range(-scan_width // 2, scan_width // 2 + 1):
-            rr, cc = ski.draw.line(center_y + offset, start_x, center_y + offset, end_x)
-            line_intensities.append(image[rr, cc])
-
-        # Ensure all scans are of the same length by trimming to scan_length
-        line_intensities = [scan[:scan_length] for scan in line_intensities]
-        # Average each row of the line scan
-        intensity_profile = np.mean(line_intensities, axis=0)
-
-        # Realign the line scan by aligning the minimum point within a broader search region
-        broader_search_indices = np.arange(10, 30)
-        min_index = broader_search_indices[np.argmin(intensity_profile[broader_search_indices])]
-        shift = (scan_length // 2) - min_index
-        intensity_profile = np.roll(intensity_profile, shift)
-
-        # Optionally normalize the line scan by dividing by the average intensity value
-        if normalize:
-            intensity_profile = intensity_profile / intensity_profile.mean()
-
-        intensity_profiles.append(intensity_profile)
+    # Optionally normalize the line scans by dividing by the average intensity value
+    if normalize:
+        intensity_profiles = intensity_profiles / intensity_profiles.mean(axis=-1, keepdims=True)
+
+    if is_single_image:
+        intensity_profiles = intensity_profiles[0]
     return well_centers, intensity_profiles
 
 
+def compute_motility_ratios(intensity_profiles, periphery_region=PERIPHERY_REGION):
+    """Compute the pellet-to-periphery intensity ratio ("motility ratio") of intensity profiles.
+
+    The motility ratio is the minimum intensity of a profile (the pellet of non-motile cells at the
+    bottom of the v-bottom well) divided by its mean intensity over the periphery region (the tail
+    end of the profile where only motile cells will be).
+
+    Parameters
+    ----------
+    intensity_profiles : (..., scan_length) array
+        Intensity profiles, e.g. as returned by `get_batched_well_intensity_profiles`.
+    periphery_region : array of int
+        Indices of the intensity profile that make up the periphery region.
+
+    Returns
+    -------
+    motility_ratios : (...) array
+        Motility ratio of each intensity profile.
+    """
+    intensity_profiles = np.asarray(intensity_profiles)
+    min_pellet_intensities = intensity_profiles.min(axis=-1)
+    mean_periphery_intensities = intensity_profiles[..., periphery_region].mean(axis=-1)
+    return min_pellet_intensities / mean_periphery_intensities
+
+
 def annotate_phenotypeomat_image(
     image,
     well_centers,
@@ -69,8 +292,13 @@ def annotate_phenotypeomat_image(
     savefig_filepath=None,
     mpl_patch_kwargs=None,
     mpl_text_kwargs=None,
+    well_grid=None,
 ):
-    """Annotate each well of the Phenotype-o-mat image using the input well positions and labels."""
+    """Annotate each well of the Phenotype-o-mat image using the input well positions and labels.
+
+    If a grid of wells (as returned by `detect_well_grid`) is given, the boundaries between wells
+    and the detected center of each well are drawn as well.
+    """
     # Create figure
     fig, ax = plt.subplots(figsize=(24, 8))
 
@@ -90,6 +318,17 @@ def annotate_phenotypeomat_image(
             "color": "white",
         }
 
+    # Draw the detected grid of wells
+    if well_grid is not None:
+        origin_y, origin_x = well_grid["origin"]
+        spacing_y, spacing_x = well_grid["spacing"]
+        boundaries_y = origin_y + (np.arange(well_grid["num_rows"] + 1) - 0.5) * spacing_y
+        boundaries_x = origin_x + (np.arange(well_grid["num_cols"] + 1) - 0.5) * spacing_x
+        ax.hlines(boundaries_y, boundaries_x[0], boundaries_x[-1], color="yellow", linewidth=0.5)
+        ax.vlines(boundaries_x, boundaries_y[0], boundaries_y[-1], color="yellow", linewidth=0.5)
+        grid_centers = get_well_grid_centers(well_grid)
+        ax.scatter(grid_centers[:, 1], grid_centers[:, 0], marker="+", color="yellow", s=20)
+
     # Loop through each well
     for well_center, label in zip(well_centers, labels, strict=True):
         # Annotate the region that the intensity was scanned
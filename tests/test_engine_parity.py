@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).parents[1] / "src/scripts"))
+import motility_metrics
+from check_engine_parity import (
+    DEFAULT_INPUT_DIRECTORY,
+    DEFAULT_REFERENCE_CSV_FILE,
+    check_engine_parity,
+)
+
+
+def test_vectorized_engine_matches_published_summary_statistics():
+    """Every metric of the vectorized engine matches the published `swimtracker` results."""
+    reference_dataframe = pd.read_csv(DEFAULT_REFERENCE_CSV_FILE)
+    comparison_dataframe = check_engine_parity(
+        DEFAULT_INPUT_DIRECTORY,
+        reference_dataframe,
+        time_threshold=10.0,
+        distance_threshold=20.0,
+        rtol=1e-6,
+    )
+    assert comparison_dataframe["match"].all(), comparison_dataframe.to_string()
+
+
+def test_vectorized_engine_leaves_turning_metrics_to_swimtracker():
+    """The vectorized engine only computes metrics that it reproduces exactly."""
+    dataframe = motility_metrics.compute_summary_statistics(
+        [1, 1, 1, 2, 2], [0, 1, 2, 0, 1], [0, 1, 2, 0, 0], [0, 0, 1, 0, 1], 14.2, 1.3
+    )
+    assert list(dataframe.columns) == motility_metrics.VECTORIZED_COLUMNS
+    assert not set(dataframe.columns) & set(motility_metrics.TURNING_COLUMNS)
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Add local code to path
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+from synthetic_trajectories import TRAJECTORY_CSV_COLUMNS, write_synthetic_dataset
+from trajectory_store import TrajectoryStore, convert_trajectory_csv, iter_trajectory_csv_batches
+
+
+@pytest.fixture
+def trajectory_csv(tmp_path):
+    """CSV file of synthetic cell trajectories of a single well."""
+    (csv_filepath,) = write_synthetic_dataset(
+        tmp_path / "cell_trajectories", num_wells=1, num_tracks=20, frames_per_track=30, seed=0
+    )
+    return csv_filepath
+
+
+def test_csv_batches_hold_whole_tracks_verbatim(trajectory_csv, tmp_path):
+    """Batches split the file at track boundaries and reassemble to it byte for byte."""
+    header, *lines = trajectory_csv.read_text().splitlines(keepends=True)
+    batches = []
+    for batch_filepath in iter_trajectory_csv_batches(
+        trajectory_csv, tmp_path / "batch.csv", chunk_size=100
+    ):
+        batch_header, *rows = batch_filepath.read_text().splitlines(keepends=True)
+        assert batch_header == header
+        batches.append(rows)
+
+    assert len(batches) > 1
+    assert all(len(rows) >= 100 for rows in batches[:-1])
+    track_ids = [{row.split(",")[0] for row in rows} for rows in batches]
+    for ids, next_ids in zip(track_ids[:-1], track_ids[1:], strict=True):
+        assert not ids & next_ids
+    assert [row for rows in batches for row in rows] == lines
+
+
+def test_csv_batches_require_grouped_tracks(trajectory_csv, tmp_path):
+    """Files whose tracks are not grouped in ascending order of track ID are rejected."""
+    header, *lines = trajectory_csv.read_text().splitlines(keepends=True)
+    trajectory_csv.write_text(header + "".join(reversed(lines)))
+    with pytest.raises(ValueError, match="not grouped by track"):
+        list(iter_trajectory_csv_batches(trajectory_csv, tmp_path / "batch.csv", chunk_size=100))
+
+
+def test_converting_again_replaces_the_store(trajectory_csv, tmp_path):
+    """Columns of a previous conversion of the same well do not survive a new conversion."""
+    well_store_directory = convert_trajectory_csv(trajectory_csv, tmp_path / "store")
+    np.save(well_store_directory / "stale.npy", np.zeros(3))
+
+    well_store_directory = convert_trajectory_csv(trajectory_csv, tmp_path / "store")
+    store = TrajectoryStore(well_store_directory)
+    assert "stale" not in store.columns
+    assert store.columns == sorted(TRAJECTORY_CSV_COLUMNS[1:])